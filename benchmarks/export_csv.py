@@ -0,0 +1,119 @@
+﻿"""
+Сравнение экспорта CSV: старый путь (fetchall -> dict -> DataFrame -> to_csv)
+и потоковый (курсор -> fetchmany -> csv.writer).
+
+Запуск: python benchmarks/export_csv.py --items 200000
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable
+from pathlib import Path
+
+import pandas as pd
+
+from grab.core.db import GrabRepository
+from grab.services.exporter import write_csv_stream
+
+ITEMS_PER_ORDER = 3
+MEDIA_PER_ITEM = 2
+
+
+def seed_database(repository: GrabRepository, items: int) -> None:
+    connection = repository.connection
+    with connection:
+        connection.execute("INSERT INTO stores (code, name) VALUES ('ozon', 'Ozon')")
+        connection.execute(
+            "INSERT INTO accounts (provider, account_identifier) VALUES ('gmail', 'bench@gmail.com')"
+        )
+        orders = (items + ITEMS_PER_ORDER - 1) // ITEMS_PER_ORDER
+        connection.executemany(
+            """
+            INSERT INTO orders (
+                store_id, account_id, external_order_id, dedupe_key, order_datetime,
+                currency, total_amount, status
+            )
+            VALUES (1, 1, ?, ?, ?, 'RUB', ?, 'delivered')
+            """,
+            (
+                (f"ORD-{index}", f"order-{index}", f"2025-{index % 12 + 1:02d}-01T10:00:00+00:00", 1500.0)
+                for index in range(orders)
+            ),
+        )
+        connection.executemany(
+            """
+            INSERT INTO order_items (
+                order_id, dedupe_key, title_full, title_short, quantity,
+                unit_price, total_amount, currency, product_url
+            )
+            VALUES (?, ?, ?, ?, 1, 500.0, 500.0, 'RUB', ?)
+            """,
+            (
+                (
+                    index // ITEMS_PER_ORDER + 1,
+                    f"item-{index}",
+                    f"Товар номер {index} с довольно длинным названием",
+                    f"Товар {index}",
+                    f"https://www.ozon.ru/product/{index}",
+                )
+                for index in range(items)
+            ),
+        )
+        # Медиа вставляются вразнобой, как при реальных sync: строки одной позиции разбросаны по таблице
+        connection.executemany(
+            """
+            INSERT INTO media (related_item_id, source_url, local_path_abs, mime, sha256, size_bytes, source)
+            VALUES (?, ?, ?, 'image/jpeg', ?, 1024, 'bench')
+            """,
+            (
+                (
+                    index // MEDIA_PER_ITEM + 1,
+                    f"https://cdn.example.com/{index}.jpg",
+                    f"D:\\p\\Grab\\data\\media\\ozon\\{index}.jpg",
+                    f"{index:064x}",
+                )
+                for index in random.Random(0).sample(range(items * MEDIA_PER_ITEM), items * MEDIA_PER_ITEM)
+            ),
+        )
+
+
+def pandas_export(repository: GrabRepository, csv_path: Path) -> None:
+    pd.DataFrame(repository.fetch_export_rows()).to_csv(csv_path, index=False, encoding="utf-8-sig")
+
+
+def stream_export(repository: GrabRepository, csv_path: Path) -> None:
+    write_csv_stream(repository, csv_path)
+
+
+def measure(name: str, func: Callable[[GrabRepository, Path], None], repository: GrabRepository, out: Path) -> None:
+    tracemalloc.start()
+    started = time.perf_counter()
+    func(repository, out)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<8} {elapsed:8.2f} s  peak {peak / 1024 / 1024:8.1f} MiB  file {out.stat().st_size / 1024 / 1024:.1f} MiB")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=200_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        with GrabRepository(tmp_dir / "bench.db") as repository:
+            repository.migrate()
+            seed_database(repository, args.items)
+            print(f"items: {args.items}")
+            measure("pandas", pandas_export, repository, tmp_dir / "pandas.csv")
+            measure("stream", stream_export, repository, tmp_dir / "stream.csv")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+﻿"""
+Сравнение экспорта XLSX: старый путь (DataFrame -> pd.ExcelWriter/openpyxl)
+и потоковый (курсор -> openpyxl write-only).
+
+Запуск: python benchmarks/export_xlsx.py --items 100000
+"""
+
+from __future__ import annotations
+
+import argparse
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+from export_csv import measure, seed_database
+
+from grab.core.db import GrabRepository
+from grab.services.exporter import write_xlsx_stream
+
+
+def pandas_export(repository: GrabRepository, xlsx_path: Path) -> None:
+    df = pd.DataFrame(repository.fetch_export_rows())
+    with pd.ExcelWriter(xlsx_path, engine="openpyxl") as writer:
+        df.to_excel(writer, index=False, sheet_name="items")
+
+
+def stream_export(repository: GrabRepository, xlsx_path: Path) -> None:
+    write_xlsx_stream(repository, xlsx_path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=100_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        with GrabRepository(tmp_dir / "bench.db") as repository:
+            repository.migrate()
+            seed_database(repository, args.items)
+            print(f"items: {args.items}")
+            measure("pandas", pandas_export, repository, tmp_dir / "pandas.xlsx")
+            measure("stream", stream_export, repository, tmp_dir / "stream.xlsx")
+
+
+if __name__ == "__main__":
+    main()
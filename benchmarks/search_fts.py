@@ -0,0 +1,108 @@
+﻿"""
+Задержка `grab search` (GrabRepository.search_items) на большой базе: позиции с названиями
+из словаря, несколько магазинов и дат; запросы редкие, частые, префиксные и с фильтрами.
+
+Запуск: python benchmarks/search_fts.py --items 300000
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from grab.core.db import BULK_DB_PROFILE, ExportFilter, GrabRepository
+from grab.core.db.repository import ORDER_ITEM_COLUMNS
+
+ITEMS_PER_ORDER = 5
+STORES = (("ozon", "Ozon"), ("wb", "Wildberries"), ("yamarket", "Яндекс Маркет"), ("dns", "DNS"))
+NOUNS = ("наушники", "чехол", "кабель", "кружка", "пылесос", "фильтр", "лампа", "рюкзак", "зарядка", "футболка")
+ADJECTIVES = ("беспроводные", "черный", "белый", "детский", "кожаный", "складной", "умный", "большой")
+BRANDS = ("Sony", "Xiaomi", "Samsung", "Apple", "Bosch", "Philips", "Baseus", "Ugreen", None)
+QUERIES = (
+    ("редкое слово", "Galaxy Ёлка", None),
+    ("частое слово", "чехол", None),
+    ("два слова", "беспроводные наушники", None),
+    ("префикс", "пылес", None),
+    ("бренд + магазин", "xiaomi", ExportFilter(stores=("wb",))),
+    ("за месяц", "кабель", ExportFilter(since="2026-03-01", until="2026-04-01")),
+)
+RUNS = 20
+
+
+def item(**values: object) -> dict[str, object]:
+    return dict.fromkeys(ORDER_ITEM_COLUMNS) | values
+
+
+def build(repository: GrabRepository, items: int, rng: random.Random) -> None:
+    store_ids = [repository.upsert_store(code, name) for code, name in STORES]
+    for order_index in range(items // ITEMS_PER_ORDER):
+        order_id = repository.upsert_order(
+            store_id=rng.choice(store_ids),
+            account_id=None,
+            seller_id=None,
+            external_order_id=f"O{order_index}",
+            dedupe_key=f"order-{order_index}",
+            order_datetime=f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T10:00:00+00:00",
+            paid_datetime=None,
+            delivered_datetime=None,
+            currency="RUB",
+            subtotal_amount=None,
+            shipping_amount=None,
+            discount_amount=None,
+            total_amount=None,
+            status=None,
+            source_url=None,
+            raw_ref=None,
+        )
+        repository.upsert_order_items_bulk(
+            [
+                item(
+                    order_id=order_id,
+                    dedupe_key=f"item-{order_index}-{item_index}",
+                    title_full=f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {rng.randint(1, 999)}",
+                    brand=rng.choice(BRANDS),
+                    model=f"M{rng.randint(100, 999)}",
+                    quantity=1,
+                    total_amount=float(rng.randint(100, 10_000)),
+                    currency="RUB",
+                )
+                for item_index in range(ITEMS_PER_ORDER)
+            ]
+        )
+    # Одна "иголка" для редкого запроса
+    repository.upsert_order_items_bulk(
+        [item(order_id=1, dedupe_key="needle", title_full="Samsung Galaxy и ёлка", quantity=1)]
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=300_000)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    with tempfile.TemporaryDirectory() as tmp, GrabRepository(Path(tmp) / "search.db", profile=BULK_DB_PROFILE) as repository:
+        repository.migrate()
+        started = time.perf_counter()
+        build(repository, args.items, rng)
+        print(f"items: {args.items}, load + index {time.perf_counter() - started:.1f} s")
+
+        for name, query, export_filter in QUERIES:
+            timings = []
+            for _ in range(RUNS):
+                started = time.perf_counter()
+                rows = repository.search_items(query, export_filter=export_filter, limit=args.limit)
+                timings.append((time.perf_counter() - started) * 1000)
+            print(
+                f"{name:<16} {query!r:<26} found {len(rows):>3}  "
+                f"median {statistics.median(timings):7.1f} ms  max {max(timings):7.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
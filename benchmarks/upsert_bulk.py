@@ -0,0 +1,138 @@
+﻿"""
+Сравнение записи позиций и атрибутов заказа: по одной строке (upsert_order_item /
+upsert_product_attribute, транзакция на строку) и пачкой на заказ (*_bulk, executemany).
+Каждый вариант запускается дважды: первичная вставка и повторный sync тех же данных (ветка ON CONFLICT).
+
+Запуск: python benchmarks/upsert_bulk.py --orders 2000
+"""
+
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+from grab.core.db import BULK_DB_PROFILE, GrabRepository
+
+ITEMS_PER_ORDER = 5
+ATTRIBUTES_PER_ITEM = 4
+
+
+def build_orders(repository: GrabRepository, orders: int) -> list[tuple[list[dict[str, Any]], list[list[dict[str, Any]]]]]:
+    store_id = repository.upsert_store("ozon", "Ozon")
+    batches = []
+    for order_index in range(orders):
+        order_id = repository.upsert_order(
+            store_id=store_id,
+            account_id=None,
+            seller_id=None,
+            external_order_id=f"O{order_index}",
+            dedupe_key=f"order-{order_index}",
+            order_datetime="2026-01-01T10:00:00+00:00",
+            paid_datetime=None,
+            delivered_datetime=None,
+            currency="RUB",
+            subtotal_amount=None,
+            shipping_amount=None,
+            discount_amount=None,
+            total_amount=500.0,
+            status="ok",
+            source_url=None,
+            raw_ref=None,
+        )
+        items = [
+            {
+                "order_id": order_id,
+                "external_item_id": f"I{order_index}-{item_index}",
+                "dedupe_key": f"item-{order_index}-{item_index}",
+                "product_id": None,
+                "title_full": f"Товар {item_index}",
+                "title_short": None,
+                "store_category_path": None,
+                "unified_category_path": None,
+                "brand": "Brand",
+                "model": None,
+                "sku": f"SKU-{item_index}",
+                "quantity": 1,
+                "unit_price": 100.0,
+                "discount_amount": None,
+                "shipping_amount": None,
+                "total_amount": 100.0,
+                "currency": "RUB",
+                "product_url": None,
+                "order_url": None,
+                "receipt_url": None,
+            }
+            for item_index in range(ITEMS_PER_ORDER)
+        ]
+        attributes = [
+            [
+                {
+                    "product_id": None,
+                    "attr_key": f"attr_{attr_index}",
+                    "value_type": "text",
+                    "value_text": f"value {attr_index}",
+                    "value_number": None,
+                    "value_bool": None,
+                    "value_json_raw": None,
+                    "source": "bench",
+                }
+                for attr_index in range(ATTRIBUTES_PER_ITEM)
+            ]
+            for _ in items
+        ]
+        batches.append((items, attributes))
+    return batches
+
+
+def row_by_row(repository: GrabRepository, batches) -> None:  # noqa: ANN001
+    for items, attributes in batches:
+        for item, item_attributes in zip(items, attributes, strict=True):
+            item_id = repository.upsert_order_item(**item)
+            for attribute in item_attributes:
+                repository.upsert_product_attribute(item_id=item_id, **attribute)
+
+
+def bulk(repository: GrabRepository, batches) -> None:  # noqa: ANN001
+    for items, attributes in batches:
+        item_ids = repository.upsert_order_items_bulk(items)
+        repository.upsert_product_attributes_bulk(
+            [
+                {**attribute, "item_id": item_id}
+                for item_id, item_attributes in zip(item_ids, attributes, strict=True)
+                for attribute in item_attributes
+            ]
+        )
+
+
+def measure(name: str, func: Callable[[GrabRepository, Any], None], db_path: Path, orders: int, profile: str) -> None:
+    with GrabRepository(db_path, profile=profile) as repository:
+        repository.migrate()
+        batches = build_orders(repository, orders)
+        timings = []
+        for _ in range(2):
+            started = time.perf_counter()
+            func(repository, batches)
+            timings.append(time.perf_counter() - started)
+    rows = orders * ITEMS_PER_ORDER * (1 + ATTRIBUTES_PER_ITEM)
+    print(f"{name:<10} insert {timings[0]:7.2f} s  re-upsert {timings[1]:7.2f} s  ({rows} rows)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--db-profile", default=BULK_DB_PROFILE)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        print(f"orders: {args.orders}, profile: {args.db_profile}")
+        measure("row", row_by_row, tmp_dir / "row.db", args.orders, args.db_profile)
+        measure("bulk", bulk, tmp_dir / "bulk.db", args.orders, args.db_profile)
+
+
+if __name__ == "__main__":
+    main()
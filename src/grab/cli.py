@@ -3,22 +3,39 @@
 import json
 import subprocess
 import sys
+import time
 import uuid
-from datetime import datetime, timezone
+from contextlib import AbstractContextManager, nullcontext
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
 import typer
 from dateutil import parser as dt_parser
 from rich import print
+from rich.markup import escape
 
 from grab.config import Settings
-from grab.core.db import GrabRepository
+from grab.core.db import BACKUP_STEP_PAGES, ExportFilter, GrabRepository, backup_database
 from grab.core.logging import configure_logging, get_logger
-from grab.services import SyncService, export_data, run_doctor_checks
+from grab.core.media import MediaManager, pillow_available
+from grab.core.profiling import ProfileArtifacts, profile_run
+from grab.services import (
+    MediaFetchService,
+    SyncService,
+    create_snapshot,
+    export_data,
+    export_incremental,
+    run_doctor_checks,
+)
+from grab.services.exporter import pyarrow_available
 from grab.sources.email_gmail import GmailAuthManager
 from grab.sources.email_imap import ImapEmailSource
 
 app = typer.Typer(no_args_is_help=True, help="Grab CLI: сбор и обновление истории покупок")
+media_app = typer.Typer(no_args_is_help=True, help="Обслуживание медиа-хранилища")
+app.add_typer(media_app, name="media")
+db_app = typer.Typer(no_args_is_help=True, help="Резервные копии базы")
+app.add_typer(db_app, name="db")
 
 
 SOURCE_VALUES = [
@@ -42,6 +59,15 @@ def _load_settings(base_dir: Path | None = None) -> Settings:
     return settings
 
 
+def _open_repository(settings: Settings, bulk: bool = False) -> GrabRepository:
+    # Массовая запись (sync, media fetch) — профиль bulk, остальное — безопасный default
+    profile = settings.db_sync_profile if bulk else settings.db_profile
+    try:
+        return GrabRepository(settings.db_path, profile=profile)
+    except ValueError as exc:
+        raise typer.BadParameter(str(exc)) from exc
+
+
 def _parse_since(value: str | None) -> datetime | None:
     if not value:
         return None
@@ -51,12 +77,80 @@ def _parse_since(value: str | None) -> datetime | None:
     return parsed
 
 
+def _split_list(values: list[str] | None) -> tuple[str, ...]:
+    # Повторяемая опция и список через запятую работают одинаково: --store ozon --store wb == --store ozon,wb
+    return tuple(item.strip() for value in values or [] for item in value.split(",") if item.strip())
+
+
+def _parse_month(value: str | None) -> str | None:
+    # Месяцы сравниваются строкой: приводим любую дату к YYYY-MM
+    if not value:
+        return None
+    try:
+        return dt_parser.parse(value).strftime("%Y-%m")
+    except (ValueError, OverflowError) as exc:
+        raise typer.BadParameter(f"Некорректная дата: {value}") from exc
+
+
+def _build_export_filter(
+    stores: list[str] | None,
+    since: str | None,
+    until: str | None,
+    account: str | None,
+    min_amount: float | None,
+    columns: str | None,
+) -> ExportFilter:
+    try:
+        # Границы — даты: since включительно, until включительно (в SQL — строго меньше следующего дня)
+        since_date = dt_parser.parse(since).date() if since else None
+        until_date = dt_parser.parse(until).date() + timedelta(days=1) if until else None
+        return ExportFilter(
+            stores=_split_list(stores),
+            since=since_date.isoformat() if since_date else None,
+            until=until_date.isoformat() if until_date else None,
+            account=account,
+            min_amount=min_amount,
+            columns=_split_list([columns] if columns else None),
+        )
+    except (ValueError, OverflowError) as exc:
+        raise typer.BadParameter(str(exc)) from exc
+
+
+def _format_mib(size_bytes: int) -> str:
+    return f"{size_bytes / (1024 * 1024):.1f} MiB"
+
+
+def _require_database(settings: Settings) -> None:
+    # Без этой проверки connect_db молча создал бы пустую базу и скопировал ее
+    if not settings.db_path.is_file():
+        print(f"[red]База не найдена: {settings.db_path}[/red]")
+        raise typer.Exit(1)
+
+
+def _profiling(
+    enabled: bool,
+    settings: Settings,
+    command: str,
+    correlation_id: str,
+) -> AbstractContextManager[ProfileArtifacts | None]:
+    if not enabled:
+        return nullcontext(None)
+    return profile_run(settings.logs_dir, command=command, correlation_id=correlation_id)
+
+
+def _print_profile(artifacts: ProfileArtifacts | None) -> None:
+    if artifacts is None:
+        return
+    print(f"Профиль: {artifacts.pstats_path}")
+    print(f"Flamegraph (collapsed): {artifacts.collapsed_path}")
+
+
 @app.command("init")
 def init_command(
     base_dir: Path | None = typer.Option(None, help="Корень проекта (по умолчанию текущая папка)"),
 ) -> None:
     settings = _load_settings(base_dir=base_dir)
-    with GrabRepository(settings.db_path) as repository:
+    with _open_repository(settings) as repository:
         executed = repository.migrate()
     print(f"[green]Инициализация завершена[/green]. DB: {settings.db_path}")
     print(f"Миграции: {executed if executed else 'нет новых'}")
@@ -105,11 +199,17 @@ def auth_command(
 def sync_command(
     source: str = typer.Option("all", help=f"Источник: {', '.join(SOURCE_VALUES)}"),
     since: str | None = typer.Option(None, help="Дата/время с которой брать данные"),
-    media: str = typer.Option("download", help="download|skip"),
+    media: str = typer.Option("download", help="download (вложения + очередь ссылок)|skip"),
     max_messages: int | None = typer.Option(
         None,
         help="Макс. писем на источник за один запуск (по умолчанию из GRAB_EMAIL_MAX_MESSAGES)",
     ),
+    profile: bool = typer.Option(False, "--profile", help="Профилировать запуск (.prof + .collapsed в папке логов)"),
+    archive_eml: bool | None = typer.Option(
+        None,
+        "--archive-eml/--no-archive-eml",
+        help="Сохранять исходные письма (.eml.gz) в raw_dir/eml (по умолчанию GRAB_EMAIL_ARCHIVE_EML)",
+    ),
 ) -> None:
     if source not in SOURCE_VALUES:
         raise typer.BadParameter(f"Недопустимый source: {source}")
@@ -121,46 +221,170 @@ def sync_command(
 
     settings = _load_settings()
     max_messages_value = max_messages if max_messages is not None else settings.email_max_messages
+    if archive_eml is not None:
+        settings.email_archive_eml = archive_eml
     configure_logging(settings.logs_dir, correlation_id=correlation_id)
     logger = get_logger("grab.sync", correlation_id)
 
-    with GrabRepository(settings.db_path) as repository:
-        repository.migrate()
-        service = SyncService(settings=settings, repository=repository, logger=logger)
-        stats = service.sync(
-            source=source,
-            since=since_dt,
-            media_download=media == "download",
-            correlation_id=correlation_id,
-            max_messages=max_messages_value,
-        )
+    with _profiling(profile, settings, "sync", correlation_id) as artifacts:
+        with _open_repository(settings, bulk=True) as repository:
+            repository.migrate()
+            service = SyncService(settings=settings, repository=repository, logger=logger)
+            stats = service.sync(
+                source=source,
+                since=since_dt,
+                media_download=media == "download",
+                correlation_id=correlation_id,
+                max_messages=max_messages_value,
+            )
 
     print(f"[green]Sync завершен[/green]. correlation_id={correlation_id}")
     for key, value in stats.items():
         print(f"- {key}: {value}")
+    if stats.get("media_enqueued"):
+        print("Медиа-ссылки поставлены в очередь: запустите `grab media fetch`")
+    _print_profile(artifacts)
 
 
 @app.command("export")
 def export_command(
-    format: str = typer.Option("xlsx,csv", help="Список форматов через запятую: xlsx,csv"),
+    format: str = typer.Option("xlsx,csv", help="Список форматов через запятую: xlsx,csv,parquet"),
     out: Path | None = typer.Option(None, help="Папка экспорта"),
+    profile: bool = typer.Option(False, "--profile", help="Профилировать запуск (.prof + .collapsed в папке логов)"),
+    thumbs: bool = typer.Option(False, "--thumbs", help="Добавить колонку со ссылкой на превью медиа"),
+    incremental: bool = typer.Option(False, "--incremental", help="Только изменения с прошлого экспорта (дельта-файлы)"),
+    compact: bool = typer.Option(False, "--compact", help="Пересобрать полный снимок и удалить дельты"),
+    store: list[str] | None = typer.Option(None, "--store", help="Код магазина (можно повторять или через запятую)"),
+    since: str | None = typer.Option(None, help="Заказы с даты (включительно)"),
+    until: str | None = typer.Option(None, help="Заказы по дату (включительно)"),
+    account: str | None = typer.Option(None, help="Аккаунт: идентификатор (email) или отображаемое имя"),
+    min_amount: float | None = typer.Option(None, help="Минимальная сумма позиции"),
+    columns: str | None = typer.Option(None, help="Колонки через запятую (по умолчанию все)"),
 ) -> None:
     formats = [item.strip().lower() for item in format.split(",") if item.strip()]
-    supported = {"xlsx", "csv"}
+    supported = {"xlsx", "csv", "parquet"}
     unknown = [item for item in formats if item not in supported]
     if unknown:
         raise typer.BadParameter(f"Неподдерживаемые форматы: {unknown}")
+    if "parquet" in formats and not pyarrow_available():
+        raise typer.BadParameter("Для формата parquet нужен pyarrow: pip install -e .[parquet]")
+
+    export_filter = _build_export_filter(store, since, until, account, min_amount, columns)
 
     settings = _load_settings()
     out_dir = (out or settings.exports_dir).resolve()
+    correlation_id = uuid.uuid4().hex
 
-    with GrabRepository(settings.db_path) as repository:
-        repository.migrate()
-        files = export_data(repository=repository, formats=formats, out_dir=out_dir)
+    with _profiling(profile, settings, "export", correlation_id) as artifacts:
+        with _open_repository(settings) as repository:
+            repository.migrate()
+            thumbnails = None
+            if thumbs:
+                manager = MediaManager(
+                    repository=repository,
+                    media_root=settings.media_dir,
+                    thumb_px=settings.media_thumb_px,
+                )
+                thumbnails, _ = manager.generate_thumbnails(workers=settings.media_concurrency)
+            if incremental or compact:
+                files = export_incremental(
+                    repository=repository,
+                    formats=formats,
+                    out_dir=out_dir,
+                    thumbnails=thumbnails,
+                    compact=compact,
+                    export_filter=export_filter,
+                )
+            else:
+                files = export_data(
+                    repository=repository,
+                    formats=formats,
+                    out_dir=out_dir,
+                    thumbnails=thumbnails,
+                    export_filter=export_filter,
+                )
 
-    print("[green]Экспорт завершен[/green]")
+    print(f"[green]Экспорт завершен[/green]. correlation_id={correlation_id}")
+    if (incremental or compact) and not files:
+        print("- изменений с прошлого экспорта нет")
     for file_path in files:
         print(f"- {file_path}")
+    _print_profile(artifacts)
+
+
+@app.command("search")
+def search_command(
+    query: str = typer.Argument(..., help="Слова для поиска (каждое ищется как начало слова)"),
+    store: list[str] | None = typer.Option(None, "--store", help="Код магазина (можно повторять или через запятую)"),
+    since: str | None = typer.Option(None, help="С даты (включительно)"),
+    until: str | None = typer.Option(None, help="По дату (включительно)"),
+    limit: int = typer.Option(20, min=1, help="Сколько результатов показать"),
+    messages: bool = typer.Option(False, "--messages", help="Искать по письмам (тема и текст), а не по позициям"),
+) -> None:
+    if messages and store:
+        raise typer.BadParameter("--store применим только к поиску позиций")
+    search_filter = _build_export_filter(store, since, until, None, None, None)
+
+    settings = _load_settings()
+    with _open_repository(settings) as repository:
+        repository.migrate()
+        started = time.perf_counter()
+        try:
+            if messages:
+                rows = repository.search_messages(
+                    query, since=search_filter.since, until=search_filter.until, limit=limit
+                )
+            else:
+                rows = repository.search_items(query, export_filter=search_filter, limit=limit)
+        except ValueError as exc:
+            raise typer.BadParameter(str(exc)) from exc
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+    for row in rows:
+        date = (row["message_datetime"] if messages else row["order_datetime"]) or "-"
+        if messages:
+            print(f"- {date[:10]} {escape(row['subject'] or '-')} <{escape(row['sender'] or '-')}>")
+            print(f"  {escape(row['snippet'] or '')}")
+        else:
+            details = " / ".join(value for value in (row["brand"], row["model"]) if value)
+            amount = f"{row['total_amount']:g} {row['currency'] or ''}".strip() if row["total_amount"] is not None else "-"
+            store_label = escape(f"[{row['store_code']}]")
+            print(
+                f"- {date[:10]} {store_label} {escape(row['title'] or '-')}"
+                f"{f' ({escape(details)})' if details else ''} — {amount}, заказ {row['external_order_id'] or '-'}"
+            )
+    print(f"[green]Найдено: {len(rows)}[/green] за {elapsed_ms:.1f} мс")
+
+
+@app.command("stats")
+def stats_command(
+    by: str = typer.Option("store", help="Срез: store, month, store-month, account, category, currency"),
+    since: str | None = typer.Option(None, help="С месяца YYYY-MM (включительно)"),
+    until: str | None = typer.Option(None, help="По месяц YYYY-MM (включительно)"),
+    limit: int | None = typer.Option(None, min=1, help="Сколько строк показать"),
+    rebuild: bool = typer.Option(False, "--rebuild", help="Пересчитать сводки из позиций перед выводом"),
+) -> None:
+    since_month = _parse_month(since)
+    until_month = _parse_month(until)
+
+    settings = _load_settings()
+    with _open_repository(settings) as repository:
+        repository.migrate()
+        if rebuild:
+            repository.rebuild_spend_aggregates()
+        try:
+            rows = repository.spend_stats(by, since_month=since_month, until_month=until_month, limit=limit)
+        except ValueError as exc:
+            raise typer.BadParameter(str(exc)) from exc
+
+    print(f"Траты ({by}):")
+    for row in rows:
+        print(
+            f"- {escape(row['label'] or '-')}: {row['spend']:,.2f} {row['currency'] or ''}".rstrip()
+            + f" ({row['items_count']} поз.)"
+        )
+    if not rows:
+        print("- данных нет")
 
 
 @app.command("doctor")
@@ -177,7 +401,7 @@ def doctor_command() -> None:
 @app.command("dedupe")
 def dedupe_command() -> None:
     settings = _load_settings()
-    with GrabRepository(settings.db_path) as repository:
+    with _open_repository(settings) as repository:
         repository.migrate()
         diagnostics = repository.duplicate_diagnostics()
 
@@ -186,6 +410,183 @@ def dedupe_command() -> None:
     print(f"- items: {len(diagnostics['items'])}")
 
 
+@media_app.command("fetch")
+def media_fetch_command(
+    max_jobs: int | None = typer.Option(None, help="Макс. задач за запуск (по умолчанию все созревшие)"),
+    rate: float | None = typer.Option(None, help="Лимит запросов в секунду (по умолчанию GRAB_MEDIA_RATE_LIMIT)"),
+    concurrency: int | None = typer.Option(None, help="Потоков скачивания (по умолчанию GRAB_MEDIA_CONCURRENCY)"),
+) -> None:
+    correlation_id = uuid.uuid4().hex
+    settings = _load_settings()
+    configure_logging(settings.logs_dir, correlation_id=correlation_id)
+    logger = get_logger("grab.media", correlation_id)
+
+    with _open_repository(settings, bulk=True) as repository:
+        repository.migrate()
+        service = MediaFetchService(
+            settings=settings,
+            repository=repository,
+            logger=logger,
+            rate_limit_per_sec=rate,
+            concurrency=concurrency,
+        )
+        stats = service.run(max_jobs=max_jobs)
+        queue = repository.media_job_counts()
+
+    print(f"[green]Media fetch завершен[/green]. correlation_id={correlation_id}")
+    for key, value in stats.items():
+        print(f"- {key}: {value}")
+    print(f"- очередь: {queue}")
+
+
+@media_app.command("export-meta")
+def media_export_meta_command() -> None:
+    settings = _load_settings()
+    with _open_repository(settings) as repository:
+        repository.migrate()
+        manager = MediaManager(repository=repository, media_root=settings.media_dir)
+        written = manager.export_meta_files()
+
+    print(f"[green]meta.json пересобраны из БД[/green]: {written}")
+
+
+@media_app.command("gc")
+def media_gc_command(
+    dry_run: bool = typer.Option(False, "--dry-run", help="Только показать, что будет удалено"),
+    workers: int = typer.Option(8, help="Параллельных потоков сканирования"),
+    min_age_hours: float = typer.Option(1.0, help="Не трогать blob-ы моложе N часов (идущий sync)"),
+) -> None:
+    settings = _load_settings()
+    with _open_repository(settings) as repository:
+        repository.migrate()
+        manager = MediaManager(repository=repository, media_root=settings.media_dir)
+        stats = manager.collect_garbage(workers=workers, min_age_sec=min_age_hours * 3600, dry_run=dry_run)
+
+    title = "GC (dry-run)" if dry_run else "GC завершен"
+    print(f"[green]{title}[/green]")
+    print(f"- blobs просмотрено: {stats.scanned}")
+    print(f"- blobs без ссылок: {stats.removed}")
+    print(f"- освобождено байт: {stats.freed_bytes}")
+
+
+@media_app.command("thumbs")
+def media_thumbs_command(
+    workers: int = typer.Option(4, help="Параллельных потоков рендера"),
+    size: int | None = typer.Option(None, help="Размер превью, px (по умолчанию GRAB_MEDIA_THUMB_PX)"),
+) -> None:
+    settings = _load_settings()
+    if not pillow_available():
+        print("[yellow]Pillow не установлен: превью картинок пропущены (pip install -e .[thumbs])[/yellow]")
+    with _open_repository(settings) as repository:
+        repository.migrate()
+        manager = MediaManager(
+            repository=repository,
+            media_root=settings.media_dir,
+            thumb_px=size or settings.media_thumb_px,
+        )
+        if manager.thumbnails.ffmpeg_path is None:
+            print("[yellow]ffmpeg не найден в PATH: постеры для видео пропущены[/yellow]")
+        item_thumbs, stats = manager.generate_thumbnails(workers=workers)
+
+    print("[green]Превью готовы[/green]")
+    print(f"- позиций с превью: {len(item_thumbs)}")
+    print(f"- создано: {stats.generated}")
+    print(f"- из кэша: {stats.cached}")
+    print(f"- пропущено: {stats.skipped}")
+    print(f"- ошибок: {stats.failed}")
+
+
+@media_app.command("dupes")
+def media_dupes_command(
+    distance: int = typer.Option(6, help="Максимум различающихся бит dHash (из 64)"),
+    workers: int = typer.Option(4, help="Параллельных потоков хэширования"),
+    consolidate: bool = typer.Option(False, "--consolidate", help="Перевесить дубликаты на лучшую копию"),
+) -> None:
+    if not pillow_available():
+        print("[red]Для поиска похожих картинок нужен Pillow: pip install -e .[thumbs][/red]")
+        raise typer.Exit(1)
+    settings = _load_settings()
+    with _open_repository(settings) as repository:
+        repository.migrate()
+        manager = MediaManager(repository=repository, media_root=settings.media_dir)
+        groups = manager.find_near_duplicates(max_distance=distance, workers=workers)
+        for group in groups:
+            rows = repository.list_media_by_sha256(group.canonical)
+            sample = rows[0]["local_path_abs"] if rows else "-"
+            print(f"- {group.canonical[:12]} (+{len(group.duplicates)} похожих): {sample}")
+        moved = manager.consolidate_duplicates(groups) if consolidate else 0
+
+    print(f"[green]Групп похожих картинок: {len(groups)}[/green]")
+    if consolidate:
+        print(f"- перевешено записей media: {moved}")
+        print("Освободить место: grab media gc")
+
+
+@media_app.command("verify")
+def media_verify_command(
+    workers: int = typer.Option(4, help="Параллельных потоков хэширования"),
+    recheck_hours: float = typer.Option(24.0, help="Пропускать файлы, проверенные за последние N часов"),
+    repair: bool = typer.Option(True, "--repair/--no-repair", help="Восстанавливать битые файлы"),
+) -> None:
+    settings = _load_settings()
+    with _open_repository(settings) as repository:
+        repository.migrate()
+        manager = MediaManager(repository=repository, media_root=settings.media_dir)
+        stats = manager.verify_media(workers=workers, recheck_after_sec=recheck_hours * 3600, repair=repair)
+
+    print("[green]Проверка медиа завершена[/green]")
+    print(f"- проверено: {stats.checked}")
+    print(f"- в порядке: {stats.ok}")
+    print(f"- восстановлено из копий: {stats.repaired}")
+    print(f"- поставлено на повторное скачивание: {stats.requeued}")
+    print(f"- отсутствуют: {stats.missing}")
+    print(f"- повреждены: {stats.corrupt}")
+    if stats.requeued:
+        print("Скачать заново: grab media fetch")
+
+
+@db_app.command("backup")
+def db_backup_command(
+    out: Path | None = typer.Option(None, help="Файл копии (по умолчанию <backups>/grab-<время>.sqlite3)"),
+    step_pages: int = typer.Option(BACKUP_STEP_PAGES, min=1, help="Страниц за один шаг backup API"),
+) -> None:
+    settings = _load_settings()
+    _require_database(settings)
+    target = (out or settings.backups_dir / f"grab-{datetime.now(timezone.utc):%Y%m%d-%H%M%S}.sqlite3").resolve()
+    result = backup_database(settings.db_path, target, step_pages=step_pages)
+
+    print(f"[green]Копия базы готова[/green]: {result.path}")
+    print(f"- размер: {_format_mib(result.size_bytes)} ({result.page_count} страниц)")
+    print(f"- время: {result.elapsed_sec:.2f} с")
+    if result.restarts:
+        print(f"- перезапусков из-за записи в базу: {result.restarts}")
+
+
+@db_app.command("snapshot")
+def db_snapshot_command(
+    out: Path | None = typer.Option(None, help="Папка снимков (по умолчанию GRAB_BACKUP_DIR)"),
+    media: bool = typer.Option(True, "--media/--no-media", help="Записать манифест медиа-дерева"),
+    step_pages: int = typer.Option(BACKUP_STEP_PAGES, min=1, help="Страниц за один шаг backup API"),
+) -> None:
+    settings = _load_settings()
+    _require_database(settings)
+    result = create_snapshot(
+        settings.db_path,
+        settings.media_dir,
+        (out or settings.backups_dir).resolve(),
+        include_media=media,
+        step_pages=step_pages,
+    )
+
+    print(f"[green]Снимок готов[/green]: {result.directory}")
+    print(f"- база: {result.database_path.name}, {_format_mib(result.database_bytes)} -> {_format_mib(result.compressed_bytes)}")
+    print(f"- манифест: {result.manifest_path.name}")
+    if result.media_manifest_path is not None:
+        print(f"- медиа: {result.media_files} файлов в {result.media_manifest_path.name}")
+        if result.missing_blobs:
+            print(f"[yellow]- нет на диске blob-ов из БД: {result.missing_blobs} (см. manifest.json)[/yellow]")
+
+
 @app.command("tests")
 def tests_command() -> None:
     result = subprocess.run([sys.executable, "-m", "pytest", "-q"], check=False)
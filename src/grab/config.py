@@ -43,16 +43,28 @@ class Settings:
     logs_dir: Path
     raw_dir: Path
     exports_dir: Path
+    backups_dir: Path
     gmail_client_secret_path: Path
     gmail_token_path: Path
     gmail_account: str | None
     email_keywords: list[str] = field(default_factory=lambda: DEFAULT_EMAIL_KEYWORDS.copy())
     imap_accounts: list[ImapAccountConfig] = field(default_factory=list)
     email_max_messages: int = 200
+    email_archive_eml: bool = False
     imap_retry_attempts: int = 2
     imap_retry_delay_sec: float = 2.0
     media_timeout_sec: int = 30
     media_retries: int = 2
+    media_concurrency: int = 8
+    media_per_host_concurrency: int = 2
+    media_url_cache_ttl_sec: int = 7 * 24 * 3600
+    media_rate_limit_per_sec: float = 0.0
+    media_job_max_attempts: int = 5
+    media_job_retry_base_sec: float = 60.0
+    media_job_lease_sec: int = 1800
+    media_thumb_px: int = 256
+    db_profile: str = "default"
+    db_sync_profile: str = "bulk"
 
     @classmethod
     def load(cls, base_dir: Path | None = None) -> Settings:
@@ -67,6 +79,7 @@ class Settings:
         logs_dir = Path(os.getenv("GRAB_LOG_DIR", root_dir / "logs")).expanduser().resolve()
         raw_dir = Path(os.getenv("GRAB_RAW_DIR", data_dir / "raw")).expanduser().resolve()
         exports_dir = Path(os.getenv("GRAB_EXPORT_DIR", root_dir / "exports")).expanduser().resolve()
+        backups_dir = Path(os.getenv("GRAB_BACKUP_DIR", root_dir / "backups")).expanduser().resolve()
 
         gmail_client_secret_path = Path(
             os.getenv("GMAIL_OAUTH_CLIENT_SECRET_PATH", root_dir / "secrets" / "gmail_client_secret.json")
@@ -101,10 +114,21 @@ class Settings:
         )
 
         email_max_messages = int(os.getenv("GRAB_EMAIL_MAX_MESSAGES", "200"))
+        email_archive_eml = os.getenv("GRAB_EMAIL_ARCHIVE_EML", "0").strip().lower() in {"1", "true", "yes", "on"}
         imap_retry_attempts = int(os.getenv("GRAB_IMAP_RETRY_ATTEMPTS", "2"))
         imap_retry_delay_sec = float(os.getenv("GRAB_IMAP_RETRY_DELAY_SEC", "2"))
         media_timeout_sec = int(os.getenv("GRAB_MEDIA_TIMEOUT_SEC", "30"))
         media_retries = int(os.getenv("GRAB_MEDIA_RETRIES", "2"))
+        media_concurrency = int(os.getenv("GRAB_MEDIA_CONCURRENCY", "8"))
+        media_per_host_concurrency = int(os.getenv("GRAB_MEDIA_PER_HOST_CONCURRENCY", "2"))
+        media_url_cache_ttl_sec = int(os.getenv("GRAB_MEDIA_URL_CACHE_TTL_SEC", str(7 * 24 * 3600)))
+        media_rate_limit_per_sec = float(os.getenv("GRAB_MEDIA_RATE_LIMIT", "0"))
+        media_job_max_attempts = int(os.getenv("GRAB_MEDIA_JOB_MAX_ATTEMPTS", "5"))
+        media_job_retry_base_sec = float(os.getenv("GRAB_MEDIA_JOB_RETRY_BASE_SEC", "60"))
+        media_job_lease_sec = int(os.getenv("GRAB_MEDIA_JOB_LEASE_SEC", "1800"))
+        media_thumb_px = int(os.getenv("GRAB_MEDIA_THUMB_PX", "256"))
+        db_profile = os.getenv("GRAB_DB_PROFILE", "default")
+        db_sync_profile = os.getenv("GRAB_DB_SYNC_PROFILE", "bulk")
 
         return cls(
             root_dir=root_dir,
@@ -114,16 +138,28 @@ class Settings:
             logs_dir=logs_dir,
             raw_dir=raw_dir,
             exports_dir=exports_dir,
+            backups_dir=backups_dir,
             gmail_client_secret_path=gmail_client_secret_path,
             gmail_token_path=gmail_token_path,
             gmail_account=gmail_account,
             email_keywords=email_keywords,
             imap_accounts=imap_accounts,
             email_max_messages=email_max_messages,
+            email_archive_eml=email_archive_eml,
             imap_retry_attempts=imap_retry_attempts,
             imap_retry_delay_sec=imap_retry_delay_sec,
             media_timeout_sec=media_timeout_sec,
             media_retries=media_retries,
+            media_concurrency=media_concurrency,
+            media_per_host_concurrency=media_per_host_concurrency,
+            media_url_cache_ttl_sec=media_url_cache_ttl_sec,
+            media_rate_limit_per_sec=media_rate_limit_per_sec,
+            media_job_max_attempts=media_job_max_attempts,
+            media_job_retry_base_sec=media_job_retry_base_sec,
+            media_job_lease_sec=media_job_lease_sec,
+            media_thumb_px=media_thumb_px,
+            db_profile=db_profile,
+            db_sync_profile=db_sync_profile,
         )
 
     @staticmethod
@@ -170,6 +206,14 @@ class Settings:
         return accounts
 
     def ensure_directories(self) -> None:
-        for path in [self.root_dir, self.data_dir, self.media_dir, self.logs_dir, self.raw_dir, self.exports_dir]:
+        for path in [
+            self.root_dir,
+            self.data_dir,
+            self.media_dir,
+            self.logs_dir,
+            self.raw_dir,
+            self.exports_dir,
+            self.backups_dir,
+        ]:
             path.mkdir(parents=True, exist_ok=True)
         self.gmail_token_path.parent.mkdir(parents=True, exist_ok=True)
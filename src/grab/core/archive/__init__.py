@@ -0,0 +1,3 @@
+﻿from .eml import EML_DIR_NAME, EmlArchive
+
+__all__ = ["EML_DIR_NAME", "EmlArchive"]
@@ -0,0 +1,53 @@
+﻿from __future__ import annotations
+
+import email
+import gzip
+import hashlib
+import os
+import tempfile
+from email import policy
+from email.message import EmailMessage
+from pathlib import Path
+
+EML_DIR_NAME = "eml"
+EML_SUFFIX = ".eml.gz"
+# Письма — текст с base64-вложениями: средний уровень gzip почти не уступает 9-му и заметно быстрее
+GZIP_LEVEL = 6
+
+
+class EmlArchive:
+    """
+    Контентно-адресуемый архив исходных писем (RFC822) в `<root>/<sha[:2]>/<sha[2:4]>/<sha>.eml.gz`.
+    sha256 считается по несжатым байтам, поэтому одно письмо из двух ящиков лежит один раз.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def path_for(self, sha256_value: str) -> Path:
+        return self.root / sha256_value[:2] / sha256_value[2:4] / f"{sha256_value}{EML_SUFFIX}"
+
+    def put(self, raw: bytes) -> Path:
+        target = self.path_for(hashlib.sha256(raw).hexdigest())
+        if target.exists():
+            return target
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # Пишем во временный файл рядом и переименовываем: недописанный архив не появится под итоговым именем
+        fd, tmp_name = tempfile.mkstemp(dir=target.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fh, gzip.GzipFile(fileobj=fh, mode="wb", compresslevel=GZIP_LEVEL, mtime=0) as gz:
+                gz.write(raw)
+            os.replace(tmp_name, target)
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+        return target
+
+    @staticmethod
+    def read(path: Path) -> bytes:
+        with gzip.open(path, "rb") as fh:
+            return fh.read()
+
+    def read_message(self, path: Path) -> EmailMessage:
+        # Исходная MIME-структура для повторного разбора без сети
+        return email.message_from_bytes(self.read(path), policy=policy.default)
@@ -1,4 +1,27 @@
-﻿from .migrations import apply_migrations, connect_db
-from .repository import GrabRepository
+﻿from .backup import BACKUP_STEP_PAGES, BackupResult, backup_database
+from .migrations import (
+    BULK_DB_PROFILE,
+    DB_PROFILES,
+    DEFAULT_DB_PROFILE,
+    DbProfile,
+    apply_migrations,
+    connect_db,
+    read_pragmas,
+)
+from .repository import EXPORT_COLUMNS, ExportFilter, GrabRepository
 
-__all__ = ["connect_db", "apply_migrations", "GrabRepository"]
+__all__ = [
+    "connect_db",
+    "apply_migrations",
+    "read_pragmas",
+    "DbProfile",
+    "DB_PROFILES",
+    "DEFAULT_DB_PROFILE",
+    "BULK_DB_PROFILE",
+    "EXPORT_COLUMNS",
+    "ExportFilter",
+    "GrabRepository",
+    "BACKUP_STEP_PAGES",
+    "BackupResult",
+    "backup_database",
+]
@@ -0,0 +1,128 @@
+﻿from __future__ import annotations
+
+from dataclasses import dataclass
+
+# Выражения над позицией {i} и ее заказом {o}; в триггерах вместо алиасов подставляются NEW/OLD.
+# Суммы хранятся в копейках (INTEGER): прибавление и вычитание дельт не копят ошибку округления REAL.
+SPEND_AMOUNT_SQL = "CAST(round(COALESCE({i}.total_amount, {i}.unit_price * {i}.quantity, 0) * 100) AS INTEGER)"
+SPEND_KEY_SQL = {
+    "store_id": "{o}.store_id",
+    "month": "COALESCE(substr(COALESCE({o}.order_datetime, {o}.created_at), 1, 7), '')",
+    "account_id": "COALESCE({o}.account_id, 0)",
+    "category": "COALESCE({i}.unified_category_path, {i}.store_category_path, '')",
+    "currency": "COALESCE({i}.currency, {o}.currency, '')",
+}
+# Поля, от которых зависят ключи и сумма: триггеры UPDATE срабатывают только при их изменении
+SPEND_ITEM_FIELDS = (
+    "order_id",
+    "total_amount",
+    "unit_price",
+    "quantity",
+    "currency",
+    "unified_category_path",
+    "store_category_path",
+)
+SPEND_ORDER_FIELDS = ("store_id", "account_id", "order_datetime", "created_at", "currency")
+
+
+@dataclass(frozen=True, slots=True)
+class SpendTable:
+    name: str
+    keys: tuple[str, ...]
+
+
+SPEND_TABLES = (
+    SpendTable("spend_by_store_month", ("store_id", "month", "currency")),
+    SpendTable("spend_by_account", ("account_id", "currency")),
+    SpendTable("spend_by_category", ("category", "currency")),
+    SpendTable("spend_by_currency", ("currency",)),
+)
+
+
+def create_table_sql(table: SpendTable) -> str:
+    key_columns = ", ".join(f"{key} {'INTEGER' if key.endswith('_id') else 'TEXT'} NOT NULL" for key in table.keys)
+    return f"""
+        CREATE TABLE IF NOT EXISTS {table.name} (
+            {key_columns},
+            items_count INTEGER NOT NULL,
+            spend_minor INTEGER NOT NULL,
+            PRIMARY KEY ({", ".join(table.keys)})
+        ) WITHOUT ROWID"""
+
+
+def delta_sql(table: SpendTable, item: str, order: str, source_sql: str, sign: int) -> str:
+    """
+    Прибавляет (sign=1) или вычитает (sign=-1) вклад позиций из source_sql.
+    GROUP BY нужен и для одной строки: на пустом источнике он не дает строку с нулями.
+    """
+    keys_sql = ", ".join(SPEND_KEY_SQL[key].format(i=item, o=order) for key in table.keys)
+    amount_sql = SPEND_AMOUNT_SQL.format(i=item)
+    return f"""
+        INSERT INTO {table.name} ({", ".join(table.keys)}, items_count, spend_minor)
+        SELECT {keys_sql}, {sign} * COUNT(*), {sign} * SUM({amount_sql})
+        {source_sql}
+        GROUP BY {keys_sql}
+        ON CONFLICT ({", ".join(table.keys)}) DO UPDATE SET
+            items_count = items_count + excluded.items_count,
+            spend_minor = spend_minor + excluded.spend_minor;"""
+
+
+def _changed(row_fields: tuple[str, ...]) -> str:
+    return " OR ".join(f"NEW.{field} IS NOT OLD.{field}" for field in row_fields)
+
+
+def _trigger(name: str, event: str, body: list[str], when: str | None = None) -> str:
+    when_sql = f"\n        WHEN {when}" if when else ""
+    return f"CREATE TRIGGER IF NOT EXISTS {name} {event}{when_sql}\n        BEGIN{''.join(body)}\n        END"
+
+
+def spend_trigger_sql() -> list[str]:
+    def item_delta(row: str, sign: int) -> list[str]:
+        # Заказ ищем join-ом: при каскадном удалении заказа его строки уже нет,
+        # и вклад позиций снимает триггер spend_orders_bd, а здесь источник пуст
+        source = f"FROM orders o WHERE o.id = {row}.order_id"
+        return [delta_sql(table, row, "o", source, sign) for table in SPEND_TABLES]
+
+    def order_delta(row: str, sign: int) -> list[str]:
+        source = f"FROM order_items i WHERE i.order_id = {row}.id"
+        return [delta_sql(table, "i", row, source, sign) for table in SPEND_TABLES]
+
+    triggers = [
+        _trigger("spend_order_items_ai", "AFTER INSERT ON order_items", item_delta("NEW", 1)),
+        _trigger(
+            "spend_order_items_au",
+            "AFTER UPDATE ON order_items",
+            item_delta("OLD", -1) + item_delta("NEW", 1),
+            when=_changed(SPEND_ITEM_FIELDS),
+        ),
+        _trigger("spend_order_items_ad", "AFTER DELETE ON order_items", item_delta("OLD", -1)),
+        _trigger(
+            "spend_orders_au",
+            "AFTER UPDATE ON orders",
+            order_delta("OLD", -1) + order_delta("NEW", 1),
+            when=_changed(SPEND_ORDER_FIELDS),
+        ),
+        _trigger("spend_orders_bd", "BEFORE DELETE ON orders", order_delta("OLD", -1)),
+    ]
+    # Обнулившиеся группы удаляем, чтобы сводные таблицы не копили пустые строки
+    for table in SPEND_TABLES:
+        match_sql = " AND ".join(f"{key} = NEW.{key}" for key in table.keys)
+        triggers.append(
+            _trigger(
+                f"{table.name}_au",
+                f"AFTER UPDATE ON {table.name}",
+                [f"\n            DELETE FROM {table.name} WHERE {match_sql};"],
+                when="NEW.items_count = 0",
+            )
+        )
+    return triggers
+
+
+def rebuild_sql() -> list[str]:
+    # Полный пересчет одним GROUP BY: заполнение при миграции и сверка/починка через grab stats --rebuild
+    source = "FROM order_items i JOIN orders o ON o.id = i.order_id WHERE true"
+    statements: list[str] = []
+    for table in SPEND_TABLES:
+        statements.append(f"DELETE FROM {table.name}")
+        statements.append(delta_sql(table, "i", "o", source, 1))
+    return statements
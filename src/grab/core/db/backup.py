@@ -0,0 +1,89 @@
+﻿from __future__ import annotations
+
+import os
+import sqlite3
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+
+from .migrations import DEFAULT_DB_PROFILE, connect_db
+
+# Страниц за шаг sqlite3_backup_step: между шагами блокировка источника отпускается
+BACKUP_STEP_PAGES = 1024
+
+
+@dataclass(slots=True)
+class BackupResult:
+    path: Path
+    page_count: int
+    size_bytes: int
+    elapsed_sec: float
+    restarts: int
+
+
+def backup_database(
+    db_path: Path,
+    target_path: Path,
+    *,
+    step_pages: int = BACKUP_STEP_PAGES,
+    progress: Callable[[int, int], None] | None = None,
+) -> BackupResult:
+    """
+    Онлайн-копия базы через sqlite3 backup API, шагами по step_pages страниц.
+    В WAL на источнике держится одна читающая транзакция: копия соответствует одному
+    снимку, писатели (sync) не блокируются, а бэкап не перезапускается от их коммитов.
+    Копия — самостоятельный файл (journal_mode=DELETE, без -wal/-shm), проверенный quick_check;
+    под итоговым именем появляется только после успешной проверки.
+    progress(скопировано, всего) вызывается после каждого шага.
+    """
+    target_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = target_path.with_name(f"{target_path.name}.tmp")
+    tmp_path.unlink(missing_ok=True)
+
+    started = time.perf_counter()
+    remaining_seen: list[int] = []
+
+    def on_step(status: int, remaining: int, total: int) -> None:
+        remaining_seen.append(remaining)
+        if progress is not None:
+            progress(total - remaining, total)
+
+    source = connect_db(db_path, profile=DEFAULT_DB_PROFILE)
+    try:
+        target = sqlite3.connect(str(tmp_path))
+        try:
+            wal = source.execute("PRAGMA journal_mode").fetchone()[0].lower() == "wal"
+            if wal:
+                # Чтение фиксирует снимок WAL до конца копирования; в rollback-журнале так делать нельзя:
+                # shared-блокировка на все время копии остановила бы запись
+                source.execute("BEGIN")
+                source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+            try:
+                source.backup(target, pages=max(1, step_pages), progress=on_step)
+            finally:
+                if wal:
+                    source.rollback()
+            target.execute("PRAGMA journal_mode = DELETE")
+            check = target.execute("PRAGMA quick_check").fetchone()[0]
+            if check != "ok":
+                raise sqlite3.DatabaseError(f"Копия базы не прошла quick_check: {check}")
+            page_count = int(target.execute("PRAGMA page_count").fetchone()[0])
+        finally:
+            target.close()
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    finally:
+        source.close()
+
+    os.replace(tmp_path, target_path)
+    # Рост "осталось страниц" между шагами — перезапуск копии из-за записи в источник
+    restarts = sum(1 for before, after in zip(remaining_seen, remaining_seen[1:], strict=False) if after > before)
+    return BackupResult(
+        path=target_path,
+        page_count=page_count,
+        size_bytes=target_path.stat().st_size,
+        elapsed_sec=time.perf_counter() - started,
+        restarts=restarts,
+    )
@@ -0,0 +1,66 @@
+﻿from __future__ import annotations
+
+import zlib
+from types import ModuleType
+
+# Первый байт сжатого тела — кодек, дальше полезная нагрузка
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+CODEC_NAMES = {CODEC_NONE: "none", CODEC_ZLIB: "zlib", CODEC_ZSTD: "zstd"}
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 9
+# Короткие тела не сжимаем: заголовок и словарь съедят выигрыш
+MIN_COMPRESS_BYTES = 128
+
+
+def load_zstandard() -> ModuleType | None:
+    # zstandard — необязательная зависимость (pip install -e .[zstd]), без нее пишем zlib
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def default_codec() -> int:
+    return CODEC_ZSTD if load_zstandard() is not None else CODEC_ZLIB
+
+
+def encode_body(value: str | None, codec: int | None = None) -> bytes | None:
+    if value is None:
+        return None
+    data = value.encode("utf-8")
+    codec = default_codec() if codec is None else codec
+    if codec == CODEC_NONE or len(data) < MIN_COMPRESS_BYTES:
+        return bytes([CODEC_NONE]) + data
+    if codec == CODEC_ZLIB:
+        payload = zlib.compress(data, ZLIB_LEVEL)
+    elif codec == CODEC_ZSTD:
+        zstandard = load_zstandard()
+        if zstandard is None:
+            raise RuntimeError("Для кодека zstd нужен zstandard: pip install -e .[zstd]")
+        payload = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    else:
+        raise ValueError(f"Неизвестный кодек: {codec}")
+    if len(payload) >= len(data):
+        return bytes([CODEC_NONE]) + data
+    return bytes([codec]) + payload
+
+
+def decode_body(blob: bytes | None) -> str | None:
+    if blob is None:
+        return None
+    codec, payload = blob[0], memoryview(blob)[1:]
+    if codec == CODEC_NONE:
+        data = bytes(payload)
+    elif codec == CODEC_ZLIB:
+        data = zlib.decompress(payload)
+    elif codec == CODEC_ZSTD:
+        zstandard = load_zstandard()
+        if zstandard is None:
+            raise RuntimeError("Тело сжато zstd, установите zstandard: pip install -e .[zstd]")
+        data = zstandard.ZstdDecompressor().decompress(payload)
+    else:
+        raise ValueError(f"Неизвестный кодек в сжатом теле: {codec}")
+    return data.decode("utf-8")
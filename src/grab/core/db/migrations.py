@@ -1,17 +1,84 @@
 ﻿from __future__ import annotations
 
+import importlib.util
 import sqlite3
+from dataclasses import dataclass
 from pathlib import Path
+from types import ModuleType
+from typing import Any
 
 
-def connect_db(db_path: Path) -> sqlite3.Connection:
+@dataclass(frozen=True, slots=True)
+class DbProfile:
+    journal_mode: str
+    synchronous: str
+    cache_size_kib: int
+    mmap_size: int
+    temp_store: str
+    busy_timeout_ms: int
+
+
+DEFAULT_DB_PROFILE = "default"
+BULK_DB_PROFILE = "bulk"
+DB_PROFILES: dict[str, DbProfile] = {
+    # WAL: чтение (export) не блокируется записью (sync); FULL — fsync на каждый коммит
+    DEFAULT_DB_PROFILE: DbProfile(
+        journal_mode="WAL",
+        synchronous="FULL",
+        cache_size_kib=16 * 1024,
+        mmap_size=64 * 1024 * 1024,
+        temp_store="DEFAULT",
+        busy_timeout_ms=5_000,
+    ),
+    # Массовая загрузка: в WAL режим NORMAL не портит базу при сбое, но может потерять последние коммиты
+    BULK_DB_PROFILE: DbProfile(
+        journal_mode="WAL",
+        synchronous="NORMAL",
+        cache_size_kib=256 * 1024,
+        mmap_size=1024 * 1024 * 1024,
+        temp_store="MEMORY",
+        busy_timeout_ms=30_000,
+    ),
+}
+SYNCHRONOUS_NAMES = {0: "OFF", 1: "NORMAL", 2: "FULL", 3: "EXTRA"}
+TEMP_STORE_NAMES = {0: "DEFAULT", 1: "FILE", 2: "MEMORY"}
+
+
+def connect_db(db_path: Path, profile: str = DEFAULT_DB_PROFILE) -> sqlite3.Connection:
+    settings = DB_PROFILES.get(profile)
+    if settings is None:
+        raise ValueError(f"Неизвестный профиль БД: {profile} (доступны: {', '.join(DB_PROFILES)})")
     db_path.parent.mkdir(parents=True, exist_ok=True)
     connection = sqlite3.connect(str(db_path))
     connection.row_factory = sqlite3.Row
+    # busy_timeout первым: переключение journal_mode тоже ждет чужую блокировку
+    connection.execute(f"PRAGMA busy_timeout = {settings.busy_timeout_ms}")
+    connection.execute(f"PRAGMA journal_mode = {settings.journal_mode}")
+    connection.execute(f"PRAGMA synchronous = {settings.synchronous}")
+    # Отрицательное значение cache_size — размер в KiB, а не в страницах
+    connection.execute(f"PRAGMA cache_size = -{settings.cache_size_kib}")
+    connection.execute(f"PRAGMA mmap_size = {settings.mmap_size}")
+    connection.execute(f"PRAGMA temp_store = {settings.temp_store}")
     connection.execute("PRAGMA foreign_keys = ON")
     return connection
 
 
+def read_pragmas(connection: sqlite3.Connection) -> dict[str, str | int]:
+    def pragma(name: str) -> Any:
+        return connection.execute(f"PRAGMA {name}").fetchone()[0]
+
+    cache_size = pragma("cache_size")
+    return {
+        "journal_mode": str(pragma("journal_mode")).upper(),
+        "synchronous": SYNCHRONOUS_NAMES.get(pragma("synchronous"), "?"),
+        "cache_size_kib": -cache_size if cache_size < 0 else cache_size * pragma("page_size") // 1024,
+        "mmap_size": pragma("mmap_size"),
+        "temp_store": TEMP_STORE_NAMES.get(pragma("temp_store"), "?"),
+        "busy_timeout_ms": pragma("busy_timeout"),
+        "foreign_keys": pragma("foreign_keys"),
+    }
+
+
 def _ensure_migrations_table(connection: sqlite3.Connection) -> None:
     connection.execute(
         """
@@ -24,7 +91,22 @@ def _ensure_migrations_table(connection: sqlite3.Connection) -> None:
     connection.commit()
 
 
+def _load_python_migration(migration_file: Path) -> ModuleType:
+    spec = importlib.util.spec_from_file_location(f"grab_migration_{migration_file.stem}", migration_file)
+    if spec is None or spec.loader is None:
+        raise RuntimeError(f"Не удалось загрузить миграцию: {migration_file}")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
 def apply_migrations(connection: sqlite3.Connection, migrations_dir: Path) -> list[str]:
+    """
+    Применяет *.sql и *.py миграции по порядку имен.
+    .sql выполняется одной транзакцией. .py объявляет migrate(connection) и сама управляет
+    транзакциями (например, конвертирует данные пачками); она должна быть идемпотентной,
+    потому что после сбоя запустится заново, а запись в schema_migrations делается в конце.
+    """
     _ensure_migrations_table(connection)
 
     applied_files = {
@@ -32,17 +114,26 @@ def apply_migrations(connection: sqlite3.Connection, migrations_dir: Path) -> li
     }
     executed: list[str] = []
 
-    for migration_file in sorted(migrations_dir.glob("*.sql")):
+    migration_files = [*migrations_dir.glob("*.sql"), *migrations_dir.glob("*.py")]
+    for migration_file in sorted(migration_files, key=lambda path: path.name):
         if migration_file.name in applied_files:
             continue
 
-        script = migration_file.read_text(encoding="utf-8")
-        with connection:
-            connection.executescript(script)
-            connection.execute(
-                "INSERT INTO schema_migrations (filename) VALUES (?)",
-                (migration_file.name,),
-            )
+        if migration_file.suffix == ".py":
+            _load_python_migration(migration_file).migrate(connection)
+            with connection:
+                connection.execute(
+                    "INSERT INTO schema_migrations (filename) VALUES (?)",
+                    (migration_file.name,),
+                )
+        else:
+            script = migration_file.read_text(encoding="utf-8")
+            with connection:
+                connection.executescript(script)
+                connection.execute(
+                    "INSERT INTO schema_migrations (filename) VALUES (?)",
+                    (migration_file.name,),
+                )
         executed.append(migration_file.name)
 
     return executed
@@ -0,0 +1,10 @@
+﻿CREATE TABLE IF NOT EXISTS media_url_cache (
+    url TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    mime TEXT,
+    size_bytes INTEGER,
+    fetched_at TEXT NOT NULL,
+    checked_at TEXT NOT NULL
+);
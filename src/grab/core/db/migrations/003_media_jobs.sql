@@ -0,0 +1,18 @@
+﻿CREATE TABLE IF NOT EXISTS media_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    item_id INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    store_code TEXT NOT NULL,
+    order_ref TEXT,
+    source TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'running', 'done', 'failed')),
+    attempt INTEGER NOT NULL DEFAULT 0,
+    next_retry_at TEXT NOT NULL,
+    last_error TEXT,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(item_id, url),
+    FOREIGN KEY (item_id) REFERENCES order_items(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_media_jobs_due ON media_jobs(status, next_retry_at);
@@ -0,0 +1,4 @@
+﻿ALTER TABLE media ADD COLUMN verified_at TEXT;
+ALTER TABLE media ADD COLUMN verify_status TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_media_verified_at ON media(verified_at);
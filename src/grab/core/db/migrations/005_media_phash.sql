@@ -0,0 +1,7 @@
+﻿CREATE TABLE IF NOT EXISTS media_phash (
+    sha256 TEXT PRIMARY KEY,
+    dhash TEXT NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    computed_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,9 @@
+﻿CREATE TABLE IF NOT EXISTS export_watermarks (
+    target TEXT PRIMARY KEY,
+    watermark TEXT NOT NULL,
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_orders_updated_at ON orders(updated_at);
+CREATE INDEX IF NOT EXISTS idx_order_items_updated_at ON order_items(updated_at);
+CREATE INDEX IF NOT EXISTS idx_media_downloaded_at ON media(downloaded_at);
@@ -0,0 +1,3 @@
+﻿CREATE INDEX IF NOT EXISTS idx_orders_export_order ON orders(COALESCE(order_datetime, created_at) DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_order_items_order_id ON order_items(order_id);
+CREATE INDEX IF NOT EXISTS idx_media_item_export ON media(related_item_id, local_path_abs, source_url);
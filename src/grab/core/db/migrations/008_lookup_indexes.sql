@@ -0,0 +1,10 @@
+﻿-- Уже покрыты: order_items.order_id (idx_order_items_order_id), media.related_item_id и
+-- product_attributes.item_id, reviews.product_id, orders.store_id — ведущие колонки UNIQUE-автоиндексов.
+CREATE INDEX IF NOT EXISTS idx_order_items_product_id ON order_items(product_id);
+CREATE INDEX IF NOT EXISTS idx_product_attributes_product_id ON product_attributes(product_id);
+CREATE INDEX IF NOT EXISTS idx_orders_order_datetime ON orders(order_datetime);
+CREATE INDEX IF NOT EXISTS idx_raw_messages_message_datetime ON raw_messages(message_datetime);
+-- ON DELETE CASCADE с order_items ищет отзывы по item_id
+CREATE INDEX IF NOT EXISTS idx_reviews_item_id ON reviews(item_id);
+-- Перевешивание кэша ссылок при консолидации дублей (grab media dupes --consolidate)
+CREATE INDEX IF NOT EXISTS idx_media_url_cache_sha256 ON media_url_cache(sha256);
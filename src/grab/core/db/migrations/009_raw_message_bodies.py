@@ -0,0 +1,74 @@
+﻿"""
+Тела писем (raw_text, raw_html, raw_json) переезжают из raw_messages в отдельную таблицу
+raw_message_bodies в сжатом виде (первый байт — кодек, см. grab.core.db.compression).
+Конвертация идет пачками с коммитом на каждую: память и WAL не растут с объемом почты,
+а после прерывания запуск продолжается с неперенесенных строк.
+Колонки удаляются одной транзакцией; если старый запуск успел удалить только часть,
+оставшиеся тела все равно переносятся, а удаляются лишь оставшиеся колонки.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+
+from grab.core.db.compression import encode_body
+
+CHUNK_ROWS = 200
+BODY_COLUMNS = ("raw_text", "raw_html", "raw_json")
+
+
+def migrate(connection: sqlite3.Connection) -> None:
+    with connection:
+        connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS raw_message_bodies (
+                message_id INTEGER PRIMARY KEY,
+                raw_text BLOB,
+                raw_html BLOB,
+                raw_json BLOB,
+                FOREIGN KEY (message_id) REFERENCES raw_messages(id) ON DELETE CASCADE
+            )
+            """
+        )
+    columns = {row["name"] for row in connection.execute("PRAGMA table_info(raw_messages)")}
+    remaining = [column for column in BODY_COLUMNS if column in columns]
+    if not remaining:
+        return
+    select_sql = ", ".join(column if column in columns else f"NULL AS {column}" for column in BODY_COLUMNS)
+
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            f"""
+            SELECT id, {select_sql}
+            FROM raw_messages m
+            WHERE id > ?
+                AND NOT EXISTS (SELECT 1 FROM raw_message_bodies b WHERE b.message_id = m.id)
+            ORDER BY id
+            LIMIT ?
+            """,
+            (last_id, CHUNK_ROWS),
+        ).fetchall()
+        if not rows:
+            break
+        with connection:
+            connection.executemany(
+                "INSERT INTO raw_message_bodies (message_id, raw_text, raw_html, raw_json) VALUES (?, ?, ?, ?)",
+                [
+                    (row["id"], *(encode_body(row[column]) for column in BODY_COLUMNS))
+                    for row in rows
+                    if any(row[column] is not None for column in BODY_COLUMNS)
+                ],
+            )
+        last_id = rows[-1]["id"]
+
+    # Место освобождается внутри файла; чтобы уменьшить сам файл, нужен VACUUM.
+    # DDL sqlite3 не оборачивает в транзакцию сам, поэтому BEGIN явный: колонки удаляются все или ни одной
+    connection.execute("BEGIN")
+    try:
+        for column in remaining:
+            connection.execute(f"ALTER TABLE raw_messages DROP COLUMN {column}")
+    except BaseException:
+        connection.rollback()
+        raise
+    connection.commit()
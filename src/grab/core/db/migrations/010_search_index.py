@@ -0,0 +1,141 @@
+﻿"""
+Полнотекстовый поиск (FTS5): search_items по позициям (название, бренд, модель, магазин)
+и search_messages по письмам (тема, текст). rowid совпадает с order_items.id / raw_messages.id.
+search_items поддерживают триггеры; тела писем сжаты (см. 009), поэтому search_messages
+пополняет GrabRepository.upsert_raw_message, а здесь — разовое заполнение пачками.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+
+from grab.core.db.compression import decode_body
+from grab.core.db.search import SEARCH_PREFIXES, SEARCH_TOKENIZER, fold_sql, message_search_text
+
+CHUNK_ROWS = 500
+
+
+def _item_values_sql(alias: str) -> str:
+    # Колонки строки search_items для позиции alias; магазин берется из join orders o / stores s
+    return ", ".join(
+        (
+            f"{alias}.id",
+            fold_sql(f"COALESCE({alias}.title_full, {alias}.title_short)"),
+            fold_sql(f"{alias}.brand"),
+            fold_sql(f"{alias}.model"),
+            fold_sql("s.name"),
+        )
+    )
+
+
+def _item_insert_sql(alias: str) -> str:
+    return f"""
+                INSERT INTO search_items (rowid, title, brand, model, store)
+                SELECT {_item_values_sql(alias)}
+                FROM orders o
+                JOIN stores s ON s.id = o.store_id
+                WHERE o.id = {alias}.order_id;"""
+
+
+def migrate(connection: sqlite3.Connection) -> None:
+    with connection:
+        for table, columns in (
+            ("search_items", "title, brand, model, store"),
+            ("search_messages", "subject, body"),
+        ):
+            connection.execute(
+                f"""
+                CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5(
+                    {columns}, tokenize = '{SEARCH_TOKENIZER}', prefix = '{SEARCH_PREFIXES}'
+                )
+                """
+            )
+
+        connection.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS order_items_search_ai AFTER INSERT ON order_items BEGIN
+{_item_insert_sql("NEW")}
+            END
+            """
+        )
+        # upsert переписывает поля при каждом sync: индекс трогаем, только если текст реально изменился
+        connection.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS order_items_search_au AFTER UPDATE ON order_items
+            WHEN NEW.title_full IS NOT OLD.title_full
+                OR NEW.title_short IS NOT OLD.title_short
+                OR NEW.brand IS NOT OLD.brand
+                OR NEW.model IS NOT OLD.model
+                OR NEW.order_id IS NOT OLD.order_id
+            BEGIN
+                DELETE FROM search_items WHERE rowid = OLD.id;
+{_item_insert_sql("NEW")}
+            END
+            """
+        )
+        connection.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS order_items_search_ad AFTER DELETE ON order_items BEGIN
+                DELETE FROM search_items WHERE rowid = OLD.id;
+            END
+            """
+        )
+        connection.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS stores_search_au AFTER UPDATE OF name ON stores
+            WHEN NEW.name IS NOT OLD.name
+            BEGIN
+                UPDATE search_items SET store = {fold_sql("NEW.name")}
+                WHERE rowid IN (
+                    SELECT oi.id FROM orders o JOIN order_items oi ON oi.order_id = o.id WHERE o.store_id = NEW.id
+                );
+            END
+            """
+        )
+        connection.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS raw_messages_search_ad AFTER DELETE ON raw_messages BEGIN
+                DELETE FROM search_messages WHERE rowid = OLD.id;
+            END
+            """
+        )
+        connection.execute(
+            f"""
+            INSERT INTO search_items (rowid, title, brand, model, store)
+            SELECT {_item_values_sql("oi")}
+            FROM order_items oi
+            JOIN orders o ON o.id = oi.order_id
+            JOIN stores s ON s.id = o.store_id
+            WHERE oi.id NOT IN (SELECT rowid FROM search_items)
+            """
+        )
+
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            """
+            SELECT m.id, m.subject, b.raw_text, b.raw_html
+            FROM raw_messages m
+            LEFT JOIN raw_message_bodies b ON b.message_id = m.id
+            WHERE m.id > ?
+                AND m.id NOT IN (SELECT rowid FROM search_messages)
+            ORDER BY m.id
+            LIMIT ?
+            """,
+            (last_id, CHUNK_ROWS),
+        ).fetchall()
+        if not rows:
+            break
+        with connection:
+            connection.executemany(
+                f"INSERT INTO search_messages (rowid, subject, body) VALUES (?, {fold_sql('?')}, ?)",
+                [
+                    (
+                        row["id"],
+                        row["subject"],
+                        message_search_text(decode_body(row["raw_text"]), decode_body(row["raw_html"])),
+                    )
+                    for row in rows
+                ],
+            )
+        last_id = rows[-1]["id"]
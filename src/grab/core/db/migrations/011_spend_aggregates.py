@@ -0,0 +1,22 @@
+﻿"""
+Сводные таблицы трат: по магазину и месяцу, аккаунту, категории и валюте (ключом везде идет валюта,
+суммы в разных валютах не складываются). Триггеры на order_items и orders применяют дельты
+при каждой записи, так что `grab stats` читает готовые строки без GROUP BY по всем позициям.
+Существующие данные учитываются полным пересчетом в той же транзакции.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+
+from grab.core.db.aggregates import SPEND_TABLES, create_table_sql, rebuild_sql, spend_trigger_sql
+
+
+def migrate(connection: sqlite3.Connection) -> None:
+    with connection:
+        for table in SPEND_TABLES:
+            connection.execute(create_table_sql(table))
+        for statement in spend_trigger_sql():
+            connection.execute(statement)
+        for statement in rebuild_sql():
+            connection.execute(statement)
@@ -2,16 +2,185 @@
 
 import json
 import sqlite3
+from collections.abc import Iterator, Mapping, Sequence
+from dataclasses import dataclass
 from pathlib import Path
 from typing import Any
 
-from .migrations import apply_migrations, connect_db
+from .aggregates import rebuild_sql
+from .compression import decode_body, encode_body
+from .migrations import DEFAULT_DB_PROFILE, apply_migrations, connect_db
+from .search import (
+    ITEM_RANK_SQL,
+    MESSAGE_RANK_SQL,
+    build_match_query,
+    fold_sql,
+    message_search_text,
+)
+
+# Порядок колонок в VALUES пакетных upsert-ов
+ORDER_ITEM_COLUMNS = (
+    "order_id",
+    "external_item_id",
+    "dedupe_key",
+    "product_id",
+    "title_full",
+    "title_short",
+    "store_category_path",
+    "unified_category_path",
+    "brand",
+    "model",
+    "sku",
+    "quantity",
+    "unit_price",
+    "discount_amount",
+    "shipping_amount",
+    "total_amount",
+    "currency",
+    "product_url",
+    "order_url",
+    "receipt_url",
+)
+PRODUCT_ATTRIBUTE_COLUMNS = (
+    "product_id",
+    "item_id",
+    "attr_key",
+    "value_type",
+    "value_text",
+    "value_number",
+    "value_bool",
+    "value_json_raw",
+    "source",
+)
+MEDIA_COLUMNS = ("related_item_id", "source_url", "local_path_abs", "mime", "sha256", "size_bytes", "source", "meta_json")
+# Строк на один запрос id: (1 + ключ) параметров на строку, с запасом до лимита переменных SQLite
+BULK_LOOKUP_CHUNK = 500
+
+# Колонка выгрузки -> SQL-выражение; порядок словаря задает порядок колонок по умолчанию
+EXPORT_COLUMNS: dict[str, str] = {
+    "order_db_id": "o.id",
+    "item_db_id": "oi.id",
+    "store_code": "s.code",
+    "store_name": "s.name",
+    "external_order_id": "o.external_order_id",
+    "order_datetime": "o.order_datetime",
+    "paid_datetime": "o.paid_datetime",
+    "delivered_datetime": "o.delivered_datetime",
+    "currency": "o.currency",
+    "subtotal_amount": "o.subtotal_amount",
+    "shipping_amount": "o.shipping_amount",
+    "discount_amount": "o.discount_amount",
+    "total_amount": "o.total_amount",
+    "status": "o.status",
+    "source_url": "o.source_url",
+    "external_item_id": "oi.external_item_id",
+    "title_full": "oi.title_full",
+    "title_short": "oi.title_short",
+    "store_category_path": "oi.store_category_path",
+    "unified_category_path": "oi.unified_category_path",
+    "brand": "oi.brand",
+    "model": "oi.model",
+    "sku": "oi.sku",
+    "quantity": "oi.quantity",
+    "unit_price": "oi.unit_price",
+    "item_discount_amount": "oi.discount_amount",
+    "item_shipping_amount": "oi.shipping_amount",
+    "item_total_amount": "oi.total_amount",
+    "product_url": "oi.product_url",
+    "order_url": "oi.order_url",
+    "receipt_url": "oi.receipt_url",
+    "comment_user": "oi.comment_user",
+    "media_paths": "ma.media_paths",
+    "media_urls": "ma.media_urls",
+}
+
+# Срез сводки трат -> (подпись, FROM/JOIN, GROUP BY, ORDER BY); все читают маленькие таблицы spend_by_*
+SPEND_VIEWS: dict[str, tuple[str, str, str, str]] = {
+    "store": (
+        "s.code",
+        "spend_by_store_month a JOIN stores s ON s.id = a.store_id",
+        "a.store_id, a.currency",
+        "spend_minor DESC",
+    ),
+    "month": ("a.month", "spend_by_store_month a", "a.month, a.currency", "a.month DESC, spend_minor DESC"),
+    "store-month": (
+        "a.month || ' ' || s.code",
+        "spend_by_store_month a JOIN stores s ON s.id = a.store_id",
+        "a.month, a.store_id, a.currency",
+        "a.month DESC, spend_minor DESC",
+    ),
+    "account": (
+        "COALESCE(ac.account_identifier, ac.display_name, '-')",
+        "spend_by_account a LEFT JOIN accounts ac ON ac.id = a.account_id",
+        "a.account_id, a.currency",
+        "spend_minor DESC",
+    ),
+    "category": ("NULLIF(a.category, '')", "spend_by_category a", "a.category, a.currency", "spend_minor DESC"),
+    "currency": ("NULLIF(a.currency, '')", "spend_by_currency a", "a.currency", "spend_minor DESC"),
+}
+# Срезы, где есть месяц и работают since/until
+SPEND_MONTH_VIEWS = ("store", "month", "store-month")
+
+
+@dataclass(slots=True)
+class ExportFilter:
+    """
+    Фильтры выгрузки, которые компилируются в WHERE и список колонок SQL-запроса.
+    since/until — даты YYYY-MM-DD по дате заказа (until не включается),
+    min_amount — нижняя граница суммы позиции.
+    """
+
+    stores: tuple[str, ...] = ()
+    since: str | None = None
+    until: str | None = None
+    account: str | None = None
+    min_amount: float | None = None
+    columns: tuple[str, ...] = ()
+
+    def __post_init__(self) -> None:
+        unknown = [name for name in self.columns if name not in EXPORT_COLUMNS]
+        if unknown:
+            raise ValueError(f"Неизвестные колонки экспорта: {unknown}")
+
+    def is_empty(self) -> bool:
+        return self == ExportFilter()
+
+    def key(self) -> str:
+        # Стабильная подпись фильтра: у отфильтрованных выгрузок свой watermark
+        return json.dumps(
+            [list(self.stores), self.since, self.until, self.account, self.min_amount, list(self.columns)],
+            ensure_ascii=False,
+        )
+
+    def compile(self) -> tuple[list[str], list[Any]]:
+        conditions: list[str] = []
+        params: list[Any] = []
+        if self.stores:
+            conditions.append(f"s.code IN ({', '.join('?' * len(self.stores))})")
+            params.extend(self.stores)
+        # Выражение совпадает с индексом idx_orders_export_order, так что диапазон дат идет по индексу
+        if self.since is not None:
+            conditions.append("COALESCE(o.order_datetime, o.created_at) >= ?")
+            params.append(self.since)
+        if self.until is not None:
+            conditions.append("COALESCE(o.order_datetime, o.created_at) < ?")
+            params.append(self.until)
+        if self.account is not None:
+            conditions.append(
+                "o.account_id IN (SELECT id FROM accounts WHERE account_identifier = ? OR display_name = ?)"
+            )
+            params.extend([self.account, self.account])
+        if self.min_amount is not None:
+            conditions.append("oi.total_amount >= ?")
+            params.append(self.min_amount)
+        return conditions, params
 
 
 class GrabRepository:
-    def __init__(self, db_path: Path):
+    def __init__(self, db_path: Path, profile: str = DEFAULT_DB_PROFILE):
         self.db_path = db_path
-        self.connection = connect_db(db_path)
+        self.profile = profile
+        self.connection = connect_db(db_path, profile=profile)
 
     def close(self) -> None:
         self.connection.close()
@@ -32,12 +201,45 @@ class GrabRepository:
             return None
         return json.dumps(payload, ensure_ascii=False)
 
+    # Поиск id после upsert: `col IS ?` сравнивает NULL как значение и, в отличие от ifnull(col, ...) = ...,
+    # идет по UNIQUE-индексу, а не полным сканированием
     def _fetch_id(self, query: str, params: tuple[Any, ...]) -> int:
         row = self.connection.execute(query, params).fetchone()
         if row is None:
             raise RuntimeError(f"Не найден идентификатор по запросу: {query}")
         return int(row["id"])
 
+    def _ids_by_keys(self, table: str, key_columns: tuple[str, ...], rows: Sequence[Mapping[str, Any]]) -> list[int]:
+        """
+        id строк по ключу UNIQUE одним запросом на пачку: ключи идут VALUES-таблицей,
+        каждый ищется по индексу (`IS` — чтобы NULL в ключе совпадал). Порядок — как во входе.
+        """
+        if len(rows) == 1:
+            # Одиночный upsert: простой SELECT дешевле VALUES-таблицы
+            where_sql = " AND ".join(f"{column} IS ?" for column in key_columns)
+            return [self._fetch_id(f"SELECT id FROM {table} WHERE {where_sql}", tuple(rows[0][c] for c in key_columns))]
+        match_sql = " AND ".join(f"t.{column} IS k.c{index}" for index, column in enumerate(key_columns))
+        key_names = ", ".join(f"c{index}" for index in range(len(key_columns)))
+        placeholders = f"({', '.join('?' * (len(key_columns) + 1))})"
+        ids: list[int] = []
+        for offset in range(0, len(rows), BULK_LOOKUP_CHUNK):
+            chunk = rows[offset : offset + BULK_LOOKUP_CHUNK]
+            params = [value for pos, row in enumerate(chunk) for value in (pos, *(row[c] for c in key_columns))]
+            found = self.connection.execute(
+                f"""
+                WITH k(pos, {key_names}) AS (VALUES {", ".join([placeholders] * len(chunk))})
+                SELECT (SELECT MIN(t.id) FROM {table} t WHERE {match_sql}) AS id
+                FROM k
+                ORDER BY k.pos
+                """,
+                params,
+            ).fetchall()
+            for row in found:
+                if row["id"] is None:
+                    raise RuntimeError(f"Не найден идентификатор в {table} после upsert")
+                ids.append(int(row["id"]))
+        return ids
+
     def upsert_store(self, code: str, name: str, website: str | None = None) -> int:
         with self.connection:
             self.connection.execute(
@@ -91,7 +293,7 @@ class GrabRepository:
                 (store_id, name, inn, legal_entity),
             )
         return self._fetch_id(
-            "SELECT id FROM sellers WHERE store_id = ? AND name = ? AND ifnull(inn, '') = ifnull(?, '')",
+            "SELECT id FROM sellers WHERE store_id = ? AND name = ? AND inn IS ?",
             (store_id, name, inn),
         )
 
@@ -149,23 +351,23 @@ class GrabRepository:
         raw_json: dict[str, Any] | None,
         raw_eml_path: str | None,
     ) -> int:
+        # Тела сжимаются до транзакции: блокировка записи не держится на время компрессии
+        bodies = (encode_body(raw_text), encode_body(raw_html), encode_body(self._to_json(raw_json)))
+        search_body = message_search_text(raw_text, raw_html)
         with self.connection:
             self.connection.execute(
                 """
                 INSERT INTO raw_messages (
                     source, account_id, external_message_id, thread_id, message_datetime,
-                    subject, sender, recipients, raw_text, raw_html, raw_json, raw_eml_path
+                    subject, sender, recipients, raw_eml_path
                 )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
                 ON CONFLICT(source, external_message_id) DO UPDATE SET
                     thread_id = COALESCE(excluded.thread_id, raw_messages.thread_id),
                     message_datetime = COALESCE(excluded.message_datetime, raw_messages.message_datetime),
                     subject = COALESCE(excluded.subject, raw_messages.subject),
                     sender = COALESCE(excluded.sender, raw_messages.sender),
                     recipients = COALESCE(excluded.recipients, raw_messages.recipients),
-                    raw_text = COALESCE(excluded.raw_text, raw_messages.raw_text),
-                    raw_html = COALESCE(excluded.raw_html, raw_messages.raw_html),
-                    raw_json = COALESCE(excluded.raw_json, raw_messages.raw_json),
                     raw_eml_path = COALESCE(excluded.raw_eml_path, raw_messages.raw_eml_path)
                 """,
                 (
@@ -177,16 +379,60 @@ class GrabRepository:
                     subject,
                     sender,
                     recipients,
-                    raw_text,
-                    raw_html,
-                    self._to_json(raw_json),
                     raw_eml_path,
                 ),
             )
-        return self._fetch_id(
-            "SELECT id FROM raw_messages WHERE source = ? AND external_message_id = ?",
-            (source, external_message_id),
-        )
+            message_id = self._fetch_id(
+                "SELECT id FROM raw_messages WHERE source = ? AND external_message_id = ?",
+                (source, external_message_id),
+            )
+            if any(body is not None for body in bodies):
+                self.connection.execute(
+                    """
+                    INSERT INTO raw_message_bodies (message_id, raw_text, raw_html, raw_json)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(message_id) DO UPDATE SET
+                        raw_text = COALESCE(excluded.raw_text, raw_message_bodies.raw_text),
+                        raw_html = COALESCE(excluded.raw_html, raw_message_bodies.raw_html),
+                        raw_json = COALESCE(excluded.raw_json, raw_message_bodies.raw_json)
+                    """,
+                    (message_id, *bodies),
+                )
+            # Сжатые тела триггеру недоступны, поэтому строку поиска пишем здесь; без нового текста остается прежний
+            self.connection.execute(
+                f"""
+                INSERT OR REPLACE INTO search_messages (rowid, subject, body)
+                SELECT m.id, {fold_sql("m.subject")}, COALESCE(?, f.body)
+                FROM raw_messages m
+                LEFT JOIN search_messages f ON f.rowid = m.id
+                WHERE m.id = ?
+                """,
+                (search_body, message_id),
+            )
+        return message_id
+
+    def get_raw_message(self, message_id: int) -> dict[str, Any] | None:
+        """
+        Метаданные письма вместе с телами; тела распаковываются прозрачно,
+        raw_json возвращается разобранным.
+        """
+        row = self.connection.execute(
+            """
+            SELECT m.*, b.raw_text, b.raw_html, b.raw_json
+            FROM raw_messages m
+            LEFT JOIN raw_message_bodies b ON b.message_id = m.id
+            WHERE m.id = ?
+            """,
+            (message_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        message = dict(row)
+        for column in ("raw_text", "raw_html", "raw_json"):
+            message[column] = decode_body(message[column])
+        if message["raw_json"] is not None:
+            message["raw_json"] = json.loads(message["raw_json"])
+        return message
 
     def upsert_product(
         self,
@@ -304,8 +550,40 @@ class GrabRepository:
         order_url: str | None,
         receipt_url: str | None,
     ) -> int:
+        return self.upsert_order_items_bulk(
+            [
+                {
+                    "order_id": order_id,
+                    "external_item_id": external_item_id,
+                    "dedupe_key": dedupe_key,
+                    "product_id": product_id,
+                    "title_full": title_full,
+                    "title_short": title_short,
+                    "store_category_path": store_category_path,
+                    "unified_category_path": unified_category_path,
+                    "brand": brand,
+                    "model": model,
+                    "sku": sku,
+                    "quantity": quantity,
+                    "unit_price": unit_price,
+                    "discount_amount": discount_amount,
+                    "shipping_amount": shipping_amount,
+                    "total_amount": total_amount,
+                    "currency": currency,
+                    "product_url": product_url,
+                    "order_url": order_url,
+                    "receipt_url": receipt_url,
+                }
+            ]
+        )[0]
+
+    def upsert_order_items_bulk(self, rows: Sequence[Mapping[str, Any]]) -> list[int]:
+        """
+        Пакетный upsert позиций: одна транзакция, executemany и один запрос id.
+        Ключи строк — аргументы upsert_order_item; id возвращаются в порядке входа.
+        """
         with self.connection:
-            self.connection.execute(
+            self.connection.executemany(
                 """
                 INSERT INTO order_items (
                     order_id, external_item_id, dedupe_key, product_id,
@@ -335,33 +613,9 @@ class GrabRepository:
                     receipt_url = COALESCE(excluded.receipt_url, order_items.receipt_url),
                     updated_at = CURRENT_TIMESTAMP
                 """,
-                (
-                    order_id,
-                    external_item_id,
-                    dedupe_key,
-                    product_id,
-                    title_full,
-                    title_short,
-                    store_category_path,
-                    unified_category_path,
-                    brand,
-                    model,
-                    sku,
-                    quantity,
-                    unit_price,
-                    discount_amount,
-                    shipping_amount,
-                    total_amount,
-                    currency,
-                    product_url,
-                    order_url,
-                    receipt_url,
-                ),
+                [tuple(row[column] for column in ORDER_ITEM_COLUMNS) for row in rows],
             )
-        return self._fetch_id(
-            "SELECT id FROM order_items WHERE order_id = ? AND dedupe_key = ?",
-            (order_id, dedupe_key),
-        )
+            return self._ids_by_keys("order_items", ("order_id", "dedupe_key"), rows)
 
     def upsert_product_attribute(
         self,
@@ -375,8 +629,32 @@ class GrabRepository:
         value_json_raw: str | None,
         source: str | None,
     ) -> int:
+        return self.upsert_product_attributes_bulk(
+            [
+                {
+                    "product_id": product_id,
+                    "item_id": item_id,
+                    "attr_key": attr_key,
+                    "value_type": value_type,
+                    "value_text": value_text,
+                    "value_number": value_number,
+                    "value_bool": value_bool,
+                    "value_json_raw": value_json_raw,
+                    "source": source,
+                }
+            ]
+        )[0]
+
+    def upsert_product_attributes_bulk(self, rows: Sequence[Mapping[str, Any]]) -> list[int]:
+        # Ключи строк — аргументы upsert_product_attribute; id в порядке входа
+        params = []
+        for row in rows:
+            values = dict(row)
+            if values["value_bool"] is not None:
+                values["value_bool"] = int(values["value_bool"])
+            params.append(values)
         with self.connection:
-            self.connection.execute(
+            self.connection.executemany(
                 """
                 INSERT INTO product_attributes (
                     product_id, item_id, attr_key, value_type,
@@ -387,33 +665,13 @@ class GrabRepository:
                     value_json_raw = COALESCE(excluded.value_json_raw, product_attributes.value_json_raw),
                     source = COALESCE(excluded.source, product_attributes.source)
                 """,
-                (
-                    product_id,
-                    item_id,
-                    attr_key,
-                    value_type,
-                    value_text,
-                    value_number,
-                    int(value_bool) if value_bool is not None else None,
-                    value_json_raw,
-                    source,
-                ),
+                [tuple(values[column] for column in PRODUCT_ATTRIBUTE_COLUMNS) for values in params],
+            )
+            return self._ids_by_keys(
+                "product_attributes",
+                ("item_id", "attr_key", "value_text", "value_number", "value_bool"),
+                params,
             )
-        return self._fetch_id(
-            """
-            SELECT id FROM product_attributes
-            WHERE item_id = ? AND attr_key = ? AND ifnull(value_text, '') = ifnull(?, '')
-                AND ifnull(value_number, -99999999) = ifnull(?, -99999999)
-                AND ifnull(value_bool, -1) = ifnull(?, -1)
-            """,
-            (
-                item_id,
-                attr_key,
-                value_text,
-                value_number,
-                int(value_bool) if value_bool is not None else None,
-            ),
-        )
 
     def find_media_by_sha256(self, sha256_value: str) -> sqlite3.Row | None:
         return self.connection.execute(
@@ -432,8 +690,26 @@ class GrabRepository:
         source: str,
         meta_json: dict[str, Any] | None,
     ) -> int:
+        return self.upsert_media_bulk(
+            [
+                {
+                    "related_item_id": related_item_id,
+                    "source_url": source_url,
+                    "local_path_abs": local_path_abs,
+                    "mime": mime,
+                    "sha256_value": sha256_value,
+                    "size_bytes": size_bytes,
+                    "source": source,
+                    "meta_json": meta_json,
+                }
+            ]
+        )[0]
+
+    def upsert_media_bulk(self, rows: Sequence[Mapping[str, Any]]) -> list[int]:
+        # Ключи строк — аргументы upsert_media; id в порядке входа
+        params = [{**row, "sha256": row["sha256_value"], "meta_json": self._to_json(row["meta_json"])} for row in rows]
         with self.connection:
-            self.connection.execute(
+            self.connection.executemany(
                 """
                 INSERT INTO media (
                     related_item_id, source_url, local_path_abs, mime,
@@ -446,24 +722,267 @@ class GrabRepository:
                     size_bytes = COALESCE(excluded.size_bytes, media.size_bytes),
                     source = COALESCE(excluded.source, media.source),
                     meta_json = COALESCE(excluded.meta_json, media.meta_json),
-                    downloaded_at = CURRENT_TIMESTAMP
+                    downloaded_at = CURRENT_TIMESTAMP,
+                    verified_at = NULL,
+                    verify_status = NULL
                 """,
-                (
-                    related_item_id,
-                    source_url,
-                    local_path_abs,
-                    mime,
-                    sha256_value,
-                    size_bytes,
-                    source,
-                    self._to_json(meta_json),
-                ),
+                [tuple(values[column] for column in MEDIA_COLUMNS) for values in params],
             )
-        return self._fetch_id(
-            "SELECT id FROM media WHERE related_item_id = ? AND sha256 = ? AND ifnull(source_url, '') = ifnull(?, '')",
-            (related_item_id, sha256_value, source_url),
+            return self._ids_by_keys("media", ("related_item_id", "sha256", "source_url"), params)
+
+    def iter_media_sha256(self) -> Iterator[str]:
+        for row in self.connection.execute("SELECT DISTINCT sha256 FROM media"):
+            yield row["sha256"]
+
+    def list_media_by_sha256(self, sha256_value: str) -> list[sqlite3.Row]:
+        # store_code/order_ref — чтобы по строке можно было восстановить папку позиции
+        return self.connection.execute(
+            """
+            SELECT
+                m.*,
+                s.code AS store_code,
+                COALESCE(o.external_order_id, substr(o.order_datetime, 1, 10), 'unknown_date') AS order_ref
+            FROM media m
+            JOIN order_items oi ON oi.id = m.related_item_id
+            JOIN orders o ON o.id = oi.order_id
+            JOIN stores s ON s.id = o.store_id
+            WHERE m.sha256 = ?
+            ORDER BY m.id
+            """,
+            (sha256_value,),
+        ).fetchall()
+
+    def delete_media(self, media_id: int) -> None:
+        with self.connection:
+            self.connection.execute("DELETE FROM media WHERE id = ?", (media_id,))
+
+    def get_media_phashes(self) -> dict[str, sqlite3.Row]:
+        rows = self.connection.execute("SELECT * FROM media_phash").fetchall()
+        return {row["sha256"]: row for row in rows}
+
+    def upsert_media_phashes(self, rows: list[tuple[str, str, int, int]]) -> None:
+        with self.connection:
+            self.connection.executemany(
+                """
+                INSERT INTO media_phash (sha256, dhash, width, height)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(sha256) DO UPDATE SET
+                    dhash = excluded.dhash,
+                    width = excluded.width,
+                    height = excluded.height,
+                    computed_at = CURRENT_TIMESTAMP
+                """,
+                rows,
+            )
+
+    def iter_media_thumbnail_sources(self) -> Iterator[sqlite3.Row]:
+        return self.connection.execute(
+            "SELECT related_item_id, sha256, mime, local_path_abs FROM media ORDER BY related_item_id, id"
         )
 
+    def fetch_media_for_verify(self, after_id: int, verified_before: str, limit: int) -> list[sqlite3.Row]:
+        # Keyset-пагинация по id: прерванная проверка продолжается с непроверенных строк
+        return self.connection.execute(
+            """
+            SELECT
+                m.*,
+                s.code AS store_code,
+                COALESCE(o.external_order_id, substr(o.order_datetime, 1, 10), 'unknown_date') AS order_ref
+            FROM media m
+            JOIN order_items oi ON oi.id = m.related_item_id
+            JOIN orders o ON o.id = oi.order_id
+            JOIN stores s ON s.id = o.store_id
+            WHERE m.id > ? AND (m.verified_at IS NULL OR m.verified_at < ?)
+            ORDER BY m.id
+            LIMIT ?
+            """,
+            (after_id, verified_before, limit),
+        ).fetchall()
+
+    def mark_media_verified(self, results: list[tuple[int, str]], verified_at: str) -> None:
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE media SET verify_status = ?, verified_at = ? WHERE id = ?",
+                [(status, verified_at, media_id) for media_id, status in results],
+            )
+
+    def iter_media_meta(self) -> Iterator[sqlite3.Row]:
+        return self.connection.execute(
+            """
+            SELECT
+                m.related_item_id,
+                m.meta_json,
+                s.code AS store_code,
+                COALESCE(o.external_order_id, substr(o.order_datetime, 1, 10), 'unknown_date') AS order_ref
+            FROM media m
+            JOIN order_items oi ON oi.id = m.related_item_id
+            JOIN orders o ON o.id = oi.order_id
+            JOIN stores s ON s.id = o.store_id
+            WHERE m.meta_json IS NOT NULL
+            ORDER BY m.related_item_id, m.id
+            """
+        )
+
+    def get_media_url_cache(self, url: str) -> sqlite3.Row | None:
+        return self.connection.execute(
+            "SELECT * FROM media_url_cache WHERE url = ?",
+            (url,),
+        ).fetchone()
+
+    def upsert_media_url_cache(
+        self,
+        url: str,
+        sha256_value: str,
+        etag: str | None,
+        last_modified: str | None,
+        mime: str | None,
+        size_bytes: int | None,
+        fetched_at: str,
+    ) -> None:
+        with self.connection:
+            self.connection.execute(
+                """
+                INSERT INTO media_url_cache (
+                    url, sha256, etag, last_modified, mime, size_bytes, fetched_at, checked_at
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    sha256 = excluded.sha256,
+                    etag = excluded.etag,
+                    last_modified = excluded.last_modified,
+                    mime = COALESCE(excluded.mime, media_url_cache.mime),
+                    size_bytes = COALESCE(excluded.size_bytes, media_url_cache.size_bytes),
+                    fetched_at = excluded.fetched_at,
+                    checked_at = excluded.checked_at
+                """,
+                (url, sha256_value, etag, last_modified, mime, size_bytes, fetched_at, fetched_at),
+            )
+
+    def touch_media_url_cache(
+        self,
+        url: str,
+        checked_at: str,
+        etag: str | None,
+        last_modified: str | None,
+    ) -> None:
+        with self.connection:
+            self.connection.execute(
+                """
+                UPDATE media_url_cache
+                SET checked_at = ?,
+                    etag = COALESCE(?, etag),
+                    last_modified = COALESCE(?, last_modified)
+                WHERE url = ?
+                """,
+                (checked_at, etag, last_modified, url),
+            )
+
+    def repoint_media_url_cache(self, old_sha256: str, new_sha256: str) -> None:
+        with self.connection:
+            self.connection.execute(
+                "UPDATE media_url_cache SET sha256 = ? WHERE sha256 = ?",
+                (new_sha256, old_sha256),
+            )
+
+    def delete_media_url_cache(self, url: str) -> None:
+        with self.connection:
+            self.connection.execute("DELETE FROM media_url_cache WHERE url = ?", (url,))
+
+    def enqueue_media_job(
+        self,
+        item_id: int,
+        url: str,
+        store_code: str,
+        order_ref: str | None,
+        source: str,
+        next_retry_at: str,
+        force: bool = False,
+    ) -> None:
+        # force: сбросить и уже выполненную задачу (файл потерян после скачивания)
+        with self.connection:
+            self.connection.execute(
+                """
+                INSERT INTO media_jobs (item_id, url, store_code, order_ref, source, next_retry_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(item_id, url) DO UPDATE SET
+                    status = 'pending',
+                    attempt = 0,
+                    next_retry_at = excluded.next_retry_at,
+                    last_error = NULL,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE media_jobs.status = 'failed' OR ?
+                """,
+                (item_id, url, store_code, order_ref, source, next_retry_at, force),
+            )
+
+    def claim_media_jobs(self, limit: int, now: str) -> list[sqlite3.Row]:
+        # Отбор и перевод в running одним UPDATE: два воркера не получат одну и ту же задачу
+        with self.connection:
+            rows = self.connection.execute(
+                """
+                UPDATE media_jobs
+                SET status = 'running', updated_at = CURRENT_TIMESTAMP
+                WHERE id IN (
+                    SELECT id FROM media_jobs
+                    WHERE status = 'pending' AND next_retry_at <= ?
+                    ORDER BY next_retry_at, id
+                    LIMIT ?
+                )
+                RETURNING *
+                """,
+                (now, limit),
+            ).fetchall()
+        # Порядок строк RETURNING не гарантирован
+        return sorted(rows, key=lambda row: (row["next_retry_at"], row["id"]))
+
+    def release_running_media_jobs(self, lease_sec: float) -> int:
+        """
+        Возвращает в очередь задачи, оставшиеся в running после аварийно завершенного воркера.
+        Трогаем только взятые дольше lease_sec назад: свежие выполняет параллельно работающий воркер.
+        """
+        with self.connection:
+            cursor = self.connection.execute(
+                """
+                UPDATE media_jobs
+                SET status = 'pending', updated_at = CURRENT_TIMESTAMP
+                WHERE status = 'running' AND updated_at <= datetime('now', ?)
+                """,
+                (f"-{int(lease_sec)} seconds",),
+            )
+        return cursor.rowcount
+
+    def complete_media_job(self, job_id: int) -> None:
+        with self.connection:
+            self.connection.execute(
+                """
+                UPDATE media_jobs
+                SET status = 'done', attempt = attempt + 1, last_error = NULL, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+                """,
+                (job_id,),
+            )
+
+    def fail_media_job(self, job_id: int, error_text: str, next_retry_at: str | None) -> None:
+        with self.connection:
+            self.connection.execute(
+                """
+                UPDATE media_jobs
+                SET status = CASE WHEN ? IS NULL THEN 'failed' ELSE 'pending' END,
+                    attempt = attempt + 1,
+                    next_retry_at = COALESCE(?, next_retry_at),
+                    last_error = ?,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+                """,
+                (next_retry_at, next_retry_at, error_text, job_id),
+            )
+
+    def media_job_counts(self) -> dict[str, int]:
+        rows = self.connection.execute(
+            "SELECT status, COUNT(*) AS cnt FROM media_jobs GROUP BY status"
+        ).fetchall()
+        return {row["status"]: int(row["cnt"]) for row in rows}
+
     def upsert_review(
         self,
         product_id: int | None,
@@ -506,11 +1025,11 @@ class GrabRepository:
         return self._fetch_id(
             """
             SELECT id FROM reviews
-            WHERE ifnull(product_id, -1) = ifnull(?, -1)
+            WHERE product_id IS ?
                 AND review_type = ?
-                AND ifnull(source, '') = ifnull(?, '')
-                AND ifnull(author, '') = ifnull(?, '')
-                AND ifnull(review_date, '') = ifnull(?, '')
+                AND source IS ?
+                AND author IS ?
+                AND review_date IS ?
                 AND text = ?
             """,
             (product_id, review_type, source, author, review_date, text),
@@ -548,59 +1067,261 @@ class GrabRepository:
                 ),
             )
 
-    def fetch_export_rows(self) -> list[dict[str, Any]]:
-        rows = self.connection.execute(
+    def _export_query(
+        self,
+        changed_since: str | None = None,
+        media_lists: bool = False,
+        export_filter: ExportFilter | None = None,
+        extra_columns: tuple[str, ...] = (),
+    ) -> tuple[str, tuple[Any, ...]]:
+        export_filter = export_filter or ExportFilter()
+        columns = list(export_filter.columns or EXPORT_COLUMNS)
+        # Служебные колонки писателя (ключи разделов, id позиции) идут в конце, чтобы их было легко отрезать
+        columns += [name for name in extra_columns if name not in columns]
+        if media_lists:
+            media_sql = {
+                "media_paths": "json_group_array(m.local_path_abs)",
+                "media_urls": "json_group_array(m.source_url) FILTER (WHERE m.source_url IS NOT NULL)",
+            }
+        else:
+            media_sql = {
+                "media_paths": "group_concat(m.local_path_abs, ' | ')",
+                "media_urls": "group_concat(m.source_url, ' | ')",
+            }
+        conditions, params = export_filter.compile()
+        if changed_since is not None:
+            conditions.append(
+                """oi.id IN (
+                SELECT id FROM order_items WHERE updated_at >= ?
+                UNION
+                SELECT ci.id FROM orders co JOIN order_items ci ON ci.order_id = co.id WHERE co.updated_at >= ?
+                UNION
+                SELECT related_item_id FROM media WHERE downloaded_at >= ?
+            )"""
+            )
+            params += [changed_since, changed_since, changed_since]
+        where_sql = f"\n            WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        # Полная выгрузка агрегирует медиа один раз проходом по покрывающему индексу idx_media_item_export.
+        # С отбором (фильтр, changed_since) медиа читаются только для выбранных позиций: поиском по тому же индексу,
+        # иначе дельта в одну строку группировала бы всю таблицу media.
+        # Порядок строк берется из индекса idx_orders_export_order без сортировки во временном B-tree.
+        # Если медиа-колонки не выбраны, таблица media не читается вовсе.
+        expressions = {name: EXPORT_COLUMNS[name] for name in columns}
+        media_columns = [name for name in columns if name in media_sql]
+        with_sql = join_sql = ""
+        if media_columns and conditions:
+            for name in media_columns:
+                # GROUP BY: у позиции без медиа подзапрос не вернет строк (NULL, как у LEFT JOIN), а не пустой массив
+                expressions[name] = (
+                    f"(SELECT {media_sql[name]} FROM media m "
+                    "WHERE m.related_item_id = oi.id GROUP BY m.related_item_id)"
+                )
+        elif media_columns:
+            aggregates = "".join(f",\n                    {media_sql[name]} AS {name}" for name in media_columns)
+            with_sql = f"""
+            WITH media_agg AS (
+                SELECT
+                    m.related_item_id{aggregates}
+                FROM media m
+                GROUP BY m.related_item_id
+            )"""
+            join_sql = "\n            LEFT JOIN media_agg ma ON ma.related_item_id = oi.id"
+        select_sql = ",\n                ".join(f"{expression} AS {name}" for name, expression in expressions.items())
+        sql = f"""{with_sql}
+            SELECT
+                {select_sql}
+            FROM orders o
+            JOIN order_items oi ON oi.order_id = o.id
+            JOIN stores s ON s.id = o.store_id{join_sql}{where_sql}
+            ORDER BY COALESCE(o.order_datetime, o.created_at) DESC, o.id DESC, oi.id ASC
             """
+        return sql, tuple(params)
+
+    def export_cursor(
+        self,
+        changed_since: str | None = None,
+        media_lists: bool = False,
+        export_filter: ExportFilter | None = None,
+        extra_columns: tuple[str, ...] = (),
+    ) -> sqlite3.Cursor:
+        """
+        Курсор читается лениво: строки не материализуются целиком.
+        changed_since — только позиции, у которых с этого момента менялись сама позиция,
+        ее заказ или медиа (по индексам updated_at/downloaded_at).
+        media_lists — media_paths/media_urls как JSON-массивы вместо строк через ' | '.
+        export_filter — отбор строк и колонок прямо в SQL.
+        extra_columns — колонки, нужные писателю, но не выбранные фильтром; добавляются в конец.
+        """
+        sql, params = self._export_query(
+            changed_since=changed_since,
+            media_lists=media_lists,
+            export_filter=export_filter,
+            extra_columns=extra_columns,
+        )
+        return self.connection.execute(sql, params)
+
+    def search_items(
+        self,
+        query: str,
+        export_filter: ExportFilter | None = None,
+        limit: int = 20,
+    ) -> list[sqlite3.Row]:
+        """
+        Полнотекстовый поиск позиций (FTS5, bm25: название весит больше бренда и модели, магазин — меньше всех).
+        export_filter — те же отборы по магазину, датам заказа, аккаунту и сумме, что у выгрузки.
+        """
+        conditions, params = (export_filter or ExportFilter()).compile()
+        where_sql = " AND ".join(["search_items MATCH ?", *conditions])
+        # CROSS JOIN фиксирует порядок: сначала совпадения из FTS, потом позиции, заказы и магазины по ключу.
+        # Иначе при фильтре по магазину планировщик начинает с магазина и проверяет MATCH на каждой его позиции.
+        return self.connection.execute(
+            f"""
             SELECT
-                o.id AS order_db_id,
                 oi.id AS item_db_id,
                 s.code AS store_code,
                 s.name AS store_name,
                 o.external_order_id,
-                o.order_datetime,
-                o.paid_datetime,
-                o.delivered_datetime,
-                o.currency,
-                o.subtotal_amount,
-                o.shipping_amount,
-                o.discount_amount,
-                o.total_amount,
-                o.status,
-                o.source_url,
-                oi.external_item_id,
-                oi.title_full,
-                oi.title_short,
-                oi.store_category_path,
-                oi.unified_category_path,
+                COALESCE(o.order_datetime, o.created_at) AS order_datetime,
+                COALESCE(oi.title_full, oi.title_short) AS title,
                 oi.brand,
                 oi.model,
-                oi.sku,
                 oi.quantity,
-                oi.unit_price,
-                oi.discount_amount AS item_discount_amount,
-                oi.shipping_amount AS item_shipping_amount,
-                oi.total_amount AS item_total_amount,
-                oi.product_url,
-                oi.order_url,
-                oi.receipt_url,
-                oi.comment_user,
-                (
-                    SELECT group_concat(m.local_path_abs, ' | ')
-                    FROM media m
-                    WHERE m.related_item_id = oi.id
-                ) AS media_paths,
-                (
-                    SELECT group_concat(m.source_url, ' | ')
-                    FROM media m
-                    WHERE m.related_item_id = oi.id
-                ) AS media_urls
-            FROM order_items oi
-            JOIN orders o ON o.id = oi.order_id
-            JOIN stores s ON s.id = o.store_id
-            ORDER BY COALESCE(o.order_datetime, o.created_at) DESC, o.id DESC, oi.id ASC
-            """
+                oi.total_amount,
+                oi.currency,
+                {ITEM_RANK_SQL} AS rank
+            FROM search_items
+            CROSS JOIN order_items oi ON oi.id = search_items.rowid
+            CROSS JOIN orders o ON o.id = oi.order_id
+            CROSS JOIN stores s ON s.id = o.store_id
+            WHERE {where_sql}
+            ORDER BY rank
+            LIMIT ?
+            """,
+            (build_match_query(query), *params, limit),
+        ).fetchall()
+
+    def search_messages(
+        self,
+        query: str,
+        since: str | None = None,
+        until: str | None = None,
+        limit: int = 20,
+    ) -> list[sqlite3.Row]:
+        # since/until — границы по дате письма (until не включается), как в ExportFilter
+        conditions = ["search_messages MATCH ?"]
+        params: list[Any] = [build_match_query(query)]
+        if since is not None:
+            conditions.append("m.message_datetime >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("m.message_datetime < ?")
+            params.append(until)
+        return self.connection.execute(
+            f"""
+            SELECT
+                m.id AS message_db_id,
+                m.source,
+                m.external_message_id,
+                m.message_datetime,
+                m.subject,
+                m.sender,
+                snippet(search_messages, 1, '«', '»', '…', 12) AS snippet,
+                {MESSAGE_RANK_SQL} AS rank
+            FROM search_messages
+            JOIN raw_messages m ON m.id = search_messages.rowid
+            WHERE {" AND ".join(conditions)}
+            ORDER BY rank
+            LIMIT ?
+            """,
+            (*params, limit),
+        ).fetchall()
+
+    def spend_stats(
+        self,
+        by: str = "store",
+        since_month: str | None = None,
+        until_month: str | None = None,
+        limit: int | None = None,
+    ) -> list[sqlite3.Row]:
+        """
+        Сводка трат из таблиц spend_by_*, которые триггеры держат в актуальном состоянии.
+        since_month/until_month — YYYY-MM включительно, только для срезов с месяцем.
+        spend — сумма позиций в валюте строки (в таблицах хранится в копейках).
+        """
+        view = SPEND_VIEWS.get(by)
+        if view is None:
+            raise ValueError(f"Неизвестный срез: {by} (доступны: {', '.join(SPEND_VIEWS)})")
+        label_sql, from_sql, group_sql, order_sql = view
+        conditions: list[str] = []
+        params: list[Any] = []
+        if since_month is not None or until_month is not None:
+            if by not in SPEND_MONTH_VIEWS:
+                raise ValueError(f"Фильтр по месяцам доступен только для срезов: {', '.join(SPEND_MONTH_VIEWS)}")
+            if since_month is not None:
+                conditions.append("a.month >= ?")
+                params.append(since_month)
+            if until_month is not None:
+                conditions.append("a.month <= ?")
+                params.append(until_month)
+        where_sql = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        limit_sql = "LIMIT ?" if limit is not None else ""
+        if limit is not None:
+            params.append(limit)
+        return self.connection.execute(
+            f"""
+            SELECT
+                {label_sql} AS label,
+                NULLIF(a.currency, '') AS currency,
+                SUM(a.items_count) AS items_count,
+                SUM(a.spend_minor) AS spend_minor,
+                SUM(a.spend_minor) / 100.0 AS spend
+            FROM {from_sql}
+            {where_sql}
+            GROUP BY {group_sql}
+            ORDER BY {order_sql}
+            {limit_sql}
+            """,
+            params,
         ).fetchall()
-        return [dict(row) for row in rows]
+
+    def rebuild_spend_aggregates(self) -> None:
+        # Полный пересчет сводок; нужен только если таблицы правили в обход триггеров
+        with self.connection:
+            for statement in rebuild_sql():
+                self.connection.execute(statement)
+
+    def db_now(self) -> str:
+        # Время в формате CURRENT_TIMESTAMP, чтобы сравнение с updated_at было строковым и точным
+        return self.connection.execute("SELECT CURRENT_TIMESTAMP AS now").fetchone()["now"]
+
+    def get_export_watermark(self, target: str) -> str | None:
+        row = self.connection.execute(
+            "SELECT watermark FROM export_watermarks WHERE target = ?",
+            (target,),
+        ).fetchone()
+        return row["watermark"] if row else None
+
+    def set_export_watermark(self, target: str, watermark: str) -> None:
+        with self.connection:
+            self.connection.execute(
+                """
+                INSERT INTO export_watermarks (target, watermark)
+                VALUES (?, ?)
+                ON CONFLICT(target) DO UPDATE SET
+                    watermark = excluded.watermark,
+                    updated_at = CURRENT_TIMESTAMP
+                """,
+                (target, watermark),
+            )
+
+    def iter_export_rows(self, chunk_size: int = 1000) -> Iterator[sqlite3.Row]:
+        cursor = self.export_cursor()
+        while chunk := cursor.fetchmany(chunk_size):
+            yield from chunk
+
+    def fetch_export_rows(self) -> list[dict[str, Any]]:
+        return [dict(row) for row in self.iter_export_rows()]
 
     def duplicate_diagnostics(self) -> dict[str, list[dict[str, Any]]]:
         order_dupes = self.connection.execute(
@@ -0,0 +1,77 @@
+﻿from __future__ import annotations
+
+import re
+
+# unicode61 приводит к нижнему регистру кириллицу и латиницу, remove_diacritics 2 снимает диакритику (café -> cafe)
+SEARCH_TOKENIZER = "unicode61 remove_diacritics 2"
+# Префиксные индексы ускоряют запросы вида "наушн"*
+SEARCH_PREFIXES = "2 3"
+# Веса bm25 по колонкам: search_items(title, brand, model, store), search_messages(subject, body).
+# Явный вызов bm25(...) в запросе на четверть быстрее, чем rank из конфига таблицы (конфиг разбирается на каждой строке)
+ITEM_RANK_SQL = "bm25(search_items, 10.0, 4.0, 4.0, 1.0)"
+MESSAGE_RANK_SQL = "bm25(search_messages, 4.0, 1.0)"
+# Длинные рассылки индексируем началом: сведения о заказе там, а индекс не раздувается
+MAX_BODY_CHARS = 20_000
+
+# Окончания для грубого стемминга: "наушники" и "наушников" ищутся как префикс "наушник"
+RU_ENDINGS = tuple(
+    sorted(
+        (
+            "ами", "ями", "ого", "его", "ому", "ему", "ыми", "ими",
+            "ов", "ев", "ей", "ий", "ый", "ой", "ая", "яя", "ое", "ее", "ые", "ие",
+            "ах", "ях", "ам", "ям", "ом", "ем", "ую", "юю",
+            "а", "я", "ы", "и", "о", "е", "у", "ю", "ь", "й",
+        ),  # fmt: skip
+        key=len,
+        reverse=True,
+    )
+)
+MIN_STEM_CHARS = 3
+
+_WORD_RE = re.compile(r"\w+")
+_CYRILLIC_RE = re.compile(r"[а-я]")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def fold_text(value: str) -> str:
+    # unicode61 не сводит "ё" к "е": нормализуем одинаково при индексации и в запросе
+    return value.replace("ё", "е").replace("Ё", "Е")
+
+
+def fold_sql(expression: str) -> str:
+    # То же, что fold_text, для триггеров и INSERT ... SELECT
+    return f"replace(replace({expression}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def _stem(token: str) -> str:
+    if len(token) <= MIN_STEM_CHARS or not _CYRILLIC_RE.search(token):
+        return token
+    for ending in RU_ENDINGS:
+        if token.endswith(ending) and len(token) - len(ending) >= MIN_STEM_CHARS:
+            return token[: -len(ending)]
+    return token
+
+
+def build_match_query(text: str) -> str:
+    """
+    Пользовательский текст -> выражение FTS5 MATCH: каждое слово — префикс основы в кавычках,
+    слова объединяются по И. Спецсимволы FTS5 (-, :, *, скобки) в запрос не попадают.
+    """
+    tokens = [_stem(token) for token in _WORD_RE.findall(fold_text(text).lower())]
+    if not tokens:
+        raise ValueError("Пустой поисковый запрос")
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def message_search_text(raw_text: str | None, raw_html: str | None) -> str | None:
+    # Текстовая часть письма, а если ее нет — видимый текст HTML (тот же разбор BeautifulSoup, что у парсеров)
+    if raw_text:
+        text = raw_text
+    elif raw_html:
+        # Импорт здесь: пакет grab.parsers тянет модели источников, а те — grab.core.db
+        from grab.parsers.utils import html_to_text
+
+        text = html_to_text(raw_html)
+    else:
+        return None
+    return fold_text(_SPACES_RE.sub(" ", text).strip()[:MAX_BODY_CHARS])
@@ -1,3 +1,31 @@
-﻿from .manager import MediaManager
+﻿from .downloader import DownloadResult, MediaDownloader, backoff_with_jitter
+from .manager import MediaManager, PendingDownload
+from .phash import BKTree, DuplicateGroup, dhash_file, hamming
+from .spool import SpooledFile, SpoolWriter, spool_base64, spool_bytes
+from .store import BlobStore, GcStats
+from .thumbs import ThumbnailGenerator, ThumbnailStats, pillow_available
+from .verify import VerifyStats, hash_file, hash_files
 
-__all__ = ["MediaManager"]
+__all__ = [
+    "BKTree",
+    "BlobStore",
+    "DownloadResult",
+    "DuplicateGroup",
+    "GcStats",
+    "MediaDownloader",
+    "MediaManager",
+    "PendingDownload",
+    "SpooledFile",
+    "SpoolWriter",
+    "ThumbnailGenerator",
+    "ThumbnailStats",
+    "VerifyStats",
+    "backoff_with_jitter",
+    "dhash_file",
+    "hamming",
+    "hash_file",
+    "hash_files",
+    "pillow_available",
+    "spool_base64",
+    "spool_bytes",
+]
@@ -0,0 +1,193 @@
+﻿from __future__ import annotations
+
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .spool import CHUNK_SIZE, SpooledFile, SpoolWriter
+
+
+def backoff_with_jitter(attempt: int, base_sec: float, max_sec: float) -> float:
+    # equal jitter: половина задержки фиксирована, половина случайна
+    delay = min(max_sec, base_sec * (2 ** (attempt - 1)))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+@dataclass(slots=True)
+class DownloadResult:
+    url: str
+    spooled: SpooledFile | None
+    mime: str | None
+    filename: str | None
+    etag: str | None = None
+    last_modified: str | None = None
+    not_modified: bool = False
+
+
+class MediaDownloader:
+    """
+    Пул скачивания медиа: общий requests.Session (keep-alive, пул соединений),
+    глобальный лимит потоков, лимит одновременных запросов на хост и
+    экспоненциальный backoff с jitter между попытками.
+    Тело ответа пишется потоком в spool-файл с подсчетом sha256 на лету.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_workers: int = 8,
+        per_host_limit: int = 2,
+        timeout_sec: int = 30,
+        max_bytes: int = 50_000_000,
+        max_retries: int = 2,
+        backoff_base_sec: float = 1.0,
+        backoff_max_sec: float = 30.0,
+        session: requests.Session | None = None,
+        spool_dir: Path | None = None,
+        rate_limit_per_sec: float = 0.0,
+    ):
+        self.spool_dir = spool_dir or Path(tempfile.gettempdir()) / "grab-spool"
+        self.max_workers = max(1, max_workers)
+        self.per_host_limit = max(1, per_host_limit)
+        self.timeout_sec = timeout_sec
+        self.max_bytes = max_bytes
+        self.max_retries = max(1, max_retries)
+        self.backoff_base_sec = backoff_base_sec
+        self.backoff_max_sec = backoff_max_sec
+        self.session = session or self._build_session(self.max_workers)
+        self._host_slots: dict[str, threading.BoundedSemaphore] = {}
+        self._host_slots_lock = threading.Lock()
+        self._executor: ThreadPoolExecutor | None = None
+        self._executor_lock = threading.Lock()
+        self.rate_limit_per_sec = rate_limit_per_sec
+        self._next_request_at = 0.0
+        self._rate_lock = threading.Lock()
+
+    @staticmethod
+    def _build_session(pool_size: int) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _host_slot(self, url: str) -> threading.BoundedSemaphore:
+        host = urlparse(url).netloc.lower()
+        with self._host_slots_lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = threading.BoundedSemaphore(self.per_host_limit)
+                self._host_slots[host] = slot
+            return slot
+
+    def _throttle(self) -> None:
+        # Глобальный лимит частоты запросов: равномерные слоты 1/rate секунд
+        if self.rate_limit_per_sec <= 0:
+            return
+        with self._rate_lock:
+            now = time.monotonic()
+            slot = max(now, self._next_request_at)
+            self._next_request_at = slot + 1.0 / self.rate_limit_per_sec
+        if slot > now:
+            time.sleep(slot - now)
+
+    def backoff_delay(self, attempt: int) -> float:
+        return backoff_with_jitter(attempt, self.backoff_base_sec, self.backoff_max_sec)
+
+    @staticmethod
+    def _is_retryable(exc: requests.RequestException) -> bool:
+        if isinstance(exc, requests.HTTPError) and exc.response is not None:
+            status = exc.response.status_code
+            return status == 429 or status >= 500
+        return True
+
+    def _request(
+        self,
+        url: str,
+        headers: dict[str, str] | None,
+        timeout_sec: int,
+        max_bytes: int,
+    ) -> DownloadResult:
+        self._throttle()
+        with (
+            self._host_slot(url),
+            self.session.get(url, headers=headers, timeout=timeout_sec, stream=True) as response,
+        ):
+            response.raise_for_status()
+            result = DownloadResult(
+                url=url,
+                spooled=None,
+                mime=response.headers.get("Content-Type"),
+                filename=Path(urlparse(url).path).name or None,
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+            )
+            if response.status_code == 304:
+                result.not_modified = True
+                return result
+
+            declared = response.headers.get("Content-Length", "")
+            if declared.isdigit() and int(declared) > max_bytes:
+                # Отказ до чтения тела
+                raise ValueError(f"Слишком большой медиа-файл: {declared} bytes (Content-Length)")
+
+            with SpoolWriter(self.spool_dir) as writer:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    writer.write(chunk)
+                    if writer.size_bytes > max_bytes:
+                        raise ValueError(f"Слишком большой медиа-файл: более {max_bytes} bytes")
+                result.spooled = writer.finish()
+            return result
+
+    def fetch(
+        self,
+        url: str,
+        *,
+        headers: dict[str, str] | None = None,
+        timeout_sec: int | None = None,
+        max_bytes: int | None = None,
+        max_retries: int | None = None,
+    ) -> DownloadResult:
+        attempts = max(1, max_retries if max_retries is not None else self.max_retries)
+        timeout = timeout_sec if timeout_sec is not None else self.timeout_sec
+        limit = max_bytes if max_bytes is not None else self.max_bytes
+
+        attempt = 1
+        while True:
+            try:
+                return self._request(url, headers, timeout, limit)
+            except requests.RequestException as exc:
+                if attempt >= attempts or not self._is_retryable(exc):
+                    raise
+                # Спим вне слота хоста, чтобы не блокировать соседние загрузки
+                time.sleep(self.backoff_delay(attempt))
+                attempt += 1
+
+    def submit(self, url: str, headers: dict[str, str] | None = None) -> Future[DownloadResult]:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="grab-media",
+                )
+            return self._executor.submit(self.fetch, url, headers=headers)
+
+    def close(self) -> None:
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+    def __enter__(self) -> MediaDownloader:
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:  # noqa: ANN001
+        self.close()
@@ -3,21 +3,62 @@
 import hashlib
 import json
 import mimetypes
-import time
-from datetime import datetime, timezone
+import os
+import sqlite3
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from urllib.parse import urlparse
 
-import requests
-
 from grab.core.db import GrabRepository
 
+from .downloader import DownloadResult, MediaDownloader
+from .phash import (
+    DEFAULT_MAX_DISTANCE,
+    DuplicateGroup,
+    ImageHash,
+    cluster_near_duplicates,
+    dhash_file,
+    hamming,
+)
+from .spool import SpooledFile
+from .store import BLOB_DIR_NAME, BlobStore, GcStats
+from .thumbs import DEFAULT_THUMB_PX, THUMB_DIR_NAME, ThumbnailGenerator, ThumbnailStats
+from .verify import VerifyStats, hash_file, hash_files
+
+META_LOG_NAME = "meta.jsonl"
+
+
+@dataclass(slots=True)
+class PendingDownload:
+    store_code: str
+    order_ref: str | None
+    item_id: int
+    url: str
+    source: str
+    future: Future[DownloadResult] | None
+    cached: sqlite3.Row | None = None
+
 
 class MediaManager:
-    def __init__(self, repository: GrabRepository, media_root: Path):
+    def __init__(
+        self,
+        repository: GrabRepository,
+        media_root: Path,
+        downloader: MediaDownloader | None = None,
+        url_cache_ttl_sec: int = 7 * 24 * 3600,
+        thumb_px: int = DEFAULT_THUMB_PX,
+    ):
         self.repository = repository
         self.media_root = media_root
+        self.downloader = downloader or MediaDownloader()
+        self.url_cache_ttl_sec = url_cache_ttl_sec
+        # Незавершенные загрузки по URL: одна ссылка в нескольких позициях качается один раз
+        self._inflight: dict[str, Future[DownloadResult]] = {}
         self.media_root.mkdir(parents=True, exist_ok=True)
+        self.blob_store = BlobStore(self.media_root / BLOB_DIR_NAME)
+        self.thumbnails = ThumbnailGenerator(self.media_root / THUMB_DIR_NAME, self.blob_store, max_px=thumb_px)
 
     @staticmethod
     def _sha256(data: bytes) -> str:
@@ -58,45 +99,74 @@ class MediaManager:
         return f"{sha256_value[:20]}{ext}"
 
     def _append_meta(self, item_dir: Path, meta_entry: dict) -> None:
-        meta_path = item_dir / "meta.json"
-        if meta_path.exists():
-            current = json.loads(meta_path.read_text(encoding="utf-8"))
-            if not isinstance(current, list):
-                current = [current]
-        else:
-            current = []
-        current.append(meta_entry)
-        meta_path.write_text(json.dumps(current, ensure_ascii=False, indent=2), encoding="utf-8")
+        # O(1): одна строка JSONL за один write в режиме append, без перечитывания файла
+        line = (json.dumps(meta_entry, ensure_ascii=False) + "\n").encode("utf-8")
+        with (item_dir / META_LOG_NAME).open("a+b") as fh:
+            size = fh.seek(0, os.SEEK_END)
+            if size:
+                # Оборванная строка после аварии: новую запись начинаем с новой строки, иначе пропадут обе
+                fh.seek(size - 1)
+                if fh.read(1) != b"\n":
+                    line = b"\n" + line
+            fh.write(line)
 
-    def save_bytes(
+    @staticmethod
+    def read_meta(item_dir: Path) -> list[dict]:
+        meta_path = item_dir / META_LOG_NAME
+        if not meta_path.exists():
+            return []
+        entries: list[dict] = []
+        for line in meta_path.read_text(encoding="utf-8").splitlines():
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                # Оборванная строка после аварийного завершения
+                continue
+        return entries
+
+    def export_meta_files(self) -> int:
+        """
+        Пересобирает meta.json по позициям из БД (media.meta_json — источник истины).
+        Возвращает количество записанных файлов.
+        """
+        written = 0
+        item_key: tuple[str, str, int] | None = None
+        entries: list[dict] = []
+        for row in self.repository.iter_media_meta():
+            key = (row["store_code"], row["order_ref"], int(row["related_item_id"]))
+            if item_key is not None and key != item_key:
+                self._write_meta_file(item_key, entries)
+                written += 1
+                entries = []
+            item_key = key
+            entries.append(json.loads(row["meta_json"]))
+        if item_key is not None:
+            self._write_meta_file(item_key, entries)
+            written += 1
+        return written
+
+    def _write_meta_file(self, item_key: tuple[str, str, int], entries: list[dict]) -> None:
+        store_code, order_ref, item_id = item_key
+        item_dir = self._build_item_dir(store_code, order_ref, str(item_id))
+        item_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = item_dir / "meta.json.tmp"
+        tmp_path.write_text(json.dumps(entries, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp_path, item_dir / "meta.json")
+
+    def _register_media(
         self,
         *,
-        store_code: str,
-        order_ref: str | None,
+        item_dir: Path,
         item_id: int,
         filename: str | None,
-        content: bytes,
         mime: str | None,
         source_url: str | None,
         source: str,
+        sha256_value: str,
+        local_path: Path,
+        size_bytes: int,
     ) -> str:
-        sha256_value = self._sha256(content)
-        existing = self.repository.find_media_by_sha256(sha256_value)
-
-        item_dir = self._build_item_dir(store_code, order_ref, str(item_id))
-        bucket = self._detect_bucket(mime, filename, source_url)
-        target_dir = item_dir / bucket
-        target_dir.mkdir(parents=True, exist_ok=True)
-
-        if existing and existing["local_path_abs"] and Path(existing["local_path_abs"]).exists():
-            local_path = Path(existing["local_path_abs"]).resolve()
-            size_bytes = local_path.stat().st_size
-        else:
-            file_name = self._pick_filename(sha256_value, filename, mime)
-            local_path = (target_dir / file_name).resolve()
-            local_path.write_bytes(content)
-            size_bytes = len(content)
-
+        item_dir.mkdir(parents=True, exist_ok=True)
         downloaded_at = datetime.now(timezone.utc).isoformat()
         meta_entry = {
             "source": source,
@@ -122,6 +192,439 @@ class MediaManager:
         )
         return str(local_path)
 
+    def _ensure_blob(self, sha256_value: str) -> bool:
+        if self.blob_store.contains(sha256_value):
+            return True
+        # Файл мог остаться от раскладки до CAS: забираем его в хранилище
+        existing = self.repository.find_media_by_sha256(sha256_value)
+        if existing and existing["local_path_abs"] and Path(existing["local_path_abs"]).is_file():
+            self.blob_store.adopt(sha256_value, Path(existing["local_path_abs"]))
+            return True
+        return False
+
+    def _materialize_view(
+        self,
+        *,
+        item_dir: Path,
+        sha256_value: str,
+        filename: str | None,
+        mime: str | None,
+        source_url: str | None,
+    ) -> Path:
+        bucket = self._detect_bucket(mime, filename, source_url)
+        target_dir = (item_dir / bucket).resolve()
+        view_path = target_dir / self._pick_filename(sha256_value, filename, mime)
+        self.blob_store.link(sha256_value, view_path)
+        return view_path
+
+    def save_bytes(
+        self,
+        *,
+        store_code: str,
+        order_ref: str | None,
+        item_id: int,
+        filename: str | None,
+        content: bytes | SpooledFile,
+        mime: str | None,
+        source_url: str | None,
+        source: str,
+    ) -> str:
+        if isinstance(content, SpooledFile):
+            sha256_value = content.sha256
+            size_bytes = content.size_bytes
+        else:
+            sha256_value = self._sha256(content)
+            size_bytes = len(content)
+
+        if self._ensure_blob(sha256_value):
+            if isinstance(content, SpooledFile):
+                content.discard()
+        elif isinstance(content, SpooledFile):
+            self.blob_store.put_spooled(content)
+        else:
+            self.blob_store.put_bytes(sha256_value, content)
+
+        item_dir = self._build_item_dir(store_code, order_ref, str(item_id))
+        local_path = self._materialize_view(
+            item_dir=item_dir,
+            sha256_value=sha256_value,
+            filename=filename,
+            mime=mime,
+            source_url=source_url,
+        )
+        return self._register_media(
+            item_dir=item_dir,
+            item_id=item_id,
+            filename=filename,
+            mime=mime,
+            source_url=source_url,
+            source=source,
+            sha256_value=sha256_value,
+            local_path=local_path,
+            size_bytes=size_bytes,
+        )
+
+    def _lookup_url_cache(self, url: str) -> sqlite3.Row | None:
+        # Кэш полезен, только если содержимое с этим sha256 еще есть в хранилище
+        cached = self.repository.get_media_url_cache(url)
+        if cached is None or not self._ensure_blob(cached["sha256"]):
+            return None
+        return cached
+
+    def _is_fresh(self, cached: sqlite3.Row) -> bool:
+        if self.url_cache_ttl_sec <= 0:
+            return False
+        checked_at = datetime.fromisoformat(cached["checked_at"])
+        age = datetime.now(timezone.utc) - checked_at
+        return age.total_seconds() < self.url_cache_ttl_sec
+
+    @staticmethod
+    def _conditional_headers(cached: sqlite3.Row | None) -> dict[str, str]:
+        headers: dict[str, str] = {}
+        if cached is None:
+            return headers
+        if cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+        return headers
+
+    def _link_cached(self, pending: PendingDownload) -> str:
+        cached = pending.cached
+        item_dir = self._build_item_dir(pending.store_code, pending.order_ref, str(pending.item_id))
+        filename = Path(urlparse(pending.url).path).name or None
+        local_path = self._materialize_view(
+            item_dir=item_dir,
+            sha256_value=cached["sha256"],
+            filename=filename,
+            mime=cached["mime"],
+            source_url=pending.url,
+        )
+        return self._register_media(
+            item_dir=item_dir,
+            item_id=pending.item_id,
+            filename=filename,
+            mime=cached["mime"],
+            source_url=pending.url,
+            source=pending.source,
+            sha256_value=cached["sha256"],
+            local_path=local_path,
+            size_bytes=self.blob_store.blob_path(cached["sha256"]).stat().st_size,
+        )
+
+    def collect_garbage(self, *, workers: int = 8, min_age_sec: float = 3600, dry_run: bool = False) -> GcStats:
+        referenced = set(self.repository.iter_media_sha256())
+        return self.blob_store.collect_garbage(
+            referenced,
+            workers=workers,
+            min_age_sec=min_age_sec,
+            dry_run=dry_run,
+        )
+
+    def thumbnail_for(self, sha256_value: str, mime: str | None, local_path: str | None = None) -> Path | None:
+        # Превью по требованию: рендерится при первом обращении и дальше берется из кэша
+        kind = self._detect_bucket(mime, local_path, None)
+        path, _ = self.thumbnails.ensure(sha256_value, kind)
+        return path
+
+    def generate_thumbnails(self, *, workers: int = 4) -> tuple[dict[int, Path], ThumbnailStats]:
+        """
+        Строит недостающие превью для всех картинок и видео.
+        Возвращает превью первого медиа каждой позиции (item_id -> путь) и счетчики.
+        """
+        first_by_item: dict[int, str] = {}
+        kinds: dict[str, str] = {}
+        for row in self.repository.iter_media_thumbnail_sources():
+            kind = self._detect_bucket(row["mime"], row["local_path_abs"], None)
+            if kind == "files":
+                continue
+            kinds.setdefault(row["sha256"], kind)
+            first_by_item.setdefault(int(row["related_item_id"]), row["sha256"])
+        paths, stats = self.thumbnails.generate_many(kinds.items(), workers=workers)
+        item_thumbs = {item_id: paths[sha] for item_id, sha in first_by_item.items() if sha in paths}
+        return item_thumbs, stats
+
+    def compute_phashes(self, *, workers: int = 4) -> int:
+        # Хэш считается один раз на sha256 и хранится в media_phash
+        known = self.repository.get_media_phashes()
+        pending: dict[str, None] = {}
+        for row in self.repository.iter_media_thumbnail_sources():
+            sha256_value = row["sha256"]
+            if sha256_value in known or sha256_value in pending:
+                continue
+            if self._detect_bucket(row["mime"], row["local_path_abs"], None) == "images":
+                pending[sha256_value] = None
+
+        def compute(sha256_value: str) -> tuple[str, ImageHash | None]:
+            try:
+                return sha256_value, dhash_file(self.blob_store.blob_path(sha256_value))
+            except Exception:  # noqa: BLE001
+                return sha256_value, None
+
+        rows: list[tuple[str, str, int, int]] = []
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="grab-phash") as executor:
+            for sha256_value, image_hash in executor.map(compute, pending):
+                if image_hash is not None:
+                    rows.append((sha256_value, f"{image_hash.dhash:016x}", image_hash.width, image_hash.height))
+        self.repository.upsert_media_phashes(rows)
+        return len(rows)
+
+    def find_near_duplicates(
+        self,
+        *,
+        max_distance: int = DEFAULT_MAX_DISTANCE,
+        workers: int = 4,
+    ) -> list[DuplicateGroup]:
+        """
+        Группы почти одинаковых картинок (dHash в пределах max_distance бит).
+        Канонической считается копия с наибольшим разрешением.
+        """
+        self.compute_phashes(workers=workers)
+        phashes = self.repository.get_media_phashes()
+        referenced = set(self.repository.iter_media_sha256())
+        values = {sha: int(row["dhash"], 16) for sha, row in phashes.items() if sha in referenced}
+
+        groups: list[DuplicateGroup] = []
+        pending = list(values.items())
+        while pending:
+            rest: list[tuple[str, int]] = []
+            for members in cluster_near_duplicates(pending, max_distance):
+                canonical = max(members, key=lambda sha: (phashes[sha]["width"] * phashes[sha]["height"], sha))
+                # Компонента связности транзитивна: в цепочке A~B~C копия C может быть далеко от канонической.
+                # Дубликатами считаем только близкие к канонической, остальных разбираем следующим проходом
+                duplicates = []
+                for sha in members:
+                    if sha == canonical:
+                        continue
+                    if hamming(values[canonical], values[sha]) <= max_distance:
+                        duplicates.append(sha)
+                    else:
+                        rest.append((sha, values[sha]))
+                groups.append(DuplicateGroup(canonical=canonical, duplicates=duplicates))
+            pending = rest
+        return groups
+
+    def consolidate_duplicates(self, groups: list[DuplicateGroup]) -> int:
+        """
+        Перевешивает записи media дубликатов на канонический blob.
+        Старые blob-ы остаются без ссылок и удаляются `grab media gc`.
+        """
+        moved = 0
+        for group in groups:
+            canonical_row = self.repository.find_media_by_sha256(group.canonical)
+            if canonical_row is None or not self._ensure_blob(group.canonical):
+                continue
+            size_bytes = self.blob_store.blob_path(group.canonical).stat().st_size
+            for sha256_value in group.duplicates:
+                for row in self.repository.list_media_by_sha256(sha256_value):
+                    old_view = Path(row["local_path_abs"])
+                    meta = json.loads(row["meta_json"]) if row["meta_json"] else {}
+                    # Папку берем от позиции строки: старые записи дедупликации по sha256
+                    # могут указывать на файл в папке другой позиции
+                    item_dir = self._build_item_dir(row["store_code"], row["order_ref"], str(row["related_item_id"]))
+                    local_path = self._materialize_view(
+                        item_dir=item_dir,
+                        sha256_value=group.canonical,
+                        filename=None,
+                        mime=canonical_row["mime"],
+                        source_url=row["source_url"],
+                    )
+                    self._register_media(
+                        item_dir=item_dir,
+                        item_id=row["related_item_id"],
+                        filename=meta.get("filename"),
+                        mime=canonical_row["mime"],
+                        source_url=row["source_url"],
+                        source=row["source"] or "media_dupes",
+                        sha256_value=group.canonical,
+                        local_path=local_path,
+                        size_bytes=size_bytes,
+                    )
+                    self.repository.delete_media(row["id"])
+                    # Чужие файлы не трогаем: представление удаляется только из папки этой позиции
+                    if old_view != local_path and old_view.parent.resolve().is_relative_to(item_dir.resolve()):
+                        old_view.unlink(missing_ok=True)
+                    moved += 1
+                self.repository.repoint_media_url_cache(sha256_value, group.canonical)
+        return moved
+
+    def verify_media(
+        self,
+        *,
+        workers: int = 4,
+        recheck_after_sec: float = 24 * 3600,
+        repair: bool = True,
+        batch_size: int = 500,
+    ) -> VerifyStats:
+        """
+        Проверяет наличие, размер и sha256 файлов из таблицы media.
+        Результат пишется в media.verified_at/verify_status после каждой пачки,
+        поэтому повторный запуск пропускает строки, проверенные за recheck_after_sec.
+        """
+        stats = VerifyStats()
+        now = datetime.now(timezone.utc)
+        verified_before = (now - timedelta(seconds=recheck_after_sec)).isoformat()
+        after_id = 0
+        while True:
+            rows = self.repository.fetch_media_for_verify(after_id, verified_before, batch_size)
+            if not rows:
+                break
+            after_id = rows[-1]["id"]
+
+            statuses: dict[int, str] = {}
+            to_hash: list[Path] = []
+            for row in rows:
+                path = Path(row["local_path_abs"])
+                try:
+                    size = path.stat().st_size
+                except OSError:
+                    statuses[row["id"]] = "missing"
+                    continue
+                if row["size_bytes"] is not None and size != row["size_bytes"]:
+                    # Размер не совпал: хэш считать незачем
+                    statuses[row["id"]] = "corrupt"
+                    continue
+                to_hash.append(path)
+
+            digests = hash_files(to_hash, workers=workers)
+            results: list[tuple[int, str]] = []
+            for row in rows:
+                status = statuses.get(row["id"])
+                if status is None:
+                    status = "ok" if digests.get(Path(row["local_path_abs"])) == row["sha256"] else "corrupt"
+                if status != "ok" and repair:
+                    status = self._repair_media(row, status)
+                setattr(stats, status, getattr(stats, status) + 1)
+                results.append((row["id"], status))
+            stats.checked += len(rows)
+            self.repository.mark_media_verified(results, verified_at=datetime.now(timezone.utc).isoformat())
+        return stats
+
+    def _find_good_copy(self, sha256_value: str, broken_path: Path) -> Path | None:
+        # Кандидаты: сам blob и файлы других позиций с тем же sha256
+        candidates = [self.blob_store.blob_path(sha256_value)]
+        candidates += [Path(row["local_path_abs"]) for row in self.repository.list_media_by_sha256(sha256_value)]
+        seen: set[Path] = set()
+        for candidate in candidates:
+            if candidate in seen or not candidate.is_file():
+                continue
+            seen.add(candidate)
+            if broken_path.exists() and os.path.samefile(candidate, broken_path):
+                continue
+            if hash_file(candidate) == sha256_value:
+                return candidate
+        return None
+
+    def _repair_media(self, row: sqlite3.Row, status: str) -> str:
+        sha256_value = row["sha256"]
+        view_path = Path(row["local_path_abs"])
+        blob_path = self.blob_store.blob_path(sha256_value)
+        good_copy = self._find_good_copy(sha256_value, view_path)
+
+        if good_copy is not None:
+            if not (blob_path.exists() and os.path.samefile(good_copy, blob_path)):
+                blob_path.unlink(missing_ok=True)
+                self.blob_store.adopt(sha256_value, good_copy)
+            view_path.unlink(missing_ok=True)
+            self.blob_store.link(sha256_value, view_path)
+            return "repaired"
+
+        if not row["source_url"]:
+            return status
+
+        # Целых копий нет: убираем битые файлы и кэш ссылки, чтобы воркер скачал заново
+        view_path.unlink(missing_ok=True)
+        blob_path.unlink(missing_ok=True)
+        self.repository.delete_media_url_cache(row["source_url"])
+        self.repository.enqueue_media_job(
+            item_id=row["related_item_id"],
+            url=row["source_url"],
+            store_code=row["store_code"],
+            order_ref=row["order_ref"],
+            source=row["source"] or "media_verify",
+            next_retry_at=datetime.now(timezone.utc).isoformat(),
+            force=True,
+        )
+        return "requeued"
+
+    def submit_download(
+        self,
+        *,
+        store_code: str,
+        order_ref: str | None,
+        item_id: int,
+        url: str,
+        source: str,
+    ) -> PendingDownload:
+        cached = self._lookup_url_cache(url)
+        future = None
+        if cached is None or not self._is_fresh(cached):
+            future = self._inflight.get(url)
+            if future is None:
+                future = self.downloader.submit(url, headers=self._conditional_headers(cached))
+                self._inflight[url] = future
+        return PendingDownload(
+            store_code=store_code,
+            order_ref=order_ref,
+            item_id=item_id,
+            url=url,
+            source=source,
+            future=future,
+            cached=cached,
+        )
+
+    def complete_download(self, pending: PendingDownload) -> str:
+        # Сохранение и запись в БД идут в вызывающем потоке: sqlite-соединение не потокобезопасно
+        if pending.future is None:
+            return self._link_cached(pending)
+        try:
+            result = pending.future.result()
+        finally:
+            # Первый завершивший общую загрузку сохраняет файл, остальные ссылаются на него
+            is_owner = self._inflight.get(pending.url) is pending.future
+            if is_owner:
+                del self._inflight[pending.url]
+        if is_owner:
+            return self._save_download(pending, result)
+        pending.cached = self._lookup_url_cache(pending.url)
+        if pending.cached is None:
+            raise ValueError(f"Сервер не вернул содержимое: {pending.url}")
+        return self._link_cached(pending)
+
+    def _save_download(self, pending: PendingDownload, result: DownloadResult) -> str:
+        checked_at = datetime.now(timezone.utc).isoformat()
+        if result.not_modified and pending.cached is not None:
+            self.repository.touch_media_url_cache(
+                pending.url,
+                checked_at=checked_at,
+                etag=result.etag,
+                last_modified=result.last_modified,
+            )
+            return self._link_cached(pending)
+        if result.spooled is None:
+            raise ValueError(f"Сервер не вернул содержимое: {pending.url}")
+
+        local_path = self.save_bytes(
+            store_code=pending.store_code,
+            order_ref=pending.order_ref,
+            item_id=pending.item_id,
+            filename=result.filename,
+            content=result.spooled,
+            mime=result.mime,
+            source_url=result.url,
+            source=pending.source,
+        )
+        self.repository.upsert_media_url_cache(
+            url=pending.url,
+            sha256_value=result.spooled.sha256,
+            etag=result.etag,
+            last_modified=result.last_modified,
+            mime=result.mime,
+            size_bytes=result.spooled.size_bytes,
+            fetched_at=checked_at,
+        )
+        return local_path
+
     def download_from_url(
         self,
         *,
@@ -134,37 +637,24 @@ class MediaManager:
         max_bytes: int = 50_000_000,
         max_retries: int = 2,
     ) -> str | None:
-        last_exc: Exception | None = None
-        for attempt in range(1, max_retries + 1):
-            try:
-                response = requests.get(url, timeout=timeout_sec)
-                response.raise_for_status()
-
-                content = response.content
-                if len(content) > max_bytes:
-                    raise ValueError(f"Слишком большой медиа-файл: {len(content)} bytes")
-
-                parsed = urlparse(url)
-                filename = Path(parsed.path).name or None
-                mime = response.headers.get("Content-Type")
-
-                return self.save_bytes(
-                    store_code=store_code,
-                    order_ref=order_ref,
-                    item_id=item_id,
-                    filename=filename,
-                    content=content,
-                    mime=mime,
-                    source_url=url,
-                    source=source,
-                )
-            except requests.RequestException as exc:
-                last_exc = exc
-                if attempt < max_retries:
-                    time.sleep(1 + attempt)
-                else:
-                    break
-
-        if last_exc:
-            raise last_exc
-        return None
+        cached = self._lookup_url_cache(url)
+        pending = PendingDownload(
+            store_code=store_code,
+            order_ref=order_ref,
+            item_id=item_id,
+            url=url,
+            source=source,
+            future=None,
+            cached=cached,
+        )
+        if cached is not None and self._is_fresh(cached):
+            return self._link_cached(pending)
+
+        result = self.downloader.fetch(
+            url,
+            headers=self._conditional_headers(cached),
+            timeout_sec=timeout_sec,
+            max_bytes=max_bytes,
+            max_retries=max_retries,
+        )
+        return self._save_download(pending, result)
@@ -0,0 +1,119 @@
+﻿from __future__ import annotations
+
+from collections.abc import Iterable
+from dataclasses import dataclass
+from pathlib import Path
+
+from .thumbs import load_pillow
+
+DHASH_SIZE = 8
+DEFAULT_MAX_DISTANCE = 6
+
+
+@dataclass(slots=True)
+class ImageHash:
+    dhash: int
+    width: int
+    height: int
+
+
+@dataclass(slots=True)
+class DuplicateGroup:
+    canonical: str
+    duplicates: list[str]
+
+
+def hamming(left: int, right: int) -> int:
+    return (left ^ right).bit_count()
+
+
+def dhash_file(path: Path, hash_size: int = DHASH_SIZE) -> ImageHash | None:
+    """
+    Difference hash: картинка сжимается до (hash_size+1) x hash_size в оттенках серого,
+    каждый бит — «левый пиксель ярче правого». Перекодирование и смена размера
+    почти не меняют хэш, поэтому копии с CDN разного размера оказываются рядом по Хэммингу.
+    """
+    image_module = load_pillow()
+    if image_module is None:
+        return None
+    with image_module.open(path) as image:
+        width, height = image.size
+        image.draft("L", (hash_size * 4, hash_size * 4))
+        small = image.convert("L").resize((hash_size + 1, hash_size), image_module.Resampling.LANCZOS)
+        pixels = small.tobytes()
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return ImageHash(dhash=value, width=width, height=height)
+
+
+class BKTree:
+    """
+    BK-дерево по расстоянию Хэмминга: поиск соседей в радиусе r обходит только
+    поддеревья с ребром в [d - r, d + r], а не все пары хэшей.
+    """
+
+    def __init__(self) -> None:
+        # Узел: [хэш, ключи с этим хэшем, {расстояние: дочерний узел}]
+        self._root: list | None = None
+        self.size = 0
+
+    def add(self, value: int, key: str) -> None:
+        self.size += 1
+        if self._root is None:
+            self._root = [value, [key], {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(key)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [key], {}]
+                return
+            node = child
+
+    def search(self, value: int, max_distance: int) -> list[tuple[int, str]]:
+        found: list[tuple[int, str]] = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= max_distance:
+                found.extend((distance, key) for key in node[1])
+            for edge, child in node[2].items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    stack.append(child)
+        return found
+
+
+def cluster_near_duplicates(hashes: Iterable[tuple[str, int]], max_distance: int) -> list[list[str]]:
+    # Объединяем соседей в компоненты связности (union-find), группы из 2+ ключей
+    tree = BKTree()
+    items = list(hashes)
+    for key, value in items:
+        tree.add(value, key)
+
+    parent = {key: key for key, _ in items}
+
+    def find(key: str) -> str:
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    for key, value in items:
+        for _, other in tree.search(value, max_distance):
+            root_a, root_b = find(key), find(other)
+            if root_a != root_b:
+                parent[root_b] = root_a
+
+    groups: dict[str, list[str]] = {}
+    for key, _ in items:
+        groups.setdefault(find(key), []).append(key)
+    return [sorted(group) for group in groups.values() if len(group) > 1]
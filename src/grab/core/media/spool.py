@@ -0,0 +1,79 @@
+﻿from __future__ import annotations
+
+import base64
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+
+CHUNK_SIZE = 1024 * 1024
+# Кратно 4, чтобы каждый кусок base64 декодировался независимо
+BASE64_CHUNK_CHARS = 4 * 256 * 1024
+
+
+@dataclass(slots=True)
+class SpooledFile:
+    path: Path
+    sha256: str
+    size_bytes: int
+
+    def discard(self) -> None:
+        self.path.unlink(missing_ok=True)
+
+
+class SpoolWriter:
+    """
+    Временный файл в spool-папке с потоковым подсчетом sha256 и размера.
+    Содержимое не держится в памяти: пишем кусками и сразу хэшируем.
+    """
+
+    def __init__(self, spool_dir: Path):
+        spool_dir.mkdir(parents=True, exist_ok=True)
+        fd, name = tempfile.mkstemp(dir=spool_dir, suffix=".spool")
+        self.path = Path(name)
+        self.size_bytes = 0
+        self._fh = os.fdopen(fd, "wb")
+        self._digest = hashlib.sha256()
+
+    def write(self, chunk: bytes) -> None:
+        self._fh.write(chunk)
+        self._digest.update(chunk)
+        self.size_bytes += len(chunk)
+
+    def finish(self) -> SpooledFile:
+        self._fh.close()
+        return SpooledFile(path=self.path, sha256=self._digest.hexdigest(), size_bytes=self.size_bytes)
+
+    def abort(self) -> None:
+        self._fh.close()
+        self.path.unlink(missing_ok=True)
+
+    def __enter__(self) -> SpoolWriter:
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:  # noqa: ANN001
+        if exc_type is not None:
+            self.abort()
+        elif not self._fh.closed:
+            self._fh.close()
+
+
+def spool_bytes(spool_dir: Path, data: bytes) -> SpooledFile:
+    view = memoryview(data)
+    with SpoolWriter(spool_dir) as writer:
+        for offset in range(0, len(view), CHUNK_SIZE):
+            writer.write(view[offset : offset + CHUNK_SIZE])
+        return writer.finish()
+
+
+def spool_base64(spool_dir: Path, encoded: str, urlsafe: bool = True) -> SpooledFile:
+    decode = base64.urlsafe_b64decode if urlsafe else base64.b64decode
+    with SpoolWriter(spool_dir) as writer:
+        for offset in range(0, len(encoded), BASE64_CHUNK_CHARS):
+            chunk = encoded[offset : offset + BASE64_CHUNK_CHARS]
+            if offset + BASE64_CHUNK_CHARS >= len(encoded):
+                # Gmail иногда отдает base64 без паддинга
+                chunk += "=" * (-len(chunk) % 4)
+            writer.write(decode(chunk.encode("ascii")))
+        return writer.finish()
@@ -0,0 +1,142 @@
+﻿from __future__ import annotations
+
+import os
+import shutil
+import time
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from .spool import SpooledFile
+
+BLOB_DIR_NAME = "_blobs"
+
+
+@dataclass(slots=True)
+class GcStats:
+    scanned: int = 0
+    removed: int = 0
+    freed_bytes: int = 0
+    removed_paths: list[str] = field(default_factory=list)
+
+
+class BlobStore:
+    """
+    Контентно-адресуемое хранилище: каждый файл лежит один раз
+    в `_blobs/<sha[:2]>/<sha[2:4]>/<sha>`. Папки позиций получают hardlink
+    (или symlink, или копию, если ФС не умеет ссылки).
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def blob_path(self, sha256_value: str) -> Path:
+        return self.root / sha256_value[:2] / sha256_value[2:4] / sha256_value
+
+    def contains(self, sha256_value: str) -> bool:
+        return self.blob_path(sha256_value).is_file()
+
+    def put_spooled(self, spooled: SpooledFile) -> Path:
+        target = self.blob_path(spooled.sha256)
+        if target.exists():
+            spooled.discard()
+            return target
+        target.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.replace(spooled.path, target)
+        except OSError:
+            shutil.move(str(spooled.path), str(target))
+        return target
+
+    def put_bytes(self, sha256_value: str, data: bytes) -> Path:
+        target = self.blob_path(sha256_value)
+        if target.exists():
+            return target
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = target.with_name(f"{target.name}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, target)
+        return target
+
+    def adopt(self, sha256_value: str, existing_file: Path) -> Path:
+        # Файл из старой раскладки (до CAS) становится blob-ом без копирования, если получится
+        target = self.blob_path(sha256_value)
+        if not target.exists():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            self._link_or_copy(existing_file, target, allow_symlink=False)
+        return target
+
+    @staticmethod
+    def _link_or_copy(source: Path, target: Path, allow_symlink: bool = True) -> None:
+        try:
+            os.link(source, target)
+            return
+        except OSError:
+            pass
+        if allow_symlink:
+            try:
+                os.symlink(source, target)
+                return
+            except OSError:
+                pass
+        shutil.copy2(source, target)
+
+    def link(self, sha256_value: str, view_path: Path) -> None:
+        blob = self.blob_path(sha256_value)
+        if view_path.exists():
+            if os.path.samefile(view_path, blob):
+                return
+            view_path.unlink()
+        view_path.parent.mkdir(parents=True, exist_ok=True)
+        self._link_or_copy(blob, view_path)
+
+    def _fanout_dirs(self) -> list[Path]:
+        if not self.root.exists():
+            return []
+        return [path for path in self.root.iterdir() if path.is_dir()]
+
+    def iter_blobs(self) -> Iterator[Path]:
+        for fanout in self._fanout_dirs():
+            yield from (path for path in fanout.glob("*/*") if path.is_file())
+
+    def collect_garbage(
+        self,
+        referenced: set[str],
+        *,
+        workers: int = 8,
+        min_age_sec: float = 3600,
+        dry_run: bool = False,
+    ) -> GcStats:
+        """
+        Удаляет blob-ы, на sha256 которых нет ссылок в БД.
+        Свежие файлы (моложе min_age_sec) не трогаем: их мог только что положить идущий sync.
+        """
+        cutoff = time.time() - min_age_sec
+
+        def sweep(fanout: Path) -> GcStats:
+            local = GcStats()
+            for path in fanout.glob("*/*"):
+                if not path.is_file() or path.name.endswith(".tmp"):
+                    continue
+                local.scanned += 1
+                if path.name in referenced:
+                    continue
+                stat = path.stat()
+                if stat.st_mtime > cutoff:
+                    continue
+                if not dry_run:
+                    path.unlink(missing_ok=True)
+                local.removed += 1
+                local.freed_bytes += stat.st_size if stat.st_nlink <= 1 else 0
+                local.removed_paths.append(str(path))
+            return local
+
+        total = GcStats()
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="grab-gc") as executor:
+            for partial in executor.map(sweep, self._fanout_dirs()):
+                total.scanned += partial.scanned
+                total.removed += partial.removed
+                total.freed_bytes += partial.freed_bytes
+                total.removed_paths.extend(partial.removed_paths)
+        return total
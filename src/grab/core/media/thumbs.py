@@ -0,0 +1,138 @@
+﻿from __future__ import annotations
+
+import os
+import shutil
+import subprocess
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from types import ModuleType
+
+from .store import BlobStore
+
+THUMB_DIR_NAME = "_thumbs"
+DEFAULT_THUMB_PX = 256
+
+
+@dataclass(slots=True)
+class ThumbnailStats:
+    generated: int = 0
+    cached: int = 0
+    skipped: int = 0
+    failed: int = 0
+
+
+def load_pillow() -> ModuleType | None:
+    # Pillow — необязательная зависимость (pip install -e .[thumbs])
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    return Image
+
+
+def pillow_available() -> bool:
+    return load_pillow() is not None
+
+
+class ThumbnailGenerator:
+    """
+    Превью для blob-ов: картинки уменьшаются через Pillow, для видео первый кадр
+    берется через ffmpeg (если он есть в PATH). Кэш — `_thumbs/<sha[:2]>/<sha>-<px>.jpg`,
+    поэтому одинаковое содержимое у разных позиций рендерится один раз.
+    """
+
+    def __init__(self, root: Path, blob_store: BlobStore, max_px: int = DEFAULT_THUMB_PX):
+        self.root = root
+        self.blob_store = blob_store
+        self.max_px = max_px
+        self.ffmpeg_path = shutil.which("ffmpeg")
+
+    def thumb_path(self, sha256_value: str) -> Path:
+        return self.root / sha256_value[:2] / f"{sha256_value}-{self.max_px}.jpg"
+
+    def _render_image(self, source: Path, target: Path) -> bool:
+        image_module = load_pillow()
+        if image_module is None:
+            return False
+        with image_module.open(source) as image:
+            # draft: JPEG декодируется сразу в уменьшенном масштабе
+            image.draft("RGB", (self.max_px, self.max_px))
+            image.thumbnail((self.max_px, self.max_px))
+            image.convert("RGB").save(target, format="JPEG", quality=80, optimize=True)
+        return True
+
+    def _render_poster(self, source: Path, target: Path) -> bool:
+        if self.ffmpeg_path is None:
+            return False
+        scale = f"scale='min({self.max_px},iw)':'min({self.max_px},ih)':force_original_aspect_ratio=decrease"
+        subprocess.run(
+            [
+                self.ffmpeg_path,
+                "-y",
+                "-loglevel",
+                "error",
+                "-i",
+                str(source),
+                "-frames:v",
+                "1",
+                "-vf",
+                scale,
+                "-f",
+                "image2",
+                str(target),
+            ],
+            check=True,
+            capture_output=True,
+            timeout=60,
+        )
+        return target.exists()
+
+    def ensure(self, sha256_value: str, kind: str) -> tuple[Path | None, str]:
+        """
+        Возвращает путь к превью и исход: cached, generated, skipped (нет инструмента
+        или тип без превью) или failed.
+        """
+        target = self.thumb_path(sha256_value)
+        if target.exists():
+            return target, "cached"
+        source = self.blob_store.blob_path(sha256_value)
+        if kind not in {"images", "videos"} or not source.is_file():
+            return None, "skipped"
+
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = target.with_name(f"{target.stem}.{os.getpid()}.tmp.jpg")
+        render = self._render_image if kind == "images" else self._render_poster
+        try:
+            rendered = render(source, tmp_path)
+        except Exception:  # noqa: BLE001
+            tmp_path.unlink(missing_ok=True)
+            return None, "failed"
+        if not rendered:
+            tmp_path.unlink(missing_ok=True)
+            return None, "skipped"
+        os.replace(tmp_path, target)
+        return target, "generated"
+
+    def generate_many(
+        self,
+        items: Iterable[tuple[str, str]],
+        *,
+        workers: int = 4,
+    ) -> tuple[dict[str, Path], ThumbnailStats]:
+        # Pillow отпускает GIL при декодировании/ресайзе, ffmpeg — отдельный процесс
+        unique = dict(items)
+        stats = ThumbnailStats()
+        paths: dict[str, Path] = {}
+
+        def render(item: tuple[str, str]) -> tuple[str, Path | None, str]:
+            sha256_value, kind = item
+            return (sha256_value, *self.ensure(sha256_value, kind))
+
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="grab-thumbs") as executor:
+            for sha256_value, path, outcome in executor.map(render, unique.items()):
+                setattr(stats, outcome, getattr(stats, outcome) + 1)
+                if path is not None:
+                    paths[sha256_value] = path
+        return paths, stats
@@ -0,0 +1,71 @@
+﻿from __future__ import annotations
+
+import hashlib
+import mmap
+import os
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+HASH_BUFFER_SIZE = 8 * 1024 * 1024
+# Крупные файлы хэшируем через mmap: без копирования в буфер Python
+MMAP_THRESHOLD = 64 * 1024 * 1024
+
+
+@dataclass(slots=True)
+class VerifyStats:
+    checked: int = 0
+    ok: int = 0
+    missing: int = 0
+    corrupt: int = 0
+    repaired: int = 0
+    requeued: int = 0
+
+
+def hash_file(path: Path, buffer_size: int = HASH_BUFFER_SIZE) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as fh:
+        size = os.fstat(fh.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                digest.update(mapped)
+            return digest.hexdigest()
+        buffer = bytearray(buffer_size)
+        view = memoryview(buffer)
+        while True:
+            read = fh.readinto(buffer)
+            if not read:
+                break
+            digest.update(view[:read])
+    return digest.hexdigest()
+
+
+def hash_files(paths: Iterable[Path], *, workers: int = 4) -> dict[Path, str | None]:
+    """
+    Считает sha256 файлов в пуле потоков (hashlib отпускает GIL на больших буферах).
+    Hardlink-и на один inode (представления одного blob-а) хэшируются один раз.
+    Нечитаемый файл получает None.
+    """
+    by_inode: dict[tuple[int, int], list[Path]] = {}
+    result: dict[Path, str | None] = {}
+    for path in paths:
+        try:
+            stat = path.stat()
+        except OSError:
+            result[path] = None
+            continue
+        by_inode.setdefault((stat.st_dev, stat.st_ino), []).append(path)
+
+    def digest(group: list[Path]) -> str | None:
+        try:
+            return hash_file(group[0])
+        except OSError:
+            return None
+
+    groups = list(by_inode.values())
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="grab-verify") as executor:
+        for group, sha256_value in zip(groups, executor.map(digest, groups), strict=True):
+            for path in group:
+                result[path] = sha256_value
+    return result
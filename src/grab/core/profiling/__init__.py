@@ -0,0 +1,3 @@
+﻿from .profiler import ProfileArtifacts, StackSampler, profile_run
+
+__all__ = ["ProfileArtifacts", "StackSampler", "profile_run"]
@@ -0,0 +1,99 @@
+﻿from __future__ import annotations
+
+import cProfile
+import sys
+import threading
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from types import FrameType
+
+
+@dataclass(slots=True)
+class ProfileArtifacts:
+    pstats_path: Path
+    collapsed_path: Path
+
+
+class StackSampler:
+    """
+    Семплирующий профайлер: раз в interval_sec снимает стек целевого потока.
+    Результат пишется в collapsed-формате (`frame;frame;frame count`),
+    который понимают flamegraph.pl, speedscope и inferno.
+    """
+
+    def __init__(self, interval_sec: float = 0.005, thread_id: int | None = None):
+        self.interval_sec = interval_sec
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.samples: Counter[str] = Counter()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @staticmethod
+    def _frame_label(frame: FrameType) -> str:
+        code = frame.f_code
+        module = Path(code.co_filename).stem
+        return f"{module}:{code.co_name}"
+
+    def _collapse(self, frame: FrameType | None) -> str:
+        labels: list[str] = []
+        while frame is not None:
+            labels.append(self._frame_label(frame))
+            frame = frame.f_back
+        labels.reverse()
+        return ";".join(labels)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_sec):
+            frame = sys._current_frames().get(self.thread_id)  # noqa: SLF001
+            if frame is None:
+                continue
+            self.samples[self._collapse(frame)] += 1
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="grab-stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def write_collapsed(self, path: Path) -> None:
+        lines = [f"{stack} {count}" for stack, count in sorted(self.samples.items())]
+        path.write_text("\n".join(lines) + ("\n" if lines else ""), encoding="utf-8")
+
+
+@contextmanager
+def profile_run(
+    output_dir: Path,
+    command: str,
+    correlation_id: str,
+    interval_sec: float = 0.005,
+) -> Iterator[ProfileArtifacts]:
+    """
+    Запускает блок под cProfile (детерминированный профиль, `.prof` для pstats/snakeviz)
+    и параллельно под StackSampler (`.collapsed` для flamegraph).
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    stem = f"profile-{command}-{correlation_id}"
+    artifacts = ProfileArtifacts(
+        pstats_path=(output_dir / f"{stem}.prof").resolve(),
+        collapsed_path=(output_dir / f"{stem}.collapsed").resolve(),
+    )
+
+    sampler = StackSampler(interval_sec=interval_sec)
+    profiler = cProfile.Profile()
+    sampler.start()
+    profiler.enable()
+    try:
+        yield artifacts
+    finally:
+        profiler.disable()
+        sampler.stop()
+        profiler.dump_stats(str(artifacts.pstats_path))
+        sampler.write_collapsed(artifacts.collapsed_path)
@@ -32,6 +32,14 @@ def extract_links(text: str | None, html: str | None) -> list[str]:
     return deduped
 
 
+def html_to_text(html: str) -> str:
+    # Видимый текст HTML-письма: без script/style и комментариев, сущности раскодированы
+    soup = BeautifulSoup(html, "html.parser")
+    for tag in soup(["script", "style"]):
+        tag.decompose()
+    return soup.get_text(" ")
+
+
 def filter_media_links(links: list[str]) -> list[str]:
     media_ext = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".mp4", ".webm", ".mov"}
     result = []
@@ -1,5 +1,15 @@
 ﻿from .doctor import run_doctor_checks
-from .exporter import export_data
+from .exporter import export_data, export_incremental
+from .media_jobs import MediaFetchService
+from .snapshot import SnapshotResult, create_snapshot
 from .sync import SyncService
 
-__all__ = ["SyncService", "export_data", "run_doctor_checks"]
+__all__ = [
+    "MediaFetchService",
+    "SnapshotResult",
+    "SyncService",
+    "create_snapshot",
+    "export_data",
+    "export_incremental",
+    "run_doctor_checks",
+]
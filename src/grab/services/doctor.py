@@ -4,6 +4,7 @@ import platform
 import sys
 
 from grab.config import Settings
+from grab.core.db import connect_db, read_pragmas
 from grab.sources.email_imap import ImapEmailSource
 
 
@@ -26,6 +27,8 @@ def run_doctor_checks(settings: Settings) -> list[dict[str, str]]:
         }
     )
 
+    checks.extend(_db_profile_checks(settings))
+
     checks.append(
         {
             "check": "gmail_oauth_client_secret",
@@ -63,3 +66,27 @@ def run_doctor_checks(settings: Settings) -> list[dict[str, str]]:
         )
 
     return checks
+
+
+def _db_profile_checks(settings: Settings) -> list[dict[str, str]]:
+    # PRAGMA действуют на соединение, поэтому открываем БД с каждым профилем и читаем фактические значения
+    checks: list[dict[str, str]] = []
+    for check_name, profile in (("db_profile", settings.db_profile), ("db_sync_profile", settings.db_sync_profile)):
+        try:
+            connection = connect_db(settings.db_path, profile=profile)
+        except Exception as exc:  # noqa: BLE001
+            checks.append({"check": check_name, "status": "warn", "detail": f"{profile}: {exc}"})
+            continue
+        try:
+            pragmas = read_pragmas(connection)
+        finally:
+            connection.close()
+        checks.append(
+            {
+                "check": check_name,
+                # Без WAL (например, БД на сетевом диске) export блокируется идущим sync
+                "status": "ok" if pragmas["journal_mode"] == "WAL" else "warn",
+                "detail": f"{profile}: " + " ".join(f"{name}={value}" for name, value in pragmas.items()),
+            }
+        )
+    return checks
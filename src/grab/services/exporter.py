@@ -1,27 +1,344 @@
 ﻿from __future__ import annotations
 
+import csv
+import hashlib
+import json
+import shutil
+from datetime import datetime, timezone
 from pathlib import Path
+from types import ModuleType
 
-import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 
-from grab.core.db import GrabRepository
+from grab.core.db import ExportFilter, GrabRepository
 
+THUMBNAIL_COLUMN = "thumbnail_path"
+CSV_CHUNK_SIZE = 5000
+CSV_BUFFER_SIZE = 1024 * 1024
+# Предел строк листа Excel (включая заголовок)
+XLSX_MAX_ROWS = 1_048_576
+XLSX_SHEET_NAME = "items"
+# Parquet: повторяющиеся строки — dictionary, медиа — списки, store_code/year — разделы каталога
+PARQUET_DICTIONARY_COLUMNS = {"store_name", "currency", "status", "brand"}
+PARQUET_INT_COLUMNS = {"order_db_id", "item_db_id"}
+PARQUET_FLOAT_COLUMNS = {
+    "subtotal_amount",
+    "shipping_amount",
+    "discount_amount",
+    "total_amount",
+    "quantity",
+    "unit_price",
+    "item_discount_amount",
+    "item_shipping_amount",
+    "item_total_amount",
+}
+PARQUET_LIST_COLUMNS = ("media_paths", "media_urls")
+PARQUET_NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
 
-def export_data(repository: GrabRepository, formats: list[str], out_dir: Path) -> list[Path]:
+
+def _export_header(cursor, export_filter: ExportFilter | None) -> tuple[list[str], int]:  # noqa: ANN001
+    # Служебные колонки (extra_columns) стоят в конце курсора и в файл не попадают
+    header = [column[0] for column in cursor.description]
+    visible = len(export_filter.columns) if export_filter and export_filter.columns else len(header)
+    return header, visible
+
+
+def write_csv_stream(
+    repository: GrabRepository,
+    csv_path: Path,
+    thumbnails: dict[int, Path] | None = None,
+    chunk_size: int = CSV_CHUNK_SIZE,
+    changed_since: str | None = None,
+    export_filter: ExportFilter | None = None,
+) -> int:
+    """
+    Пишет CSV прямо из курсора SQLite пачками fetchmany: память не зависит от числа строк.
+    Возвращает количество записанных строк.
+    """
+    cursor = repository.export_cursor(
+        changed_since=changed_since,
+        export_filter=export_filter,
+        extra_columns=("item_db_id",) if thumbnails is not None else (),
+    )
+    header, visible = _export_header(cursor, export_filter)
+    item_index = header.index("item_db_id") if thumbnails is not None else -1
+    trimmed = visible < len(header)
+    output_header = header[:visible]
+    if thumbnails is not None:
+        output_header.append(THUMBNAIL_COLUMN)
+
+    written = 0
+    with csv_path.open("w", newline="", encoding="utf-8-sig", buffering=CSV_BUFFER_SIZE) as fh:
+        writer = csv.writer(fh)
+        writer.writerow(output_header)
+        while chunk := cursor.fetchmany(chunk_size):
+            if thumbnails is not None:
+                writer.writerows([*row[:visible], thumbnails.get(row[item_index])] for row in chunk)
+            elif trimmed:
+                writer.writerows(row[:visible] for row in chunk)
+            else:
+                writer.writerows(chunk)
+            written += len(chunk)
+    return written
+
+
+def _thumbnail_cell(worksheet, thumbnail: Path | None) -> WriteOnlyCell | None:  # noqa: ANN001
+    # Ссылка на маленькое превью вместо полноразмерного файла: книга остается легкой
+    if thumbnail is None:
+        return None
+    cell = WriteOnlyCell(worksheet, value=str(thumbnail))
+    cell.hyperlink = thumbnail.as_uri()
+    cell.style = "Hyperlink"
+    return cell
+
+
+def write_xlsx_stream(
+    repository: GrabRepository,
+    xlsx_path: Path,
+    thumbnails: dict[int, Path] | None = None,
+    chunk_size: int = CSV_CHUNK_SIZE,
+    max_rows: int = XLSX_MAX_ROWS,
+    changed_since: str | None = None,
+    export_filter: ExportFilter | None = None,
+) -> int:
+    """
+    Пишет XLSX в write-only режиме openpyxl: строки уходят во временный XML листа,
+    книга целиком в памяти не строится. При достижении предела строк Excel
+    продолжает на листах items_2, items_3... с тем же заголовком.
+    Возвращает количество записанных строк.
+    """
+    cursor = repository.export_cursor(
+        changed_since=changed_since,
+        export_filter=export_filter,
+        extra_columns=("item_db_id",) if thumbnails is not None else (),
+    )
+    columns, visible = _export_header(cursor, export_filter)
+    item_index = columns.index("item_db_id") if thumbnails is not None else -1
+    header = columns[:visible]
+    if thumbnails is not None:
+        header.append(THUMBNAIL_COLUMN)
+
+    workbook = Workbook(write_only=True)
+    sheets = 1
+    worksheet = workbook.create_sheet(XLSX_SHEET_NAME)
+    worksheet.append(header)
+    sheet_rows = 1
+    written = 0
+    while chunk := cursor.fetchmany(chunk_size):
+        for row in chunk:
+            if sheet_rows >= max_rows:
+                sheets += 1
+                worksheet = workbook.create_sheet(f"{XLSX_SHEET_NAME}_{sheets}")
+                worksheet.append(header)
+                sheet_rows = 1
+            if thumbnails is None:
+                worksheet.append(row[:visible])
+            else:
+                worksheet.append([*row[:visible], _thumbnail_cell(worksheet, thumbnails.get(row[item_index]))])
+            sheet_rows += 1
+        written += len(chunk)
+    workbook.save(xlsx_path)
+    return written
+
+
+def export_data(
+    repository: GrabRepository,
+    formats: list[str],
+    out_dir: Path,
+    thumbnails: dict[int, Path] | None = None,
+    export_filter: ExportFilter | None = None,
+) -> list[Path]:
     out_dir.mkdir(parents=True, exist_ok=True)
-    rows = repository.fetch_export_rows()
-    df = pd.DataFrame(rows)
 
     created_files: list[Path] = []
     if "csv" in formats:
         csv_path = (out_dir / "grab_export.csv").resolve()
-        df.to_csv(csv_path, index=False, encoding="utf-8-sig")
+        write_csv_stream(repository, csv_path, thumbnails=thumbnails, export_filter=export_filter)
         created_files.append(csv_path)
 
     if "xlsx" in formats:
         xlsx_path = (out_dir / "grab_export.xlsx").resolve()
-        with pd.ExcelWriter(xlsx_path, engine="openpyxl") as writer:
-            df.to_excel(writer, index=False, sheet_name="items")
+        write_xlsx_stream(repository, xlsx_path, thumbnails=thumbnails, export_filter=export_filter)
         created_files.append(xlsx_path)
 
+    if "parquet" in formats:
+        dataset_dir = (out_dir / "grab_export.parquet").resolve()
+        write_parquet_stream(repository, dataset_dir, thumbnails=thumbnails, export_filter=export_filter)
+        created_files.append(dataset_dir)
+
+    return created_files
+
+
+def load_pyarrow() -> tuple[ModuleType, ModuleType] | None:
+    # pyarrow — необязательная зависимость (pip install -e .[parquet])
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        return None
+    return pyarrow, pyarrow.parquet
+
+
+def pyarrow_available() -> bool:
+    return load_pyarrow() is not None
+
+
+def _parquet_type(pa: ModuleType, column: str):  # noqa: ANN202
+    if column in PARQUET_LIST_COLUMNS:
+        return pa.list_(pa.string())
+    if column in PARQUET_INT_COLUMNS:
+        return pa.int64()
+    if column in PARQUET_FLOAT_COLUMNS:
+        return pa.float64()
+    if column in PARQUET_DICTIONARY_COLUMNS:
+        return pa.dictionary(pa.int32(), pa.string())
+    return pa.string()
+
+
+def write_parquet_stream(
+    repository: GrabRepository,
+    dataset_dir: Path,
+    thumbnails: dict[int, Path] | None = None,
+    chunk_size: int = CSV_CHUNK_SIZE,
+    changed_since: str | None = None,
+    export_filter: ExportFilter | None = None,
+) -> int:
+    """
+    Пишет Parquet-датасет с hive-разбиением `store_code=<код>/year=<год>/part-0.parquet`.
+    На каждый раздел открыт один ParquetWriter; строки копятся по разделам и уходят
+    row group-ами по chunk_size, так что память ограничена, а не растет с объемом.
+    Возвращает количество записанных строк.
+    """
+    modules = load_pyarrow()
+    if modules is None:
+        raise RuntimeError("Для экспорта в Parquet нужен pyarrow: pip install -e .[parquet]")
+    pa, pq = modules
+
+    cursor = repository.export_cursor(
+        changed_since=changed_since,
+        media_lists=True,
+        export_filter=export_filter,
+        extra_columns=("store_code", "order_datetime", "item_db_id"),
+    )
+    columns, visible = _export_header(cursor, export_filter)
+    store_index = columns.index("store_code")
+    date_index = columns.index("order_datetime")
+    item_index = columns.index("item_db_id")
+    file_indexes = [index for index, name in enumerate(columns[:visible]) if name != "store_code"]
+    file_columns = [columns[index] for index in file_indexes]
+    list_positions = [position for position, name in enumerate(file_columns) if name in PARQUET_LIST_COLUMNS]
+    if thumbnails is not None:
+        file_columns.append(THUMBNAIL_COLUMN)
+    schema = pa.schema([pa.field(name, _parquet_type(pa, name)) for name in file_columns])
+
+    if dataset_dir.exists():
+        shutil.rmtree(dataset_dir)
+    dataset_dir.mkdir(parents=True)
+
+    writers: dict[tuple[str, str], object] = {}
+    pending: dict[tuple[str, str], list[list]] = {}
+
+    def flush(key: tuple[str, str]) -> None:
+        rows = pending.pop(key)
+        writer = writers.get(key)
+        if writer is None:
+            part_dir = dataset_dir / f"store_code={key[0]}" / f"year={key[1]}"
+            part_dir.mkdir(parents=True, exist_ok=True)
+            writer = pq.ParquetWriter(part_dir / "part-0.parquet", schema)
+            writers[key] = writer
+        column_values = zip(*rows, strict=True)
+        arrays = [pa.array(list(values), type=field.type) for values, field in zip(column_values, schema, strict=True)]
+        writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+
+    written = 0
+    try:
+        while chunk := cursor.fetchmany(chunk_size):
+            for row in chunk:
+                order_datetime = row[date_index]
+                key = (row[store_index], order_datetime[:4] if order_datetime else PARQUET_NULL_PARTITION)
+                values = [row[index] for index in file_indexes]
+                for position in list_positions:
+                    values[position] = json.loads(values[position]) if values[position] else []
+                if thumbnails is not None:
+                    thumbnail = thumbnails.get(row[item_index])
+                    values.append(str(thumbnail) if thumbnail else None)
+                pending.setdefault(key, []).append(values)
+                if len(pending[key]) >= chunk_size:
+                    flush(key)
+            written += len(chunk)
+        for key in list(pending):
+            flush(key)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return written
+
+
+def _remove_output(path: Path) -> None:
+    # Parquet-выгрузка — каталог, CSV/XLSX — файл
+    if path.is_dir():
+        shutil.rmtree(path)
+    else:
+        path.unlink(missing_ok=True)
+
+
+def _export_stem(export_filter: ExportFilter | None) -> str:
+    # У каждого набора фильтров свои снимок и дельты: иначе выгрузка с другим фильтром в ту же папку
+    # перезаписала бы снимок, а watermark прежнего фильтра остался бы и следующая дельта легла бы в пустоту
+    if export_filter is None or export_filter.is_empty():
+        return "grab_export"
+    return f"grab_export_{hashlib.sha256(export_filter.key().encode('utf-8')).hexdigest()[:10]}"
+
+
+EXPORT_WRITERS = {"csv": write_csv_stream, "xlsx": write_xlsx_stream, "parquet": write_parquet_stream}
+
+
+def export_incremental(
+    repository: GrabRepository,
+    formats: list[str],
+    out_dir: Path,
+    thumbnails: dict[int, Path] | None = None,
+    compact: bool = False,
+    export_filter: ExportFilter | None = None,
+) -> list[Path]:
+    """
+    Инкрементальный экспорт по watermark на каждую цель (папка + формат).
+    Первый запуск (или compact) пишет полный снимок grab_export.<fmt> и удаляет дельты,
+    дальше пишутся только позиции, измененные с прошлого запуска: grab_export_delta_<время>.<fmt>.
+    С фильтрами имена получают суффикс из подписи фильтра: grab_export_<hash>.<fmt>, grab_export_<hash>_delta_*.
+    """
+    stem = _export_stem(export_filter)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    # Watermark берется до чтения: изменения во время экспорта попадут в следующую дельту.
+    # Сравнение >= дает перекрытие в одну секунду вместо риска потерять строки на границе.
+    started = repository.db_now()
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+
+    created_files: list[Path] = []
+    for fmt in formats:
+        target = f"{out_dir.resolve()}|{fmt}"
+        if export_filter is not None and not export_filter.is_empty():
+            target = f"{target}|{export_filter.key()}"
+        since = None if compact else repository.get_export_watermark(target)
+        write = EXPORT_WRITERS[fmt]
+        if since is None:
+            snapshot_path = (out_dir / f"{stem}.{fmt}").resolve()
+            write(repository, snapshot_path, thumbnails=thumbnails, export_filter=export_filter)
+            for delta_path in out_dir.glob(f"{stem}_delta_*.{fmt}"):
+                _remove_output(delta_path)
+            created_files.append(snapshot_path)
+        else:
+            delta_path = (out_dir / f"{stem}_delta_{stamp}.{fmt}").resolve()
+            if write(
+                repository,
+                delta_path,
+                thumbnails=thumbnails,
+                changed_since=since,
+                export_filter=export_filter,
+            ):
+                created_files.append(delta_path)
+            else:
+                _remove_output(delta_path)
+        repository.set_export_watermark(target, started)
     return created_files
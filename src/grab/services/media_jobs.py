@@ -0,0 +1,108 @@
+﻿from __future__ import annotations
+
+import logging
+from datetime import datetime, timedelta, timezone
+
+from grab.config import Settings
+from grab.core.db import GrabRepository
+from grab.core.media import MediaDownloader, MediaManager, backoff_with_jitter
+
+MAX_RETRY_DELAY_SEC = 6 * 3600
+
+
+class MediaFetchService:
+    """
+    Воркер очереди media_jobs: забирает созревшие задачи пачками, качает их пулом
+    MediaDownloader и планирует повтор с backoff, пока не кончатся попытки.
+    """
+
+    def __init__(
+        self,
+        settings: Settings,
+        repository: GrabRepository,
+        logger: logging.Logger | logging.LoggerAdapter,
+        rate_limit_per_sec: float | None = None,
+        concurrency: int | None = None,
+    ):
+        self.settings = settings
+        self.repository = repository
+        self.logger = logger
+        self.downloader = MediaDownloader(
+            max_workers=concurrency or settings.media_concurrency,
+            per_host_limit=settings.media_per_host_concurrency,
+            timeout_sec=settings.media_timeout_sec,
+            max_retries=settings.media_retries,
+            spool_dir=settings.raw_dir / "spool",
+            rate_limit_per_sec=(
+                rate_limit_per_sec if rate_limit_per_sec is not None else settings.media_rate_limit_per_sec
+            ),
+        )
+        self.media_manager = MediaManager(
+            repository=repository,
+            media_root=settings.media_dir,
+            downloader=self.downloader,
+            url_cache_ttl_sec=settings.media_url_cache_ttl_sec,
+        )
+
+    @staticmethod
+    def _now() -> datetime:
+        return datetime.now(timezone.utc)
+
+    def _retry_at(self, attempt: int) -> str | None:
+        if attempt >= self.settings.media_job_max_attempts:
+            return None
+        delay = backoff_with_jitter(attempt, self.settings.media_job_retry_base_sec, MAX_RETRY_DELAY_SEC)
+        return (self._now() + timedelta(seconds=delay)).isoformat()
+
+    def run(self, *, max_jobs: int | None = None, batch_size: int | None = None) -> dict[str, int]:
+        stats = {
+            "jobs_claimed": 0,
+            "media_saved": 0,
+            "retry_scheduled": 0,
+            "failed": 0,
+        }
+        batch_limit = batch_size or self.downloader.max_workers * 4
+        self.repository.release_running_media_jobs(lease_sec=self.settings.media_job_lease_sec)
+
+        try:
+            while max_jobs is None or stats["jobs_claimed"] < max_jobs:
+                limit = batch_limit if max_jobs is None else min(batch_limit, max_jobs - stats["jobs_claimed"])
+                jobs = self.repository.claim_media_jobs(limit=limit, now=self._now().isoformat())
+                if not jobs:
+                    break
+                stats["jobs_claimed"] += len(jobs)
+
+                pending = [
+                    (
+                        job,
+                        self.media_manager.submit_download(
+                            store_code=job["store_code"],
+                            order_ref=job["order_ref"],
+                            item_id=job["item_id"],
+                            url=job["url"],
+                            source=job["source"],
+                        ),
+                    )
+                    for job in jobs
+                ]
+                for job, download in pending:
+                    try:
+                        self.media_manager.complete_download(download)
+                    except Exception as exc:  # noqa: BLE001
+                        retry_at = self._retry_at(job["attempt"] + 1)
+                        self.repository.fail_media_job(job["id"], error_text=str(exc), next_retry_at=retry_at)
+                        stats["retry_scheduled" if retry_at else "failed"] += 1
+                        self.logger.warning(
+                            "Media job %s (item %s) failed, attempt %s: %s",
+                            job["id"],
+                            job["item_id"],
+                            job["attempt"] + 1,
+                            exc,
+                        )
+                        continue
+                    self.repository.complete_media_job(job["id"])
+                    stats["media_saved"] += 1
+        finally:
+            self.downloader.close()
+
+        return stats
@@ -0,0 +1,216 @@
+﻿from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+from grab.core.db import BACKUP_STEP_PAGES, backup_database
+from grab.core.db.compression import ZLIB_LEVEL, ZSTD_LEVEL, load_zstandard
+from grab.core.media import BlobStore
+from grab.core.media.spool import CHUNK_SIZE
+from grab.core.media.store import BLOB_DIR_NAME
+from grab.core.media.thumbs import THUMB_DIR_NAME
+
+DB_FILE_NAME = "grab.sqlite3"
+MANIFEST_NAME = "manifest.json"
+MEDIA_MANIFEST_NAME = "media-manifest.jsonl.gz"
+# Превью пересобираются из blob-ов (grab media thumbs), в манифест не входят
+SKIP_MEDIA_DIRS = {THUMB_DIR_NAME}
+
+
+@dataclass(slots=True)
+class SnapshotResult:
+    directory: Path
+    database_path: Path
+    manifest_path: Path
+    media_manifest_path: Path | None
+    database_bytes: int
+    compressed_bytes: int
+    media_files: int
+    missing_blobs: int
+
+
+def _timestamp() -> str:
+    return datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+
+
+def _new_directory(out_dir: Path, name: str) -> Path:
+    # Два снимка за одну секунду получают суффикс, а не падают на существующей папке
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for attempt in range(1, 100):
+        directory = out_dir / (name if attempt == 1 else f"{name}-{attempt}")
+        try:
+            directory.mkdir()
+        except FileExistsError:
+            continue
+        return directory
+    raise FileExistsError(f"Не удалось создать папку снимка: {out_dir / name}")
+
+
+def _compress(source: Path, target_base: Path) -> tuple[Path, str, str]:
+    """
+    Сжимает копию базы потоком (zstd, если установлен zstandard, иначе gzip).
+    Возвращает путь, кодек и sha256 исходных байт.
+    """
+    digest = hashlib.sha256()
+    zstandard = load_zstandard()
+    if zstandard is not None:
+        target, codec = target_base.with_name(f"{target_base.name}.zst"), "zstd"
+        with source.open("rb") as src, target.open("wb") as raw_out:
+            with zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(raw_out, closefd=False) as out:
+                while chunk := src.read(CHUNK_SIZE):
+                    digest.update(chunk)
+                    out.write(chunk)
+    else:
+        target, codec = target_base.with_name(f"{target_base.name}.gz"), "gzip"
+        with source.open("rb") as src, gzip.open(target, "wb", compresslevel=ZLIB_LEVEL) as out:
+            while chunk := src.read(CHUNK_SIZE):
+                digest.update(chunk)
+                out.write(chunk)
+    return target, codec, digest.hexdigest()
+
+
+def _file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as fh:
+        while chunk := fh.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _read_database_meta(db_copy: Path) -> tuple[list[str], dict[str, int], dict[str, str], set[str]]:
+    # Метаданные читаются из копии, а не из живой базы: манифест описывает ровно тот же снимок
+    connection = sqlite3.connect(str(db_copy))
+    try:
+        migrations = [row[0] for row in connection.execute("SELECT filename FROM schema_migrations ORDER BY filename")]
+        counts = {
+            table: int(connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0])
+            for table in ("orders", "order_items", "media", "raw_messages")
+        }
+        paths: dict[str, str] = {}
+        hashes: set[str] = set()
+        for local_path, sha256_value in connection.execute("SELECT local_path_abs, sha256 FROM media"):
+            hashes.add(sha256_value)
+            if local_path:
+                paths[os.path.normcase(os.path.abspath(local_path))] = sha256_value
+    finally:
+        connection.close()
+    return migrations, counts, paths, hashes
+
+
+def _write_media_manifest(media_root: Path, target: Path, known_paths: dict[str, str]) -> tuple[int, int]:
+    """
+    JSON Lines (gzip) по файлам медиа-дерева: путь относительно media_root, размер, mtime и sha256.
+    sha256 не пересчитывается: у blob-ов это имя файла, у папок позиций — запись в таблице media.
+    """
+    files = total_bytes = 0
+    with gzip.open(target, "wt", encoding="utf-8", compresslevel=ZLIB_LEVEL) as out:
+        for dir_path, dir_names, file_names in os.walk(media_root):
+            if Path(dir_path) == media_root:
+                dir_names[:] = [name for name in dir_names if name not in SKIP_MEDIA_DIRS]
+            dir_names.sort()
+            in_blobs = Path(dir_path).relative_to(media_root).parts[:1] == (BLOB_DIR_NAME,)
+            for name in sorted(file_names):
+                path = Path(dir_path) / name
+                if name.endswith((".tmp", ".spool")):
+                    continue
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    # Файл удалили во время обхода (gc, dupes): в манифест не попадает
+                    continue
+                sha256_value = name if in_blobs else known_paths.get(os.path.normcase(os.path.abspath(path)))
+                entry = {
+                    "path": path.relative_to(media_root).as_posix(),
+                    "size": stat.st_size,
+                    "mtime": int(stat.st_mtime),
+                    "sha256": sha256_value,
+                }
+                out.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                files += 1
+                total_bytes += stat.st_size
+    return files, total_bytes
+
+
+def create_snapshot(
+    db_path: Path,
+    media_root: Path,
+    out_dir: Path,
+    *,
+    include_media: bool = True,
+    step_pages: int = BACKUP_STEP_PAGES,
+    progress: Callable[[int, int], None] | None = None,
+) -> SnapshotResult:
+    """
+    Снимок в папке `grab-<UTC время>`: сжатая онлайн-копия базы, манифест медиа-дерева
+    и manifest.json с контрольными суммами, версиями миграций и счетчиками.
+    Сами медиа-файлы не копируются: манифест позволяет сверить дерево или докачать недостающее.
+    """
+    directory = _new_directory(out_dir, f"grab-{_timestamp()}")
+    db_copy = directory / DB_FILE_NAME
+    backup = backup_database(db_path, db_copy, step_pages=step_pages, progress=progress)
+    try:
+        migrations, counts, known_paths, hashes = _read_database_meta(db_copy)
+        compressed, codec, raw_sha256 = _compress(db_copy, db_copy)
+    finally:
+        db_copy.unlink(missing_ok=True)
+
+    manifest: dict[str, Any] = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "source_db": str(db_path),
+        "database": {
+            "file": compressed.name,
+            "codec": codec,
+            "size_bytes": backup.size_bytes,
+            "sha256": raw_sha256,
+            "compressed_bytes": compressed.stat().st_size,
+            "compressed_sha256": _file_sha256(compressed),
+            "page_count": backup.page_count,
+        },
+        "migrations": migrations,
+        "counts": counts,
+    }
+
+    media_manifest: Path | None = None
+    media_files = 0
+    missing: list[str] = []
+    if include_media:
+        media_manifest = directory / MEDIA_MANIFEST_NAME
+        media_files, media_bytes = _write_media_manifest(media_root, media_manifest, known_paths)
+        blob_store = BlobStore(media_root / BLOB_DIR_NAME)
+        views: dict[str, list[str]] = {}
+        for path, sha256_value in known_paths.items():
+            views.setdefault(sha256_value, []).append(path)
+        # Старые записи без blob-а не потеряны, пока на месте сам файл из local_path_abs
+        missing = sorted(
+            sha
+            for sha in hashes
+            if not blob_store.contains(sha) and not any(Path(path).exists() for path in views.get(sha, ()))
+        )
+        manifest["media"] = {
+            "root": str(media_root),
+            "manifest": media_manifest.name,
+            "files": media_files,
+            "bytes": media_bytes,
+            "missing_blobs": missing,
+        }
+
+    manifest_path = directory / MANIFEST_NAME
+    manifest_path.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    return SnapshotResult(
+        directory=directory,
+        database_path=compressed,
+        manifest_path=manifest_path,
+        media_manifest_path=media_manifest,
+        database_bytes=backup.size_bytes,
+        compressed_bytes=manifest["database"]["compressed_bytes"],
+        media_files=media_files,
+        missing_blobs=len(missing),
+    )
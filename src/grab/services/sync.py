@@ -6,6 +6,7 @@ from datetime import datetime, timezone
 from typing import Any
 
 from grab.config import Settings
+from grab.core.archive import EML_DIR_NAME, EmlArchive
 from grab.core.db import GrabRepository
 from grab.core.dedupe import (
     build_item_dedupe_key,
@@ -43,6 +44,8 @@ class SyncService:
         self.settings = settings
         self.repository = repository
         self.logger = logger
+        self.spool_dir = settings.raw_dir / "spool"
+        self.eml_archive = EmlArchive(settings.raw_dir / EML_DIR_NAME) if settings.email_archive_eml else None
         self.media_manager = MediaManager(repository=repository, media_root=settings.media_dir)
 
     @staticmethod
@@ -66,7 +69,12 @@ class SyncService:
                     client_secret_path=self.settings.gmail_client_secret_path,
                     token_path=self.settings.gmail_token_path,
                 )
-                gmail_source = GmailEmailSource(auth_manager=auth_manager, account=self.settings.gmail_account)
+                gmail_source = GmailEmailSource(
+                    auth_manager=auth_manager,
+                    account=self.settings.gmail_account,
+                    spool_dir=self.spool_dir,
+                    eml_archive=self.eml_archive,
+                )
                 gmail_messages = gmail_source.fetch_messages(
                     keywords=self.settings.email_keywords,
                     since=since,
@@ -83,7 +91,7 @@ class SyncService:
             last_exc: Exception | None = None
             for attempt in range(1, self.settings.imap_retry_attempts + 1):
                 try:
-                    source = ImapEmailSource(account)
+                    source = ImapEmailSource(account, spool_dir=self.spool_dir, eml_archive=self.eml_archive)
                     imap_messages = source.fetch_messages(
                         keywords=self.settings.email_keywords,
                         since=since,
@@ -132,6 +140,7 @@ class SyncService:
             "orders_upserted": 0,
             "items_upserted": 0,
             "media_saved": 0,
+            "media_enqueued": 0,
             "errors": 0,
         }
 
@@ -161,7 +170,7 @@ class SyncService:
                         raw_text=message.text_body,
                         raw_html=message.html_body,
                         raw_json=message.raw_payload,
-                        raw_eml_path=None,
+                        raw_eml_path=message.raw_eml_path,
                     )
 
                     parsed_orders = parse_email_to_orders(message)
@@ -214,13 +223,13 @@ class SyncService:
                         )
                         stats["orders_upserted"] += 1
 
-                        item_ids: list[int] = []
                         order_ref = parsed_order.external_order_id or (
                             parsed_order.order_datetime.strftime("%Y-%m-%d")
                             if parsed_order.order_datetime
                             else "unknown_date"
                         )
 
+                        item_rows: list[dict[str, Any]] = []
                         for item_index, item in enumerate(parsed_order.items):
                             product_key = build_product_canonical_key(
                                 brand=item.brand,
@@ -248,63 +257,65 @@ class SyncService:
                                 quantity=item.quantity,
                             )
 
-                            item_id = self.repository.upsert_order_item(
-                                order_id=order_id,
-                                external_item_id=item.external_item_id,
-                                dedupe_key=item_key,
-                                product_id=product_id,
-                                title_full=item.title_full,
-                                title_short=item.title_short,
-                                store_category_path=item.store_category_path,
-                                unified_category_path=item.unified_category_path,
-                                brand=item.brand,
-                                model=item.model,
-                                sku=item.sku,
-                                quantity=item.quantity,
-                                unit_price=item.unit_price,
-                                discount_amount=item.discount_amount,
-                                shipping_amount=item.shipping_amount,
-                                total_amount=item.total_amount,
-                                currency=item.currency or parsed_order.currency,
-                                product_url=item.product_url,
-                                order_url=item.order_url,
-                                receipt_url=item.receipt_url,
+                            item_rows.append(
+                                {
+                                    "order_id": order_id,
+                                    "external_item_id": item.external_item_id,
+                                    "dedupe_key": item_key,
+                                    "product_id": product_id,
+                                    "title_full": item.title_full,
+                                    "title_short": item.title_short,
+                                    "store_category_path": item.store_category_path,
+                                    "unified_category_path": item.unified_category_path,
+                                    "brand": item.brand,
+                                    "model": item.model,
+                                    "sku": item.sku,
+                                    "quantity": item.quantity,
+                                    "unit_price": item.unit_price,
+                                    "discount_amount": item.discount_amount,
+                                    "shipping_amount": item.shipping_amount,
+                                    "total_amount": item.total_amount,
+                                    "currency": item.currency or parsed_order.currency,
+                                    "product_url": item.product_url,
+                                    "order_url": item.order_url,
+                                    "receipt_url": item.receipt_url,
+                                }
                             )
-                            item_ids.append(item_id)
-                            stats["items_upserted"] += 1
-
-                            for attribute in item.attributes:
-                                self.repository.upsert_product_attribute(
-                                    product_id=product_id,
-                                    item_id=item_id,
-                                    attr_key=attribute.key,
-                                    value_type=attribute.value_type,
-                                    value_text=attribute.value_text,
-                                    value_number=attribute.value_number,
-                                    value_bool=attribute.value_bool,
-                                    value_json_raw=attribute.value_json_raw,
-                                    source=attribute.source,
-                                )
-
-                            if media_download:
+
+                        # Позиции и атрибуты заказа пишутся пачкой: одна транзакция на таблицу вместо строки
+                        item_ids = self.repository.upsert_order_items_bulk(item_rows)
+                        stats["items_upserted"] += len(item_ids)
+                        self.repository.upsert_product_attributes_bulk(
+                            [
+                                {
+                                    "product_id": item_row["product_id"],
+                                    "item_id": item_id,
+                                    "attr_key": attribute.key,
+                                    "value_type": attribute.value_type,
+                                    "value_text": attribute.value_text,
+                                    "value_number": attribute.value_number,
+                                    "value_bool": attribute.value_bool,
+                                    "value_json_raw": attribute.value_json_raw,
+                                    "source": attribute.source,
+                                }
+                                for item, item_row, item_id in zip(parsed_order.items, item_rows, item_ids, strict=True)
+                                for attribute in item.attributes
+                            ]
+                        )
+
+                        if media_download:
+                            # Ссылки только ставятся в очередь media_jobs, качает `grab media fetch`
+                            for item, item_id in zip(parsed_order.items, item_ids, strict=True):
                                 for media_url in item.media_urls:
-                                    try:
-                                        self.media_manager.download_from_url(
-                                            store_code=parsed_order.store_code,
-                                            order_ref=order_ref,
-                                            item_id=item_id,
-                                            url=media_url,
-                                            source=f"{message.source}:link",
-                                            timeout_sec=self.settings.media_timeout_sec,
-                                            max_retries=self.settings.media_retries,
-                                        )
-                                        stats["media_saved"] += 1
-                                    except Exception as exc:  # noqa: BLE001
-                                        self.logger.warning(
-                                            "Media link download failed for item %s: %s",
-                                            item_id,
-                                            exc,
-                                        )
+                                    self.repository.enqueue_media_job(
+                                        item_id=item_id,
+                                        url=media_url,
+                                        store_code=parsed_order.store_code,
+                                        order_ref=order_ref,
+                                        source=f"{message.source}:link",
+                                        next_retry_at=started_at.isoformat(),
+                                    )
+                                    stats["media_enqueued"] += 1
 
                         if media_download and item_ids:
                             target_item_id = item_ids[0]
@@ -315,7 +326,7 @@ class SyncService:
                                         order_ref=order_ref,
                                         item_id=target_item_id,
                                         filename=attachment.filename,
-                                        content=attachment.data,
+                                        content=attachment.content,
                                         mime=attachment.content_type,
                                         source_url=attachment.source_url,
                                         source=f"{message.source}:attachment",
@@ -332,6 +343,10 @@ class SyncService:
                 except Exception as exc:  # noqa: BLE001
                     stats["errors"] += 1
                     self.logger.error("Message processing failed: %s", exc)
+                finally:
+                    # Несохраненные вложения (skip/без заказов/ошибка) не должны копиться в spool
+                    for attachment in message.attachments:
+                        attachment.discard()
 
             self.repository.finish_sync_run(
                 correlation_id=correlation_id,
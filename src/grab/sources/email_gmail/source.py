@@ -3,10 +3,13 @@
 import base64
 from datetime import datetime, timezone
 from email.utils import getaddresses
+from pathlib import Path
 from typing import Any
 
 from googleapiclient.discovery import build
 
+from grab.core.archive import EmlArchive
+from grab.core.media.spool import spool_base64
 from grab.parsers.utils import extract_links
 from grab.sources.models import AttachmentData, EmailMessageData
 
@@ -14,9 +17,17 @@ from .auth import GmailAuthManager
 
 
 class GmailEmailSource:
-    def __init__(self, auth_manager: GmailAuthManager, account: str | None = None):
+    def __init__(
+        self,
+        auth_manager: GmailAuthManager,
+        account: str | None = None,
+        spool_dir: Path | None = None,
+        eml_archive: EmlArchive | None = None,
+    ):
         self.auth_manager = auth_manager
         self.account = account
+        self.spool_dir = spool_dir
+        self.eml_archive = eml_archive
 
     def _decode_b64(self, value: str | None) -> str:
         if not value:
@@ -24,6 +35,33 @@ class GmailEmailSource:
         data = base64.urlsafe_b64decode(value.encode("utf-8"))
         return data.decode("utf-8", errors="replace")
 
+    def _archive_raw(self, message_id: str, users_resource) -> str | None:  # noqa: ANN001
+        # format=full уже разобран на части; исходные байты письма отдает только format=raw
+        if self.eml_archive is None:
+            return None
+        payload = users_resource.messages().get(userId="me", id=message_id, format="raw").execute()
+        encoded = payload.get("raw")
+        if not encoded:
+            return None
+        raw = base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4))
+        return str(self.eml_archive.put(raw))
+
+    @staticmethod
+    def _strip_bodies(payload: dict[str, Any]) -> dict[str, Any]:
+        # Тела частей уже лежат в архиве .eml.gz: в raw_json оставляем заголовки, id и структуру MIME
+        def strip(part: dict[str, Any]) -> dict[str, Any]:
+            trimmed = {key: value for key, value in part.items() if key not in ("body", "parts")}
+            if "body" in part:
+                trimmed["body"] = {key: value for key, value in part["body"].items() if key != "data"}
+            if "parts" in part:
+                trimmed["parts"] = [strip(nested) for nested in part["parts"]]
+            return trimmed
+
+        result = dict(payload)
+        if "payload" in payload:
+            result["payload"] = strip(payload["payload"])
+        return result
+
     def _extract_headers(self, payload: dict[str, Any]) -> dict[str, str]:
         headers = payload.get("headers", [])
         result: dict[str, str] = {}
@@ -62,12 +100,21 @@ class GmailEmailSource:
                     .get(userId="me", messageId=message_id, id=attachment_id)
                     .execute()
                 )
-                attachment_data = base64.urlsafe_b64decode(
-                    attachment_payload.get("data", "").encode("utf-8")
-                )
-                attachments.append(
-                    AttachmentData(filename=filename, content_type=mime_type, data=attachment_data)
-                )
+                encoded = attachment_payload.get("data", "")
+                if self.spool_dir is not None:
+                    # Декодируем base64 кусками прямо в spool-файл
+                    attachments.append(
+                        AttachmentData(
+                            filename=filename,
+                            content_type=mime_type,
+                            spool=spool_base64(self.spool_dir, encoded),
+                        )
+                    )
+                else:
+                    attachment_data = base64.urlsafe_b64decode(encoded.encode("utf-8"))
+                    attachments.append(
+                        AttachmentData(filename=filename, content_type=mime_type, data=attachment_data)
+                    )
 
             for nested in part.get("parts", []):
                 walk(nested)
@@ -120,6 +167,7 @@ class GmailEmailSource:
                 sent_at = datetime.fromtimestamp(int(internal_date) / 1000, tz=timezone.utc)
 
             links = extract_links(text_body, html_body)
+            raw_eml_path = self._archive_raw(message_id, users)
 
             result.append(
                 EmailMessageData(
@@ -136,7 +184,8 @@ class GmailEmailSource:
                     html_body=html_body,
                     links=links,
                     attachments=attachments,
-                    raw_payload=payload,
+                    raw_payload=self._strip_bodies(payload) if raw_eml_path else payload,
+                    raw_eml_path=raw_eml_path,
                 )
             )
 
@@ -6,15 +6,25 @@ from datetime import datetime, timezone
 from email.header import decode_header
 from email.message import Message
 from email.utils import getaddresses, parsedate_to_datetime
+from pathlib import Path
 
 from grab.config import ImapAccountConfig
+from grab.core.archive import EmlArchive
+from grab.core.media.spool import spool_bytes
 from grab.parsers.utils import extract_links
 from grab.sources.models import AttachmentData, EmailMessageData
 
 
 class ImapEmailSource:
-    def __init__(self, config: ImapAccountConfig):
+    def __init__(
+        self,
+        config: ImapAccountConfig,
+        spool_dir: Path | None = None,
+        eml_archive: EmlArchive | None = None,
+    ):
         self.config = config
+        self.spool_dir = spool_dir
+        self.eml_archive = eml_archive
 
     @staticmethod
     def _decode_header(value: str | None) -> str:
@@ -48,6 +58,13 @@ class ImapEmailSource:
         except LookupError:
             return payload.decode("utf-8", errors="replace")
 
+    def _build_attachment(self, filename: str | None, content_type: str, data: bytes) -> AttachmentData:
+        if self.spool_dir is None:
+            return AttachmentData(filename=filename, content_type=content_type, data=data)
+        # Байты вложения сразу уходят в spool, в памяти остается только путь
+        spooled = spool_bytes(self.spool_dir, data)
+        return AttachmentData(filename=filename, content_type=content_type, spool=spooled)
+
     def _extract_message_content(self, message: Message) -> tuple[str, str, list[AttachmentData]]:
         text_body = ""
         html_body = ""
@@ -62,13 +79,7 @@ class ImapEmailSource:
                 if "attachment" in content_disposition or filename:
                     data = part.get_payload(decode=True)
                     if data:
-                        attachments.append(
-                            AttachmentData(
-                                filename=filename,
-                                content_type=content_type,
-                                data=data,
-                            )
-                        )
+                        attachments.append(self._build_attachment(filename, content_type, data))
                     continue
 
                 if content_type == "text/plain" and not text_body:
@@ -143,6 +154,7 @@ class ImapEmailSource:
                     continue
 
                 links = extract_links(text_body, html_body)
+                raw_eml_path = str(self.eml_archive.put(raw_bytes)) if self.eml_archive is not None else None
 
                 result.append(
                     EmailMessageData(
@@ -160,6 +172,7 @@ class ImapEmailSource:
                         links=links,
                         attachments=attachments,
                         raw_payload={"rfc822_size": len(raw_bytes)},
+                        raw_eml_path=raw_eml_path,
                     )
                 )
 
@@ -3,13 +3,26 @@
 from dataclasses import dataclass, field
 from datetime import datetime
 
+from grab.core.media.spool import SpooledFile
+
 
 @dataclass(slots=True)
 class AttachmentData:
     filename: str | None
     content_type: str | None
-    data: bytes
+    data: bytes | None = None
     source_url: str | None = None
+    spool: SpooledFile | None = None
+
+    @property
+    def content(self) -> bytes | SpooledFile:
+        if self.spool is not None:
+            return self.spool
+        return self.data or b""
+
+    def discard(self) -> None:
+        if self.spool is not None:
+            self.spool.discard()
 
 
 @dataclass(slots=True)
@@ -28,3 +41,4 @@ class EmailMessageData:
     links: list[str] = field(default_factory=list)
     attachments: list[AttachmentData] = field(default_factory=list)
     raw_payload: dict | None = None
+    raw_eml_path: str | None = None
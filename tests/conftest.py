@@ -1,6 +1,11 @@
 ﻿from __future__ import annotations
 
 import logging
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 
 import pytest
@@ -9,6 +14,189 @@ from grab.config import Settings
 from grab.core.db import GrabRepository
 
 
+def _create_order_and_items(repository) -> tuple[int, int, int]:  # noqa: ANN001
+    store_id = repository.upsert_store("ozon", "Ozon")
+    account_id = repository.upsert_account("gmail", "me@gmail.com", "me@gmail.com")
+    order_id = repository.upsert_order(
+        store_id=store_id,
+        account_id=account_id,
+        seller_id=None,
+        external_order_id="A1",
+        dedupe_key="order-a1",
+        order_datetime="2026-02-01T10:00:00+00:00",
+        paid_datetime=None,
+        delivered_datetime=None,
+        currency="RUB",
+        subtotal_amount=100,
+        shipping_amount=0,
+        discount_amount=0,
+        total_amount=100,
+        status="ok",
+        source_url=None,
+        raw_ref="1",
+    )
+    item1 = repository.upsert_order_item(
+        order_id=order_id,
+        external_item_id="i1",
+        dedupe_key="i1",
+        product_id=None,
+        title_full="Товар 1",
+        title_short="Товар",
+        store_category_path=None,
+        unified_category_path=None,
+        brand=None,
+        model=None,
+        sku=None,
+        quantity=1,
+        unit_price=100,
+        discount_amount=0,
+        shipping_amount=0,
+        total_amount=100,
+        currency="RUB",
+        product_url=None,
+        order_url=None,
+        receipt_url=None,
+    )
+    item2 = repository.upsert_order_item(
+        order_id=order_id,
+        external_item_id="i2",
+        dedupe_key="i2",
+        product_id=None,
+        title_full="Товар 2",
+        title_short="Товар",
+        store_category_path=None,
+        unified_category_path=None,
+        brand=None,
+        model=None,
+        sku=None,
+        quantity=1,
+        unit_price=100,
+        discount_amount=0,
+        shipping_amount=0,
+        total_amount=100,
+        currency="RUB",
+        product_url=None,
+        order_url=None,
+        receipt_url=None,
+    )
+    return order_id, item1, item2
+
+
+def _item_row(order_id: int, dedupe_key: str, **overrides) -> dict:  # noqa: ANN003
+    row = {
+        "order_id": order_id,
+        "external_item_id": None,
+        "dedupe_key": dedupe_key,
+        "product_id": None,
+        "title_full": f"Товар {dedupe_key}",
+        "title_short": None,
+        "store_category_path": None,
+        "unified_category_path": None,
+        "brand": None,
+        "model": None,
+        "sku": None,
+        "quantity": 1,
+        "unit_price": 100.0,
+        "discount_amount": None,
+        "shipping_amount": None,
+        "total_amount": 100.0,
+        "currency": "RUB",
+        "product_url": None,
+        "order_url": None,
+        "receipt_url": None,
+    }
+    row.update(overrides)
+    return row
+
+
+def _create_item(repository) -> int:  # noqa: ANN001
+    store_id = repository.upsert_store("ozon", "Ozon")
+    order_id = repository.upsert_order(
+        store_id=store_id,
+        account_id=None,
+        seller_id=None,
+        external_order_id="S1",
+        dedupe_key="order-s1",
+        order_datetime=None,
+        paid_datetime=None,
+        delivered_datetime=None,
+        currency="RUB",
+        subtotal_amount=None,
+        shipping_amount=None,
+        discount_amount=None,
+        total_amount=None,
+        status=None,
+        source_url=None,
+        raw_ref=None,
+    )
+    return repository.upsert_order_item(
+        order_id=order_id,
+        external_item_id="s1",
+        dedupe_key="s1",
+        product_id=None,
+        title_full="Товар",
+        title_short=None,
+        store_category_path=None,
+        unified_category_path=None,
+        brand=None,
+        model=None,
+        sku=None,
+        quantity=1,
+        unit_price=None,
+        discount_amount=None,
+        shipping_amount=None,
+        total_amount=None,
+        currency="RUB",
+        product_url=None,
+        order_url=None,
+        receipt_url=None,
+    )
+
+
+def _add_wb_order(repository) -> int:  # noqa: ANN001
+    store_id = repository.upsert_store("wb", "Wildberries")
+    order_id = repository.upsert_order(
+        store_id=store_id,
+        account_id=None,
+        seller_id=None,
+        external_order_id="W1",
+        dedupe_key="order-w1",
+        order_datetime="2025-11-15T09:00:00+00:00",
+        paid_datetime=None,
+        delivered_datetime=None,
+        currency="RUB",
+        subtotal_amount=5000,
+        shipping_amount=0,
+        discount_amount=0,
+        total_amount=5000,
+        status="ok",
+        source_url=None,
+        raw_ref="2",
+    )
+    return repository.upsert_order_item(
+        order_id=order_id,
+        external_item_id="w1",
+        dedupe_key="w1",
+        product_id=None,
+        title_full="Куртка",
+        title_short="Куртка",
+        store_category_path=None,
+        unified_category_path=None,
+        brand=None,
+        model=None,
+        sku=None,
+        quantity=1,
+        unit_price=5000,
+        discount_amount=0,
+        shipping_amount=0,
+        total_amount=5000,
+        currency="RUB",
+        product_url=None,
+        order_url=None,
+        receipt_url=None,
+    )
+
+
 @pytest.fixture()
 def repository(tmp_path: Path):
     db_path = tmp_path / "grab.sqlite3"
@@ -20,6 +208,30 @@ def repository(tmp_path: Path):
         repo.close()
 
 
+@pytest.fixture()
+def create_order_and_items(repository: GrabRepository) -> Callable[[], tuple[int, int, int]]:
+    """Фабрика: магазин ozon, аккаунт me@gmail.com, заказ A1 от 2026-02-01 и позиции i1, i2 по 100 ₽."""
+    return lambda: _create_order_and_items(repository)
+
+
+@pytest.fixture()
+def create_item(repository: GrabRepository) -> Callable[[], int]:
+    """Фабрика: одна позиция в заказе S1 магазина ozon, без дат и сумм."""
+    return lambda: _create_item(repository)
+
+
+@pytest.fixture()
+def add_wb_order(repository: GrabRepository) -> Callable[[], int]:
+    """Фабрика: заказ W1 магазина wb от 2025-11-15 с одной позицией на 5000 ₽."""
+    return lambda: _add_wb_order(repository)
+
+
+@pytest.fixture()
+def item_row() -> Callable[..., dict]:
+    """Строка для upsert_order_items_bulk; поля переопределяются именованными аргументами."""
+    return _item_row
+
+
 @pytest.fixture()
 def settings(tmp_path: Path) -> Settings:
     root = tmp_path / "project"
@@ -36,3 +248,110 @@ def test_logger() -> logging.Logger:
     logger.addHandler(logging.NullHandler())
     logger.setLevel(logging.INFO)
     return logger
+
+
+@dataclass
+class HttpRoute:
+    body: bytes
+    status: int = 200
+    headers: dict[str, str] = field(default_factory=dict)
+    delay_sec: float = 0.0
+    fail_times: int = 0
+
+
+class LocalHttpServer:
+    """Локальный HTTP/1.1 сервер для тестов скачивания медиа."""
+
+    def __init__(self) -> None:
+        self.routes: dict[str, HttpRoute] = {}
+        self.requests: list[dict] = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def add_route(self, path: str, body: bytes, **kwargs) -> HttpRoute:  # noqa: ANN003
+        route = HttpRoute(body=body, **kwargs)
+        self.routes[path] = route
+        return route
+
+    def url(self, path: str) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{path}"
+
+    def hits(self, path: str) -> int:
+        return sum(1 for request in self.requests if request["path"] == path)
+
+    def _handler_class(self) -> type[BaseHTTPRequestHandler]:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args) -> None:  # noqa: A002,ANN001
+                return
+
+            def do_GET(self) -> None:  # noqa: N802
+                with server._lock:
+                    server.active += 1
+                    server.max_active = max(server.max_active, server.active)
+                    server.requests.append(
+                        {"path": self.path, "headers": dict(self.headers), "client": self.client_address}
+                    )
+                try:
+                    self._respond(server.routes.get(self.path))
+                finally:
+                    with server._lock:
+                        server.active -= 1
+
+            def _respond(self, route: HttpRoute | None) -> None:
+                if route is None:
+                    self._send(404, {}, b"not found")
+                    return
+                if route.delay_sec:
+                    time.sleep(route.delay_sec)
+                if route.fail_times > 0:
+                    route.fail_times -= 1
+                    self._send(503, {}, b"try later")
+                    return
+                etag = route.headers.get("ETag")
+                if etag and self.headers.get("If-None-Match") == etag:
+                    self._send(304, {"ETag": etag, "Content-Length": "0"}, b"")
+                    return
+                self._send(route.status, route.headers, route.body)
+
+            def _send(self, status: int, headers: dict[str, str], body: bytes) -> None:
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                if "Content-Length" not in headers and "Transfer-Encoding" not in headers:
+                    self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if headers.get("Transfer-Encoding") == "chunked":
+                    for offset in range(0, len(body), 4096):
+                        chunk = body[offset : offset + 4096]
+                        self.wfile.write(f"{len(chunk):X}\r\n".encode() + chunk + b"\r\n")
+                    self.wfile.write(b"0\r\n\r\n")
+                    return
+                self.wfile.write(body)
+
+        return Handler
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture()
+def http_server():
+    server = LocalHttpServer()
+    server.start()
+    try:
+        yield server
+    finally:
+        server.stop()
@@ -0,0 +1,173 @@
+﻿from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+from grab.core.db import backup_database, connect_db
+from grab.core.db.compression import load_zstandard
+from grab.core.media import MediaManager
+from grab.services import create_snapshot
+
+
+def _fill(db_path: Path, rows: int) -> None:
+    connection = connect_db(db_path)
+    with connection:
+        connection.execute("CREATE TABLE IF NOT EXISTS payload (id INTEGER PRIMARY KEY, data BLOB)")
+        connection.executemany("INSERT INTO payload (data) VALUES (randomblob(2000))", [()] * rows)
+    connection.close()
+
+
+def test_backup_is_standalone_and_verified(tmp_path: Path) -> None:
+    db_path = tmp_path / "grab.sqlite3"
+    _fill(db_path, 500)
+    steps: list[tuple[int, int]] = []
+
+    result = backup_database(db_path, tmp_path / "backups" / "copy.sqlite3", step_pages=64, progress=lambda done, total: steps.append((done, total)))
+
+    assert result.path.is_file()
+    assert not list(result.path.parent.glob("*.tmp"))
+    assert len(steps) > 1 and steps[-1][0] == steps[-1][1] == result.page_count
+    copy = sqlite3.connect(result.path)
+    assert copy.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+    assert copy.execute("SELECT COUNT(*) FROM payload").fetchone()[0] == 500
+    copy.close()
+
+
+def test_backup_keeps_one_snapshot_while_writer_commits(tmp_path: Path) -> None:
+    db_path = tmp_path / "grab.sqlite3"
+    _fill(db_path, 3000)
+    stop = threading.Event()
+    committed: list[int] = []
+
+    def writer() -> None:
+        connection = connect_db(db_path)
+        while not stop.is_set():
+            with connection:
+                connection.execute("INSERT INTO payload (data) VALUES (randomblob(2000))")
+            committed.append(1)
+        connection.close()
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        # Пишем и во время копирования: progress дает писателю время между шагами
+        result = backup_database(
+            db_path,
+            tmp_path / "copy.sqlite3",
+            step_pages=16,
+            progress=lambda done, total: stop.wait(0.001),
+        )
+    finally:
+        stop.set()
+        thread.join()
+
+    assert committed
+    assert result.restarts == 0
+    copy = sqlite3.connect(result.path)
+    assert copy.execute("PRAGMA quick_check").fetchone()[0] == "ok"
+    assert 3000 <= copy.execute("SELECT COUNT(*) FROM payload").fetchone()[0] <= 3000 + len(committed)
+    copy.close()
+
+
+def test_snapshot_writes_compressed_db_and_media_manifest(repository, create_order_and_items, tmp_path: Path) -> None:  # noqa: ANN001
+    _, item1, item2 = create_order_and_items()
+    media_root = tmp_path / "media"
+    manager = MediaManager(repository=repository, media_root=media_root)
+    saved = manager.save_bytes(
+        store_code="ozon",
+        order_ref="A1",
+        item_id=item1,
+        filename="photo.jpg",
+        content=b"jpeg bytes",
+        mime="image/jpeg",
+        source_url="https://example.com/photo.jpg",
+        source="test",
+    )
+    lost = manager.save_bytes(
+        store_code="ozon",
+        order_ref="A1",
+        item_id=item2,
+        filename="lost.jpg",
+        content=b"lost bytes",
+        mime="image/jpeg",
+        source_url=None,
+        source="test",
+    )
+    lost_sha = hashlib.sha256(b"lost bytes").hexdigest()
+    manager.blob_store.blob_path(lost_sha).unlink()
+    Path(lost).unlink()
+    # Запись до появления blob-хранилища: файл лежит только в папке позиции
+    legacy = media_root / "ozon" / "A1" / str(item2) / "legacy.jpg"
+    legacy.write_bytes(b"legacy bytes")
+    legacy_sha = hashlib.sha256(b"legacy bytes").hexdigest()
+    repository.upsert_media(item2, None, str(legacy), "image/jpeg", legacy_sha, 12, "test", None)
+    db_path = Path(repository.connection.execute("PRAGMA database_list").fetchone()["file"])
+
+    result = create_snapshot(db_path, media_root, tmp_path / "backups")
+
+    manifest = json.loads(result.manifest_path.read_text(encoding="utf-8"))
+    assert manifest["database"]["codec"] == ("zstd" if load_zstandard() is not None else "gzip")
+    packed = result.database_path.read_bytes()
+    raw = load_zstandard().ZstdDecompressor().decompressobj().decompress(packed) if load_zstandard() else gzip.decompress(packed)
+    assert hashlib.sha256(raw).hexdigest() == manifest["database"]["sha256"]
+    assert manifest["database"]["size_bytes"] == len(raw)
+    assert "011_spend_aggregates.py" in manifest["migrations"]
+    assert manifest["counts"]["media"] == 3
+    assert manifest["media"]["missing_blobs"] == [lost_sha]
+    assert not (result.directory / "grab.sqlite3").exists()
+
+    with gzip.open(result.media_manifest_path, "rt", encoding="utf-8") as fh:
+        entries = {entry["path"]: entry for entry in map(json.loads, fh)}
+    photo_sha = hashlib.sha256(b"jpeg bytes").hexdigest()
+    view = Path(saved).relative_to(media_root).as_posix()
+    assert entries[view]["sha256"] == photo_sha
+    assert entries[f"_blobs/{photo_sha[:2]}/{photo_sha[2:4]}/{photo_sha}"]["size"] == len(b"jpeg bytes")
+    assert entries[Path(legacy).relative_to(media_root).as_posix()]["sha256"] == legacy_sha
+    assert manifest["media"]["files"] == len(entries)
+
+
+def test_snapshot_skips_files_removed_during_walk(repository, tmp_path: Path, monkeypatch) -> None:  # noqa: ANN001
+    media_root = tmp_path / "media"
+    (media_root / "ozon").mkdir(parents=True)
+    (media_root / "ozon" / "kept.jpg").write_bytes(b"kept")
+    real_walk = os.walk
+
+    def walk_with_vanished_file(top):  # noqa: ANN001, ANN202
+        for dir_path, dir_names, file_names in real_walk(top):
+            yield dir_path, dir_names, [*file_names, "vanished.jpg"]
+
+    monkeypatch.setattr("grab.services.snapshot.os.walk", walk_with_vanished_file)
+    db_path = Path(repository.connection.execute("PRAGMA database_list").fetchone()["file"])
+
+    result = create_snapshot(db_path, media_root, tmp_path / "backups")
+
+    with gzip.open(result.media_manifest_path, "rt", encoding="utf-8") as fh:
+        assert [json.loads(line)["path"] for line in fh] == ["ozon/kept.jpg"]
+
+
+def test_snapshot_falls_back_to_gzip_without_zstandard(repository, create_order_and_items, tmp_path: Path, monkeypatch) -> None:  # noqa: ANN001
+    monkeypatch.setattr("grab.services.snapshot.load_zstandard", lambda: None)
+    create_order_and_items()
+    db_path = Path(repository.connection.execute("PRAGMA database_list").fetchone()["file"])
+
+    result = create_snapshot(db_path, tmp_path / "media", tmp_path / "backups", include_media=False)
+
+    manifest = json.loads(result.manifest_path.read_text(encoding="utf-8"))
+    assert result.database_path.name == "grab.sqlite3.gz"
+    assert hashlib.sha256(gzip.decompress(result.database_path.read_bytes())).hexdigest() == manifest["database"]["sha256"]
+    assert "media" not in manifest and result.media_manifest_path is None
+
+
+def test_snapshots_in_same_second_do_not_collide(repository, tmp_path: Path, monkeypatch) -> None:  # noqa: ANN001
+    monkeypatch.setattr("grab.services.snapshot._timestamp", lambda: "20260101-000000")
+    db_path = Path(repository.connection.execute("PRAGMA database_list").fetchone()["file"])
+
+    first = create_snapshot(db_path, tmp_path / "media", tmp_path / "backups", include_media=False)
+    second = create_snapshot(db_path, tmp_path / "media", tmp_path / "backups", include_media=False)
+
+    assert [first.directory.name, second.directory.name] == ["grab-20260101-000000", "grab-20260101-000000-2"]
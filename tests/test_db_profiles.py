@@ -0,0 +1,55 @@
+﻿from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from grab.core.db import BULK_DB_PROFILE, GrabRepository, connect_db, read_pragmas
+from grab.services import run_doctor_checks
+
+
+def test_connect_db_applies_profiles(tmp_path: Path) -> None:
+    db_path = tmp_path / "grab.sqlite3"
+
+    connection = connect_db(db_path)
+    default = read_pragmas(connection)
+    connection.close()
+    assert default["journal_mode"] == "WAL"
+    assert default["synchronous"] == "FULL"
+    assert default["busy_timeout_ms"] == 5000
+    assert default["foreign_keys"] == 1
+
+    connection = connect_db(db_path, profile=BULK_DB_PROFILE)
+    bulk = read_pragmas(connection)
+    connection.close()
+    assert bulk["journal_mode"] == "WAL"
+    assert bulk["synchronous"] == "NORMAL"
+    assert bulk["temp_store"] == "MEMORY"
+    assert bulk["cache_size_kib"] == 256 * 1024
+    assert bulk["mmap_size"] == 1024 * 1024 * 1024
+
+    with pytest.raises(ValueError):
+        connect_db(db_path, profile="turbo")
+
+
+def test_wal_lets_reader_work_during_open_write(tmp_path: Path) -> None:
+    db_path = tmp_path / "grab.sqlite3"
+    with GrabRepository(db_path, profile=BULK_DB_PROFILE) as writer, GrabRepository(db_path) as reader:
+        writer.migrate()
+        writer.upsert_store("ozon", "Ozon")
+
+        writer.connection.execute("BEGIN IMMEDIATE")
+        writer.connection.execute("INSERT INTO stores (code, name) VALUES ('wb', 'Wildberries')")
+        # Читатель не ждет busy_timeout и видит последний закоммиченный снимок
+        codes = [row["code"] for row in reader.connection.execute("SELECT code FROM stores ORDER BY code")]
+        writer.connection.commit()
+
+    assert codes == ["ozon"]
+
+
+def test_doctor_reports_db_pragmas(settings) -> None:  # noqa: ANN001
+    checks = {check["check"]: check for check in run_doctor_checks(settings)}
+
+    assert checks["db_profile"]["status"] == "ok"
+    assert checks["db_profile"]["detail"].startswith("default: journal_mode=WAL synchronous=FULL")
+    assert "synchronous=NORMAL" in checks["db_sync_profile"]["detail"]
@@ -51,3 +51,85 @@ def test_db_upsert_order_is_idempotent(repository) -> None:  # noqa: ANN001
     ).fetchone()
     assert row["total_amount"] == 900.0
     assert row["status"] == "paid"
+
+
+def test_bulk_upsert_items_returns_ids_in_input_order(repository, create_order_and_items, item_row) -> None:  # noqa: ANN001
+    order_id, item1, item2 = create_order_and_items()
+
+    ids = repository.upsert_order_items_bulk(
+        [
+            item_row(order_id, "new-1"),
+            item_row(order_id, "i2", brand="Acme", title_full=None),
+            item_row(order_id, "new-2"),
+            item_row(order_id, "new-1", sku="SKU-1"),
+            item_row(order_id, "i1"),
+        ]
+    )
+
+    assert ids[1] == item2 and ids[4] == item1
+    assert ids[0] == ids[3] and len({ids[0], ids[2], item1, item2}) == 4
+    merged = repository.connection.execute("SELECT * FROM order_items WHERE id = ?", (item2,)).fetchone()
+    # Та же COALESCE-семантика, что у upsert_order_item: NULL не затирает сохраненное значение
+    assert merged["brand"] == "Acme"
+    assert merged["title_full"] == "Товар 2"
+    assert repository.connection.execute("SELECT sku FROM order_items WHERE id = ?", (ids[0],)).fetchone()[0] == "SKU-1"
+    assert repository.upsert_order_items_bulk([]) == []
+
+
+def test_bulk_upsert_attributes_and_media_match_single_row(repository, create_order_and_items) -> None:  # noqa: ANN001
+    _, item1, item2 = create_order_and_items()
+    attributes = [
+        {
+            "product_id": None,
+            "item_id": item,
+            "attr_key": key,
+            "value_type": "text",
+            "value_text": text,
+            "value_number": number,
+            "value_bool": flag,
+            "value_json_raw": None,
+            "source": "bulk",
+        }
+        for item, key, text, number, flag in [
+            (item1, "color", "red", None, None),
+            (item2, "weight", None, 1.5, None),
+            (item1, "wireless", None, None, True),
+        ]
+    ]
+    ids = repository.upsert_product_attributes_bulk(attributes)
+    single = repository.upsert_product_attribute(
+        product_id=None,
+        item_id=item2,
+        attr_key="weight",
+        value_type="text",
+        value_text=None,
+        value_number=1.5,
+        value_bool=None,
+        value_json_raw=None,
+        source=None,
+    )
+    assert single == ids[1]
+    assert len(set(ids)) == 3
+    stored = repository.connection.execute("SELECT value_bool, source FROM product_attributes WHERE id = ?", (ids[2],))
+    assert tuple(stored.fetchone()) == (1, "bulk")
+
+    media = [
+        {
+            "related_item_id": item,
+            "source_url": url,
+            "local_path_abs": f"/media/{index}.jpg",
+            "mime": "image/jpeg",
+            "sha256_value": f"{index:064x}",
+            "size_bytes": 10,
+            "source": "bulk",
+            "meta_json": {"index": index},
+        }
+        for index, (item, url) in enumerate([(item1, None), (item2, "https://example.com/a.jpg")])
+    ]
+    media_ids = repository.upsert_media_bulk(media)
+    assert media_ids == [
+        repository.upsert_media(**{**row, "mime": None, "meta_json": None}) for row in media
+    ]
+    row = repository.connection.execute("SELECT mime, meta_json FROM media WHERE id = ?", (media_ids[0],)).fetchone()
+    assert row["mime"] == "image/jpeg"
+    assert row["meta_json"] == '{"index": 0}'
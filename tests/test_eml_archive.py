@@ -0,0 +1,214 @@
+﻿from __future__ import annotations
+
+import base64
+import gzip
+import hashlib
+import imaplib
+from datetime import datetime, timezone
+from email.message import EmailMessage
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from grab.config import ImapAccountConfig
+from grab.core.archive import EML_DIR_NAME, EmlArchive
+from grab.services.sync import SyncService
+from grab.sources.email_gmail import source as gmail_source
+from grab.sources.email_gmail.source import GmailEmailSource
+from grab.sources.email_imap.source import ImapEmailSource
+from grab.sources.models import EmailMessageData
+
+
+def _raw_message() -> bytes:
+    message = EmailMessage()
+    message["Subject"] = "Ozon заказ №123456"
+    message["From"] = "info@ozon.ru"
+    message.set_content("Заказ №123456\n- Товар А, 1 шт, 1000 ₽\nИтого: 1000 ₽")
+    message.add_attachment(b"\x89PNG image", maintype="image", subtype="png", filename="photo.png")
+    return message.as_bytes()
+
+
+class _FakeImap:
+    def __init__(self, raw: bytes):
+        self.raw = raw
+
+    def __enter__(self) -> _FakeImap:
+        return self
+
+    def __exit__(self, *exc_info) -> None:  # noqa: ANN002
+        return None
+
+    def login(self, username: str, password: str) -> None:
+        return None
+
+    def select(self, mailbox: str) -> tuple[str, list[bytes]]:
+        return "OK", [b"1"]
+
+    def search(self, charset, *criteria) -> tuple[str, list[bytes]]:  # noqa: ANN001, ANN002
+        return "OK", [b"1"]
+
+    def fetch(self, msg_id: bytes, parts: str) -> tuple[str, list]:
+        return "OK", [(b"1 (RFC822 {%d}" % len(self.raw), self.raw)]
+
+
+class _Request:
+    def __init__(self, response: dict):
+        self.response = response
+
+    def execute(self) -> dict:
+        return self.response
+
+
+class _FakeGmailMessages:
+    """Подмножество users().messages() из googleapiclient, которое использует источник."""
+
+    def __init__(self, full: dict, raw_encoded: str):
+        self.full = full
+        self.raw_encoded = raw_encoded
+        self.formats: list[str] = []
+
+    def list(self, **kwargs) -> _Request:  # noqa: ANN003
+        return _Request({"messages": [{"id": self.full["id"]}]})
+
+    def list_next(self, request: _Request, response: dict) -> None:
+        return None
+
+    def get(self, userId: str, id: str, format: str) -> _Request:  # noqa: A002, N803
+        self.formats.append(format)
+        if format == "raw":
+            return _Request({"id": id, "raw": self.raw_encoded})
+        return _Request(self.full)
+
+
+def _gmail_full_response() -> dict:
+    text = "Заказ №123456\n- Товар А, 1 шт, 1000 ₽\nИтого: 1000 ₽"
+    return {
+        "id": "g-1",
+        "threadId": "t-1",
+        "internalDate": "1769940000000",
+        "payload": {
+            "mimeType": "multipart/alternative",
+            "headers": [
+                {"name": "Subject", "value": "Ozon заказ №123456"},
+                {"name": "From", "value": "info@ozon.ru"},
+                {"name": "Message-ID", "value": "<g-1@ozon.ru>"},
+            ],
+            "parts": [
+                {
+                    "partId": "0",
+                    "mimeType": "text/plain",
+                    "body": {"size": len(text.encode()), "data": base64.urlsafe_b64encode(text.encode()).decode()},
+                }
+            ],
+        },
+    }
+
+
+def _gmail_source(monkeypatch, tmp_path: Path, archive: bool):  # noqa: ANN001, ANN202
+    raw = _raw_message()
+    while len(raw) % 3 == 0:
+        raw += b"\n"
+    # Gmail отдает base64url без выравнивающих "="
+    raw_encoded = base64.urlsafe_b64encode(raw).decode().rstrip("=")
+    messages = _FakeGmailMessages(_gmail_full_response(), raw_encoded)
+    users = SimpleNamespace(messages=lambda: messages)
+    monkeypatch.setattr(gmail_source, "build", lambda *args, **kwargs: SimpleNamespace(users=lambda: users))
+    source = GmailEmailSource(
+        auth_manager=SimpleNamespace(ensure_credentials=lambda: None),
+        account="me@gmail.com",
+        eml_archive=EmlArchive(tmp_path) if archive else None,
+    )
+    return source, messages, raw
+
+
+def test_eml_archive_content_addressed_and_deduplicated(tmp_path: Path) -> None:
+    raw = _raw_message()
+    archive = EmlArchive(tmp_path / EML_DIR_NAME)
+
+    path = archive.put(raw)
+    sha = hashlib.sha256(raw).hexdigest()
+
+    assert path == tmp_path / EML_DIR_NAME / sha[:2] / sha[2:4] / f"{sha}.eml.gz"
+    assert gzip.decompress(path.read_bytes()) == raw
+    # Повторная запись того же письма не создает второй файл и не перезаписывает первый
+    mtime = path.stat().st_mtime_ns
+    assert archive.put(raw) == path
+    assert path.stat().st_mtime_ns == mtime
+    assert len(list((tmp_path / EML_DIR_NAME).rglob("*.eml.gz"))) == 1
+    assert not list((tmp_path / EML_DIR_NAME).rglob("*.tmp"))
+
+
+def test_eml_archive_round_trip_keeps_mime_structure(tmp_path: Path) -> None:
+    archive = EmlArchive(tmp_path)
+    path = archive.put(_raw_message())
+
+    message = archive.read_message(path)
+
+    assert message["Subject"] == "Ozon заказ №123456"
+    attachments = list(message.iter_attachments())
+    assert [part.get_filename() for part in attachments] == ["photo.png"]
+    assert attachments[0].get_content() == b"\x89PNG image"
+
+
+def test_sync_stores_raw_eml_path(settings, repository, test_logger) -> None:  # noqa: ANN001
+    settings.email_archive_eml = True
+    service = SyncService(settings=settings, repository=repository, logger=test_logger)
+    eml_path = service.eml_archive.put(_raw_message())
+
+    message = EmailMessageData(
+        source="imap_mailru",
+        provider="mailru",
+        account="user@mail.ru",
+        message_id="m-eml",
+        thread_id=None,
+        subject="Ozon заказ №123456",
+        sender="info@ozon.ru",
+        recipients=["user@mail.ru"],
+        sent_at=datetime(2026, 2, 1, tzinfo=timezone.utc),
+        text_body="Заказ №123456\n- Товар А, 1 шт, 1000 ₽\nИтого: 1000 ₽",
+        html_body=None,
+        raw_eml_path=str(eml_path),
+    )
+    service._collect_email_messages = lambda since=None, max_messages=200: [message]  # noqa: SLF001,E731
+
+    service.sync(source="email", since=None, media_download=False, correlation_id="eml-test", max_messages=200)
+
+    row = repository.connection.execute("SELECT raw_eml_path FROM raw_messages WHERE external_message_id = 'm-eml'").fetchone()
+    assert row["raw_eml_path"] == str(eml_path)
+    assert eml_path.is_relative_to(settings.raw_dir / EML_DIR_NAME)
+
+
+def test_imap_source_archives_fetched_bytes(monkeypatch, tmp_path: Path) -> None:  # noqa: ANN001
+    raw = _raw_message()
+    monkeypatch.setattr(imaplib, "IMAP4_SSL", lambda host, port: _FakeImap(raw))
+    config = ImapAccountConfig(provider="mailru", host="imap.mail.ru", port=993, username="user@mail.ru", password="x")
+    source = ImapEmailSource(config, eml_archive=EmlArchive(tmp_path))
+
+    [message] = source.fetch_messages(keywords=["ozon"])
+
+    assert message.subject == "Ozon заказ №123456"
+    assert gzip.decompress(Path(message.raw_eml_path).read_bytes()) == raw
+    assert message.raw_payload == {"rfc822_size": len(raw)}
+    assert [attachment.filename for attachment in message.attachments] == ["photo.png"]
+
+
+@pytest.mark.parametrize("archive", [True, False])
+def test_gmail_source_fetches_raw_only_for_archive(monkeypatch, tmp_path: Path, archive: bool) -> None:  # noqa: ANN001
+    source, messages, raw = _gmail_source(monkeypatch, tmp_path, archive)
+
+    [message] = source.fetch_messages(keywords=["ozon"])
+
+    assert message.message_id == "<g-1@ozon.ru>"
+    assert message.text_body.startswith("Заказ №123456")
+    part = message.raw_payload["payload"]["parts"][0]
+    if archive:
+        assert messages.formats == ["full", "raw"]
+        assert gzip.decompress(Path(message.raw_eml_path).read_bytes()) == raw
+        # Тело части есть в .eml.gz, в raw_json остаются только структура и заголовки
+        assert part == {"partId": "0", "mimeType": "text/plain", "body": {"size": part["body"]["size"]}}
+        assert message.raw_payload["payload"]["headers"][0] == {"name": "Subject", "value": "Ozon заказ №123456"}
+    else:
+        assert messages.formats == ["full"]
+        assert message.raw_eml_path is None
+        assert "data" in part["body"]
@@ -0,0 +1,236 @@
+﻿from __future__ import annotations
+
+import csv
+from pathlib import Path
+
+import openpyxl
+import pytest
+import typer
+
+from grab.cli import _build_export_filter
+from grab.core.db import ExportFilter
+from grab.core.media import MediaManager
+from grab.services import export_data, export_incremental
+from grab.services.exporter import write_csv_stream, write_xlsx_stream
+
+
+def test_csv_export_streams_rows_in_chunks(repository, create_order_and_items, tmp_path: Path) -> None:  # noqa: ANN001
+    _, item1, _ = create_order_and_items()
+    manager = MediaManager(repository=repository, media_root=tmp_path / "media")
+    for index in range(2):
+        manager.save_bytes(
+            store_code="ozon",
+            order_ref="A1",
+            item_id=item1,
+            filename=f"photo{index}.jpg",
+            content=f"content-{index}".encode(),
+            mime="image/jpeg",
+            source_url=f"https://example.com/{index}.jpg",
+            source="test",
+        )
+
+    csv_path = tmp_path / "stream.csv"
+    written = write_csv_stream(repository, csv_path, chunk_size=1)
+
+    assert written == 2
+    assert csv_path.read_bytes().startswith(b"\xef\xbb\xbf")
+    with csv_path.open(encoding="utf-8-sig", newline="") as fh:
+        rows = list(csv.DictReader(fh))
+    expected = repository.fetch_export_rows()
+    assert list(rows[0].keys()) == list(expected[0].keys())
+    assert [row["item_db_id"] for row in rows] == [str(row["item_db_id"]) for row in expected]
+    assert rows[0]["title_full"] == "Товар 1"
+    assert set(rows[0]["media_urls"].split(" | ")) == {"https://example.com/0.jpg", "https://example.com/1.jpg"}
+    assert rows[1]["media_paths"] == ""
+
+
+def test_csv_export_of_empty_database_writes_header(repository, tmp_path: Path) -> None:  # noqa: ANN001
+    files = export_data(repository, ["csv"], tmp_path / "out")
+
+    lines = files[0].read_text(encoding="utf-8-sig").splitlines()
+    assert len(lines) == 1
+    assert lines[0].startswith("order_db_id,item_db_id,store_code")
+
+
+def test_xlsx_export_splits_sheets_and_keeps_columns(repository, create_order_and_items, tmp_path: Path) -> None:  # noqa: ANN001
+    create_order_and_items()
+    xlsx_path = tmp_path / "items.xlsx"
+
+    written = write_xlsx_stream(repository, xlsx_path, chunk_size=1, max_rows=2)
+
+    assert written == 2
+    workbook = openpyxl.load_workbook(xlsx_path)
+    assert workbook.sheetnames == ["items", "items_2"]
+    expected = repository.fetch_export_rows()
+    for sheet_name, expected_row in zip(workbook.sheetnames, expected, strict=True):
+        rows = list(workbook[sheet_name].iter_rows(values_only=True))
+        assert list(rows[0]) == list(expected_row.keys())
+        assert len(rows) == 2
+        assert dict(zip(rows[0], rows[1], strict=True))["item_db_id"] == expected_row["item_db_id"]
+
+
+def _csv_rows(path: Path) -> list[dict[str, str]]:
+    with path.open(encoding="utf-8-sig", newline="") as fh:
+        return list(csv.DictReader(fh))
+
+
+def test_export_filter_selects_rows_in_sql(repository, create_order_and_items, add_wb_order, tmp_path: Path) -> None:  # noqa: ANN001
+    _, item1, item2 = create_order_and_items()
+    wb_item = add_wb_order()
+
+    def exported(export_filter: ExportFilter) -> list[int]:
+        path = tmp_path / "filtered.csv"
+        write_csv_stream(repository, path, export_filter=export_filter)
+        return sorted(int(row["item_db_id"]) for row in _csv_rows(path))
+
+    assert exported(ExportFilter(stores=("wb",))) == [wb_item]
+    assert exported(ExportFilter(stores=("wb", "ozon"))) == sorted([item1, item2, wb_item])
+    assert exported(ExportFilter(since="2026-01-01")) == [item1, item2]
+    assert exported(ExportFilter(until="2026-02-01")) == [wb_item]
+    assert exported(ExportFilter(account="me@gmail.com")) == [item1, item2]
+    assert exported(ExportFilter(min_amount=1000)) == [wb_item]
+    assert exported(ExportFilter(stores=("ozon",), min_amount=1000)) == []
+
+
+def test_export_columns_projection_and_hidden_keys(repository, create_order_and_items, tmp_path: Path) -> None:  # noqa: ANN001
+    _, item1, _ = create_order_and_items()
+    thumbnails = {item1: tmp_path / "thumb.jpg"}
+    export_filter = ExportFilter(columns=("title_full", "total_amount"))
+
+    csv_path = tmp_path / "columns.csv"
+    write_csv_stream(repository, csv_path, thumbnails=thumbnails, export_filter=export_filter)
+    rows = _csv_rows(csv_path)
+    assert list(rows[0].keys()) == ["title_full", "total_amount", "thumbnail_path"]
+    assert {row["title_full"]: row["thumbnail_path"] for row in rows} == {
+        "Товар 1": str(tmp_path / "thumb.jpg"),
+        "Товар 2": "",
+    }
+
+    xlsx_path = tmp_path / "columns.xlsx"
+    write_xlsx_stream(repository, xlsx_path, export_filter=export_filter)
+    sheet_rows = list(openpyxl.load_workbook(xlsx_path)["items"].iter_rows(values_only=True))
+    assert sheet_rows[0] == ("title_full", "total_amount")
+    assert len(sheet_rows) == 3
+
+    with pytest.raises(ValueError):
+        ExportFilter(columns=("no_such_column",))
+
+
+def _age_all_rows(repository) -> None:  # noqa: ANN001
+    with repository.connection:
+        repository.connection.execute("UPDATE orders SET updated_at = '2000-01-01 00:00:00'")
+        repository.connection.execute("UPDATE order_items SET updated_at = '2000-01-01 00:00:00'")
+
+
+def test_incremental_export_writes_deltas_and_compacts(repository, create_order_and_items, tmp_path: Path) -> None:  # noqa: ANN001
+    _, _, item2 = create_order_and_items()
+    out_dir = tmp_path / "out"
+
+    first = export_incremental(repository, ["csv"], out_dir)
+    assert [path.name for path in first] == ["grab_export.csv"]
+
+    _age_all_rows(repository)
+    with repository.connection:
+        repository.connection.execute(
+            "UPDATE order_items SET title_full = 'Товар 2 (новое)', updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (item2,),
+        )
+    second = export_incremental(repository, ["csv"], out_dir)
+    assert len(second) == 1 and second[0].name.startswith("grab_export_delta_")
+    with second[0].open(encoding="utf-8-sig", newline="") as fh:
+        delta_rows = list(csv.DictReader(fh))
+    assert [(row["item_db_id"], row["title_full"]) for row in delta_rows] == [(str(item2), "Товар 2 (новое)")]
+
+    _age_all_rows(repository)
+    assert export_incremental(repository, ["csv"], out_dir) == []
+
+    compacted = export_incremental(repository, ["csv"], out_dir, compact=True)
+    assert [path.name for path in compacted] == ["grab_export.csv"]
+    assert sorted(path.name for path in out_dir.iterdir()) == ["grab_export.csv"]
+
+
+def test_incremental_exports_with_different_filters_share_a_folder(repository, create_order_and_items, tmp_path: Path) -> None:  # noqa: ANN001
+    _, _, item2 = create_order_and_items()
+    wb_store = repository.upsert_store("wb", "Wildberries")
+    repository.upsert_order(
+        store_id=wb_store,
+        account_id=None,
+        seller_id=None,
+        external_order_id="W1",
+        dedupe_key="order-w1",
+        order_datetime="2026-02-02T10:00:00+00:00",
+        paid_datetime=None,
+        delivered_datetime=None,
+        currency="RUB",
+        subtotal_amount=None,
+        shipping_amount=None,
+        discount_amount=None,
+        total_amount=None,
+        status=None,
+        source_url=None,
+        raw_ref=None,
+    )
+    out_dir = tmp_path / "out"
+    ozon = ExportFilter(stores=("ozon",))
+    wb = ExportFilter(stores=("wb",))
+
+    (ozon_snapshot,) = export_incremental(repository, ["csv"], out_dir, export_filter=ozon)
+    _age_all_rows(repository)
+    with repository.connection:
+        repository.connection.execute(
+            "UPDATE order_items SET title_full = 'Товар 2 (новое)', updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (item2,),
+        )
+    (ozon_delta,) = export_incremental(repository, ["csv"], out_dir, export_filter=ozon)
+    (wb_snapshot,) = export_incremental(repository, ["csv"], out_dir, export_filter=wb)
+    plain = export_incremental(repository, ["csv"], out_dir)
+
+    # Снимок и дельта ozon пережили выгрузки wb и без фильтра в ту же папку
+    assert ozon_snapshot.exists() and ozon_delta.exists()
+    assert ozon_delta.name.startswith(f"{ozon_snapshot.name.removesuffix('.csv')}_delta_")
+    assert len({ozon_snapshot.name, wb_snapshot.name, plain[0].name}) == 3
+    assert plain[0].name == "grab_export.csv"
+
+
+def test_parquet_export_partitions_by_store_and_year(repository, create_order_and_items, tmp_path: Path) -> None:  # noqa: ANN001
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+
+    _, item1, _ = create_order_and_items()
+    manager = MediaManager(repository=repository, media_root=tmp_path / "media")
+    for index in range(2):
+        manager.save_bytes(
+            store_code="ozon",
+            order_ref="A1",
+            item_id=item1,
+            filename=f"photo{index}.jpg",
+            content=f"content-{index}".encode(),
+            mime="image/jpeg",
+            source_url=f"https://example.com/{index}.jpg",
+            source="test",
+        )
+
+    files = export_data(repository, ["parquet"], tmp_path / "out")
+
+    dataset_dir = files[0]
+    assert [path.relative_to(dataset_dir).as_posix() for path in dataset_dir.rglob("*.parquet")] == [
+        "store_code=ozon/year=2026/part-0.parquet"
+    ]
+    part = pq.read_table(dataset_dir / "store_code=ozon" / "year=2026" / "part-0.parquet")
+    assert "store_code" not in part.schema.names
+    assert pa.types.is_dictionary(part.schema.field("currency").type)
+    assert pa.types.is_list(part.schema.field("media_paths").type)
+
+    table = pq.read_table(dataset_dir).to_pylist()
+    rows = {row["item_db_id"]: row for row in table}
+    assert rows[item1]["store_code"] == "ozon"
+    assert sorted(rows[item1]["media_urls"]) == ["https://example.com/0.jpg", "https://example.com/1.jpg"]
+    assert len(rows[item1]["media_paths"]) == 2
+    assert [row["media_paths"] for row in table if row["item_db_id"] != item1] == [[]]
+
+
+@pytest.mark.parametrize("since", ["notadate", "99999999999999999999"])
+def test_bad_filter_dates_are_reported_as_bad_parameter(since: str) -> None:
+    with pytest.raises(typer.BadParameter):
+        _build_export_filter(None, since, None, None, None, None)
+    assert _build_export_filter(None, "2026-01-01", "2026-01-31", None, None, None).until == "2026-02-01"
@@ -0,0 +1,140 @@
+﻿from __future__ import annotations
+
+import hashlib
+import os
+from pathlib import Path
+
+import pytest
+
+from grab.core.media import MediaDownloader, MediaManager
+
+
+def test_download_pool_saves_media_over_shared_session(repository, create_order_and_items, http_server, tmp_path: Path) -> None:  # noqa: ANN001
+    order_id, item1, item2 = create_order_and_items()
+    for index in range(4):
+        http_server.add_route(
+            f"/img{index}.jpg",
+            f"image-{index}".encode(),
+            headers={"Content-Type": "image/jpeg"},
+        )
+
+    with MediaDownloader(max_workers=4, per_host_limit=1, spool_dir=tmp_path / "spool") as downloader:
+        manager = MediaManager(repository=repository, media_root=tmp_path / "media", downloader=downloader)
+        pending = [
+            manager.submit_download(
+                store_code="ozon",
+                order_ref=str(order_id),
+                item_id=item1 if index % 2 else item2,
+                url=http_server.url(f"/img{index}.jpg"),
+                source="test:link",
+            )
+            for index in range(4)
+        ]
+        paths = [manager.complete_download(item) for item in pending]
+
+    assert [Path(path).read_bytes() for path in paths] == [f"image-{i}".encode() for i in range(4)]
+    # keep-alive: все запросы прошли через одно соединение
+    assert len({request["client"] for request in http_server.requests}) == 1
+    assert repository.connection.execute("SELECT COUNT(*) AS cnt FROM media").fetchone()["cnt"] == 4
+
+
+def test_same_url_in_flight_is_downloaded_once(repository, create_order_and_items, http_server, tmp_path: Path) -> None:  # noqa: ANN001
+    order_id, item1, item2 = create_order_and_items()
+    http_server.add_route("/shared.jpg", b"shared", headers={"Content-Type": "image/jpeg"}, delay_sec=0.1)
+    url = http_server.url("/shared.jpg")
+
+    with MediaDownloader(max_workers=4, spool_dir=tmp_path / "spool") as downloader:
+        manager = MediaManager(repository=repository, media_root=tmp_path / "media", downloader=downloader)
+        pending = [
+            manager.submit_download(store_code="ozon", order_ref=str(order_id), item_id=item_id, url=url, source="t")
+            for item_id in (item1, item2, item1)
+        ]
+        paths = [manager.complete_download(item) for item in pending]
+
+    assert http_server.hits("/shared.jpg") == 1
+    assert all(Path(path).read_bytes() == b"shared" for path in paths)
+    assert os.path.samefile(paths[0], paths[1])
+    assert manager._inflight == {}  # noqa: SLF001
+    assert repository.connection.execute("SELECT COUNT(*) AS cnt FROM media").fetchone()["cnt"] == 2
+
+
+def test_download_pool_respects_per_host_limit(http_server, tmp_path: Path) -> None:  # noqa: ANN001
+    for index in range(6):
+        http_server.add_route(f"/slow{index}.png", b"png", delay_sec=0.1)
+
+    with MediaDownloader(max_workers=6, per_host_limit=2, spool_dir=tmp_path) as downloader:
+        futures = [downloader.submit(http_server.url(f"/slow{index}.png")) for index in range(6)]
+        results = [future.result() for future in futures]
+
+    assert all(result.spooled.path.read_bytes() == b"png" for result in results)
+    assert http_server.max_active <= 2
+
+
+def test_download_retries_with_backoff(http_server, tmp_path: Path) -> None:  # noqa: ANN001
+    http_server.add_route("/flaky.jpg", b"ok", fail_times=2)
+
+    downloader = MediaDownloader(max_retries=3, backoff_base_sec=0.01, spool_dir=tmp_path)
+    result = downloader.fetch(http_server.url("/flaky.jpg"))
+
+    assert result.spooled.path.read_bytes() == b"ok"
+    assert http_server.hits("/flaky.jpg") == 3
+    assert 0.005 <= downloader.backoff_delay(1) <= 0.01
+    assert downloader.backoff_delay(20) <= downloader.backoff_max_sec
+
+
+def test_download_rejects_by_content_length_before_body(http_server, tmp_path: Path) -> None:  # noqa: ANN001
+    http_server.add_route("/huge.mp4", b"x" * 10, headers={"Content-Length": str(2 * 1024**3)})
+    downloader = MediaDownloader(max_bytes=1_000_000, spool_dir=tmp_path)
+
+    with pytest.raises(ValueError, match="Content-Length"):
+        downloader.fetch(http_server.url("/huge.mp4"))
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_download_aborts_stream_after_max_bytes(http_server, tmp_path: Path) -> None:  # noqa: ANN001
+    http_server.add_route("/stream.mp4", b"v" * 64_000, headers={"Transfer-Encoding": "chunked"})
+    downloader = MediaDownloader(max_bytes=16_000, spool_dir=tmp_path)
+
+    with pytest.raises(ValueError, match="16000"):
+        downloader.fetch(http_server.url("/stream.mp4"))
+    assert list(tmp_path.iterdir()) == []
+
+    downloader.max_bytes = 100_000
+    result = downloader.fetch(http_server.url("/stream.mp4"))
+    assert result.spooled.sha256 == hashlib.sha256(b"v" * 64_000).hexdigest()
+    assert result.spooled.size_bytes == 64_000
+
+
+def test_url_cache_links_known_urls_and_revalidates_stale(repository, create_order_and_items, http_server, tmp_path: Path) -> None:  # noqa: ANN001
+    order_id, item1, item2 = create_order_and_items()
+    http_server.add_route(
+        "/thumb.jpg",
+        b"thumbnail",
+        headers={"Content-Type": "image/jpeg", "ETag": '"v1"', "Last-Modified": "Sun, 01 Feb 2026 10:00:00 GMT"},
+    )
+    url = http_server.url("/thumb.jpg")
+    downloader = MediaDownloader(spool_dir=tmp_path / "spool")
+    manager = MediaManager(repository=repository, media_root=tmp_path / "media", downloader=downloader)
+
+    first = manager.download_from_url(store_code="ozon", order_ref=str(order_id), item_id=item1, url=url, source="t")
+    cached = repository.get_media_url_cache(url)
+    assert cached["etag"] == '"v1"'
+    assert cached["sha256"] == hashlib.sha256(b"thumbnail").hexdigest()
+
+    # Свежая запись: без сетевого запроса
+    second = manager.download_from_url(store_code="ozon", order_ref=str(order_id), item_id=item2, url=url, source="t")
+    assert second != first
+    assert os.path.samefile(second, first)
+    assert http_server.hits("/thumb.jpg") == 1
+
+    # Устаревшая запись: условный запрос и 304
+    manager.url_cache_ttl_sec = 0
+    pending = manager.submit_download(store_code="ozon", order_ref=str(order_id), item_id=item2, url=url, source="t")
+    assert manager.complete_download(pending) == second
+    assert http_server.hits("/thumb.jpg") == 2
+    assert http_server.requests[-1]["headers"]["If-None-Match"] == '"v1"'
+    assert http_server.requests[-1]["headers"]["If-Modified-Since"] == "Sun, 01 Feb 2026 10:00:00 GMT"
+    downloader.close()
+
+    media_count = repository.connection.execute("SELECT COUNT(*) AS cnt FROM media").fetchone()["cnt"]
+    assert media_count == 2
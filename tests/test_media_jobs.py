@@ -0,0 +1,95 @@
+﻿from __future__ import annotations
+
+from datetime import datetime, timezone
+
+from grab.core.db.repository import GrabRepository
+from grab.services import MediaFetchService
+from grab.services.sync import SyncService
+from grab.sources.models import EmailMessageData
+
+
+def _message(links: list[str]) -> EmailMessageData:
+    return EmailMessageData(
+        source="imap_mailru",
+        provider="mailru",
+        account="user@mail.ru",
+        message_id="m-media",
+        thread_id=None,
+        subject="Ozon заказ №555555",
+        sender="info@ozon.ru",
+        recipients=["user@mail.ru"],
+        sent_at=datetime(2026, 2, 1, tzinfo=timezone.utc),
+        text_body="Заказ №555555\n- Товар Б, 1 шт, 500 ₽\nИтого: 500 ₽",
+        html_body=None,
+        links=links,
+        attachments=[],
+        raw_payload={},
+    )
+
+
+def _job(repository, url: str):  # noqa: ANN001, ANN202
+    return repository.connection.execute("SELECT * FROM media_jobs WHERE url = ?", (url,)).fetchone()
+
+
+def test_sync_enqueues_and_worker_drains_with_retries(settings, repository, test_logger, http_server):  # noqa: ANN001
+    http_server.add_route("/ok.jpg", b"jpeg", headers={"Content-Type": "image/jpeg"})
+    http_server.add_route("/gone.jpg", b"", status=500)
+    ok_url, bad_url = http_server.url("/ok.jpg"), http_server.url("/gone.jpg")
+
+    sync = SyncService(settings=settings, repository=repository, logger=test_logger)
+    sync._collect_email_messages = lambda since=None, max_messages=200: [_message([ok_url, bad_url])]  # noqa: SLF001,E731
+    stats = sync.sync(source="email", since=None, media_download=True, correlation_id="c-1", max_messages=10)
+
+    assert stats["media_enqueued"] == 2
+    assert http_server.requests == []
+    assert repository.media_job_counts() == {"pending": 2}
+
+    settings.media_retries = 1
+    settings.media_job_max_attempts = 2
+    worker = MediaFetchService(settings=settings, repository=repository, logger=test_logger)
+    first = worker.run()
+
+    assert first == {"jobs_claimed": 2, "media_saved": 1, "retry_scheduled": 1, "failed": 0}
+    assert _job(repository, ok_url)["status"] == "done"
+    bad_job = _job(repository, bad_url)
+    assert (bad_job["status"], bad_job["attempt"]) == ("pending", 1)
+    assert bad_job["next_retry_at"] > datetime.now(timezone.utc).isoformat()
+    assert "500" in bad_job["last_error"]
+
+    # Повтор еще не созрел
+    assert worker.run()["jobs_claimed"] == 0
+
+    repository.connection.execute("UPDATE media_jobs SET next_retry_at = '2000-01-01T00:00:00+00:00'")
+    second = worker.run()
+    assert second["failed"] == 1
+    assert repository.media_job_counts() == {"done": 1, "failed": 1}
+
+
+def test_second_worker_keeps_off_jobs_in_flight(settings, repository, test_logger, http_server):  # noqa: ANN001
+    http_server.add_route("/a.jpg", b"jpeg-a", headers={"Content-Type": "image/jpeg"})
+    http_server.add_route("/b.jpg", b"jpeg-b", headers={"Content-Type": "image/jpeg"})
+    urls = [http_server.url("/a.jpg"), http_server.url("/b.jpg")]
+    sync = SyncService(settings=settings, repository=repository, logger=test_logger)
+    sync._collect_email_messages = lambda since=None, max_messages=200: [_message(urls)]  # noqa: SLF001,E731
+    sync.sync(source="email", since=None, media_download=True, correlation_id="c-2", max_messages=10)
+
+    now = datetime.now(timezone.utc).isoformat()
+    with GrabRepository(repository.db_path) as other:
+        # Два воркера разбирают очередь одновременно: задачи не пересекаются
+        first = other.claim_media_jobs(limit=1, now=now)
+        second = repository.claim_media_jobs(limit=10, now=now)
+        assert len(first) == len(second) == 1
+        assert first[0]["id"] != second[0]["id"]
+
+        # Запуск еще одного воркера не отбирает чужие задачи в работе
+        worker = MediaFetchService(settings=settings, repository=repository, logger=test_logger)
+        assert worker.run()["jobs_claimed"] == 0
+        assert http_server.hits("/a.jpg") == http_server.hits("/b.jpg") == 0
+        assert repository.media_job_counts() == {"running": 2}
+
+    # Воркер упал, аренда истекла: задачи возвращаются в очередь
+    repository.connection.execute("UPDATE media_jobs SET updated_at = datetime('now', '-1 hour')")
+    settings.media_job_lease_sec = 60
+    stats = worker.run()
+    assert (stats["jobs_claimed"], stats["media_saved"]) == (2, 2)
+    assert repository.media_job_counts() == {"done": 2}
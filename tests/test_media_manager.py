@@ -1,80 +1,14 @@
 ﻿from __future__ import annotations
 
+import json
+import os
 from pathlib import Path
 
 from grab.core.media import MediaManager
 
 
-def _create_order_and_items(repository) -> tuple[int, int, int]:  # noqa: ANN001
-    store_id = repository.upsert_store("ozon", "Ozon")
-    account_id = repository.upsert_account("gmail", "me@gmail.com", "me@gmail.com")
-    order_id = repository.upsert_order(
-        store_id=store_id,
-        account_id=account_id,
-        seller_id=None,
-        external_order_id="A1",
-        dedupe_key="order-a1",
-        order_datetime="2026-02-01T10:00:00+00:00",
-        paid_datetime=None,
-        delivered_datetime=None,
-        currency="RUB",
-        subtotal_amount=100,
-        shipping_amount=0,
-        discount_amount=0,
-        total_amount=100,
-        status="ok",
-        source_url=None,
-        raw_ref="1",
-    )
-    item1 = repository.upsert_order_item(
-        order_id=order_id,
-        external_item_id="i1",
-        dedupe_key="i1",
-        product_id=None,
-        title_full="Товар 1",
-        title_short="Товар",
-        store_category_path=None,
-        unified_category_path=None,
-        brand=None,
-        model=None,
-        sku=None,
-        quantity=1,
-        unit_price=100,
-        discount_amount=0,
-        shipping_amount=0,
-        total_amount=100,
-        currency="RUB",
-        product_url=None,
-        order_url=None,
-        receipt_url=None,
-    )
-    item2 = repository.upsert_order_item(
-        order_id=order_id,
-        external_item_id="i2",
-        dedupe_key="i2",
-        product_id=None,
-        title_full="Товар 2",
-        title_short="Товар",
-        store_category_path=None,
-        unified_category_path=None,
-        brand=None,
-        model=None,
-        sku=None,
-        quantity=1,
-        unit_price=100,
-        discount_amount=0,
-        shipping_amount=0,
-        total_amount=100,
-        currency="RUB",
-        product_url=None,
-        order_url=None,
-        receipt_url=None,
-    )
-    return order_id, item1, item2
-
-
-def test_media_manager_dedup_by_sha(repository, tmp_path: Path) -> None:  # noqa: ANN001
-    order_id, item1, item2 = _create_order_and_items(repository)
+def test_media_manager_dedup_by_sha(repository, create_order_and_items, tmp_path: Path) -> None:  # noqa: ANN001
+    order_id, item1, item2 = create_order_and_items()
     media_root = tmp_path / "media"
     manager = MediaManager(repository=repository, media_root=media_root)
 
@@ -103,10 +37,86 @@ def test_media_manager_dedup_by_sha(repository, tmp_path: Path) -> None:  # noqa
 
     assert Path(path1).exists()
     assert Path(path2).exists()
-    assert path1 == path2
+    assert path1 != path2
+    assert os.path.samefile(path1, path2)
 
-    files = [p for p in media_root.rglob("*") if p.is_file() and p.name != "meta.json"]
-    assert len(files) == 1
+    blobs = list(manager.blob_store.iter_blobs())
+    assert len(blobs) == 1
+    assert blobs[0].name == manager._sha256(content)  # noqa: SLF001
 
     media_count = repository.connection.execute("SELECT COUNT(*) AS cnt FROM media").fetchone()["cnt"]
     assert media_count == 2
+
+
+def test_media_meta_is_append_only_and_exportable(repository, create_order_and_items, tmp_path: Path) -> None:  # noqa: ANN001
+    _, item1, _ = create_order_and_items()
+    manager = MediaManager(repository=repository, media_root=tmp_path / "media")
+
+    for index in range(3):
+        manager.save_bytes(
+            store_code="ozon",
+            order_ref="A1",
+            item_id=item1,
+            filename=f"photo{index}.jpg",
+            content=f"content-{index}".encode(),
+            mime="image/jpeg",
+            source_url=None,
+            source="test",
+        )
+
+    item_dir = tmp_path / "media" / "ozon" / "A1" / str(item1)
+    log_lines = (item_dir / "meta.jsonl").read_text(encoding="utf-8").splitlines()
+    assert len(log_lines) == 3
+
+    with (item_dir / "meta.jsonl").open("a", encoding="utf-8") as fh:
+        fh.write('{"source": "torn')
+    assert [entry["filename"] for entry in manager.read_meta(item_dir)] == [
+        "photo0.jpg",
+        "photo1.jpg",
+        "photo2.jpg",
+    ]
+
+    assert manager.export_meta_files() == 1
+    exported = json.loads((item_dir / "meta.json").read_text(encoding="utf-8"))
+    assert [entry["filename"] for entry in exported] == ["photo0.jpg", "photo1.jpg", "photo2.jpg"]
+
+
+def test_media_meta_append_after_torn_line(repository, create_order_and_items, tmp_path: Path) -> None:  # noqa: ANN001
+    _, item1, _ = create_order_and_items()
+    manager = MediaManager(repository=repository, media_root=tmp_path / "media")
+    kwargs = {"store_code": "ozon", "order_ref": "A1", "item_id": item1, "mime": "image/jpeg", "source": "test"}
+
+    manager.save_bytes(filename="photo0.jpg", content=b"content-0", source_url=None, **kwargs)
+    item_dir = tmp_path / "media" / "ozon" / "A1" / str(item1)
+    with (item_dir / "meta.jsonl").open("a", encoding="utf-8") as fh:
+        fh.write('{"source": "torn')
+    manager.save_bytes(filename="photo1.jpg", content=b"content-1", source_url=None, **kwargs)
+
+    assert [entry["filename"] for entry in manager.read_meta(item_dir)] == ["photo0.jpg", "photo1.jpg"]
+
+
+def test_item_views_survive_removal_and_gc_drops_unreferenced_blobs(repository, create_order_and_items, tmp_path: Path) -> None:  # noqa: ANN001
+    order_id, item1, item2 = create_order_and_items()
+    manager = MediaManager(repository=repository, media_root=tmp_path / "media")
+
+    kwargs = {"store_code": "ozon", "order_ref": "A1", "mime": "image/jpeg", "source": "test"}
+    path1 = manager.save_bytes(item_id=item1, filename="a.jpg", content=b"shared", source_url=None, **kwargs)
+    path2 = manager.save_bytes(item_id=item2, filename="b.jpg", content=b"shared", source_url=None, **kwargs)
+    manager.save_bytes(item_id=item2, filename="c.jpg", content=b"orphan", source_url=None, **kwargs)
+
+    # Удаление папки одной позиции не ломает другую
+    os.remove(path1)
+    assert Path(path2).read_bytes() == b"shared"
+
+    repository.connection.execute(
+        "DELETE FROM media WHERE sha256 = ?",
+        (manager._sha256(b"orphan"),),  # noqa: SLF001
+    )
+    dry = manager.collect_garbage(min_age_sec=0, dry_run=True)
+    assert (dry.scanned, dry.removed) == (2, 1)
+    assert len(list(manager.blob_store.iter_blobs())) == 2
+
+    stats = manager.collect_garbage(min_age_sec=0)
+    assert stats.removed == 1
+    assert [blob.name for blob in manager.blob_store.iter_blobs()] == [manager._sha256(b"shared")]  # noqa: SLF001
+    assert manager.collect_garbage(min_age_sec=3600).removed == 0
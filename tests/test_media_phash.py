@@ -0,0 +1,165 @@
+﻿from __future__ import annotations
+
+import io
+import os
+import random
+from pathlib import Path
+
+import pytest
+
+from grab.core.media import BKTree, MediaManager, hamming
+
+Image = pytest.importorskip("PIL.Image")
+ImageDraw = pytest.importorskip("PIL.ImageDraw")
+
+
+def _picture(seed: int) -> Image.Image:
+    rng = random.Random(seed)
+    image = Image.new("RGB", (640, 480), color=(240, 240, 240))
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randrange(600), rng.randrange(440)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        draw.rectangle([x, y, x + rng.randrange(40, 200), y + rng.randrange(40, 200)], fill=color)
+    return image
+
+
+def _encode(image: Image.Image, image_format: str) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+def test_bk_tree_finds_only_neighbours_within_radius() -> None:
+    rng = random.Random(7)
+    values = [rng.getrandbits(64) for _ in range(500)]
+    tree = BKTree()
+    for index, value in enumerate(values):
+        tree.add(value, str(index))
+
+    probe = values[42] ^ 0b101
+    found = {key for _, key in tree.search(probe, 4)}
+    expected = {str(index) for index, value in enumerate(values) if hamming(probe, value) <= 4}
+
+    assert found == expected
+    assert "42" in found
+
+
+def test_dupes_groups_resized_copies_and_consolidates(repository, create_order_and_items, tmp_path: Path) -> None:  # noqa: ANN001
+    _, item1, item2 = create_order_and_items()
+    manager = MediaManager(repository=repository, media_root=tmp_path / "media")
+    original = _picture(seed=1)
+    small_copy = original.resize((320, 240))
+
+    def save(item_id: int, content: bytes, name: str, mime: str) -> Path:
+        return Path(
+            manager.save_bytes(
+                store_code="ozon",
+                order_ref="A1",
+                item_id=item_id,
+                filename=name,
+                content=content,
+                mime=mime,
+                source_url=f"https://cdn.example.com/{name}",
+                source="test",
+            )
+        )
+
+    big_path = save(item1, _encode(original, "PNG"), "big.png", "image/png")
+    small_path = save(item2, _encode(small_copy, "JPEG"), "small.jpg", "image/jpeg")
+    save(item2, _encode(_picture(seed=2), "PNG"), "other.png", "image/png")
+
+    groups = manager.find_near_duplicates(max_distance=6)
+
+    assert len(groups) == 1
+    big_sha = manager._sha256(_encode(original, "PNG"))  # noqa: SLF001
+    assert groups[0].canonical == big_sha
+    assert len(groups[0].duplicates) == 1
+
+    assert manager.consolidate_duplicates(groups) == 1
+    assert not small_path.exists()
+    rows = repository.connection.execute(
+        "SELECT sha256, local_path_abs FROM media WHERE related_item_id = ? ORDER BY id", (item2,)
+    ).fetchall()
+    assert big_sha in {row["sha256"] for row in rows}
+    moved = next(Path(row["local_path_abs"]) for row in rows if row["sha256"] == big_sha)
+    assert os.path.samefile(moved, big_path)
+    assert manager.find_near_duplicates(max_distance=6) == []
+
+
+def test_consolidate_keeps_views_of_other_items(repository, create_order_and_items, tmp_path: Path) -> None:  # noqa: ANN001
+    _, item1, item2 = create_order_and_items()
+    manager = MediaManager(repository=repository, media_root=tmp_path / "media")
+    original = _picture(seed=3)
+    small_content = _encode(original.resize((320, 240)), "JPEG")
+    manager.save_bytes(
+        store_code="ozon",
+        order_ref="A1",
+        item_id=item1,
+        filename="big.png",
+        content=_encode(original, "PNG"),
+        mime="image/png",
+        source_url="https://cdn.example.com/big.png",
+        source="test",
+    )
+    small_path = Path(
+        manager.save_bytes(
+            store_code="ozon",
+            order_ref="A1",
+            item_id=item1,
+            filename="small.jpg",
+            content=small_content,
+            mime="image/jpeg",
+            source_url="https://cdn.example.com/small.jpg",
+            source="test",
+        )
+    )
+    # Старая дедупликация по sha256: запись второй позиции ссылается на файл в папке первой
+    repository.upsert_media(
+        item2, "https://cdn.example.com/copy.jpg", str(small_path), "image/jpeg",
+        manager._sha256(small_content), len(small_content), "test", None,  # noqa: SLF001
+    )
+
+    groups = manager.find_near_duplicates(max_distance=6)
+    assert manager.consolidate_duplicates(groups) == 2
+
+    item2_dir = manager._build_item_dir("ozon", "A1", str(item2))  # noqa: SLF001
+    row = repository.connection.execute(
+        "SELECT local_path_abs FROM media WHERE related_item_id = ?", (item2,)
+    ).fetchone()
+    assert Path(row["local_path_abs"]).parent.parent == item2_dir.resolve()
+    assert Path(row["local_path_abs"]).exists()
+    assert manager.read_meta(item2_dir)
+
+
+def test_consolidate_leaves_far_end_of_chain_alone(repository, create_order_and_items, tmp_path: Path) -> None:  # noqa: ANN001
+    _, item1, _ = create_order_and_items()
+    manager = MediaManager(repository=repository, media_root=tmp_path / "media")
+    # A~B и B~C (4 бита), но A и C различаются на 8 бит — больше порога
+    chain = {"a": (0x00, 1000), "b": (0x0F, 500), "c": (0xFF, 400)}
+    paths: dict[str, Path] = {}
+    shas: dict[str, str] = {}
+    for name, (dhash, width) in chain.items():
+        content = f"picture {name}".encode()
+        paths[name] = Path(
+            manager.save_bytes(
+                store_code="ozon",
+                order_ref="A1",
+                item_id=item1,
+                filename=f"{name}.jpg",
+                content=content,
+                mime="image/jpeg",
+                source_url=None,
+                source="test",
+            )
+        )
+        shas[name] = manager._sha256(content)  # noqa: SLF001
+        repository.upsert_media_phashes([(shas[name], f"{dhash:016x}", width, width)])
+
+    groups = manager.find_near_duplicates(max_distance=6)
+
+    assert [(group.canonical, group.duplicates) for group in groups] == [(shas["a"], [shas["b"]])]
+    assert manager.consolidate_duplicates(groups) == 1
+    assert paths["c"].exists()
+    assert repository.list_media_by_sha256(shas["c"])
+    assert not repository.list_media_by_sha256(shas["b"])
@@ -0,0 +1,76 @@
+﻿from __future__ import annotations
+
+import base64
+import hashlib
+from email.message import EmailMessage
+from pathlib import Path
+
+from grab.config import ImapAccountConfig
+from grab.core.media import MediaManager, spool_base64, spool_bytes
+from grab.sources.email_imap import ImapEmailSource
+
+
+def test_spool_hashes_incrementally(tmp_path: Path) -> None:
+    payload = b"%PDF-1.7 receipt" * 200_000
+
+    spooled = spool_bytes(tmp_path, payload)
+    assert spooled.sha256 == hashlib.sha256(payload).hexdigest()
+    assert spooled.size_bytes == len(payload)
+    assert spooled.path.read_bytes() == payload
+
+    encoded = base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+    from_b64 = spool_base64(tmp_path, encoded)
+    assert from_b64.sha256 == spooled.sha256
+
+
+def test_save_bytes_moves_spooled_file_into_place(repository, create_item, tmp_path: Path) -> None:  # noqa: ANN001
+    item_id = create_item()
+    manager = MediaManager(repository=repository, media_root=tmp_path / "media")
+    spool_dir = tmp_path / "raw" / "spool"
+
+    first = spool_bytes(spool_dir, b"receipt-bytes")
+    path = manager.save_bytes(
+        store_code="ozon",
+        order_ref="S1",
+        item_id=item_id,
+        filename="receipt.pdf",
+        content=first,
+        mime="application/pdf",
+        source_url=None,
+        source="test",
+    )
+    assert Path(path).read_bytes() == b"receipt-bytes"
+    assert not first.path.exists()
+
+    duplicate = spool_bytes(spool_dir, b"receipt-bytes")
+    assert manager.save_bytes(
+        store_code="ozon",
+        order_ref="S1",
+        item_id=item_id,
+        filename="receipt-copy.pdf",
+        content=duplicate,
+        mime="application/pdf",
+        source_url="https://example.com/r.pdf",
+        source="test",
+    ) == path
+    assert list(spool_dir.iterdir()) == []
+
+
+def test_imap_source_spools_attachments(tmp_path: Path) -> None:
+    message = EmailMessage()
+    message["Subject"] = "Чек"
+    message.set_content("Заказ №123456")
+    message.add_attachment(b"\x89PNG image", maintype="image", subtype="png", filename="photo.png")
+
+    source = ImapEmailSource(
+        ImapAccountConfig(provider="test", host="localhost", port=993, username="u", password="p"),
+        spool_dir=tmp_path / "spool",
+    )
+    _, _, attachments = source._extract_message_content(message)  # noqa: SLF001
+
+    assert len(attachments) == 1
+    attachment = attachments[0]
+    assert attachment.data is None
+    assert attachment.spool is not None
+    assert attachment.spool.path.read_bytes() == b"\x89PNG image"
+    assert attachment.content is attachment.spool
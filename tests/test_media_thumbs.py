@@ -0,0 +1,72 @@
+﻿from __future__ import annotations
+
+import io
+from pathlib import Path
+
+import openpyxl
+import pytest
+
+from grab.core.media import MediaManager
+from grab.core.media import thumbs as thumbs_module
+from grab.services import export_data
+
+
+def _png_bytes(size: tuple[int, int]) -> bytes:
+    image_module = pytest.importorskip("PIL.Image")
+    buffer = io.BytesIO()
+    image_module.new("RGB", size, color=(200, 30, 30)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _save(manager: MediaManager, item_id: int, content: bytes, filename: str, mime: str) -> None:
+    manager.save_bytes(
+        store_code="ozon",
+        order_ref="A1",
+        item_id=item_id,
+        filename=filename,
+        content=content,
+        mime=mime,
+        source_url=None,
+        source="test",
+    )
+
+
+def test_thumbnails_are_cached_by_sha_and_linked_in_xlsx(repository, create_order_and_items, tmp_path: Path) -> None:  # noqa: ANN001
+    _, item1, item2 = create_order_and_items()
+    manager = MediaManager(repository=repository, media_root=tmp_path / "media", thumb_px=64)
+    picture = _png_bytes((640, 320))
+    _save(manager, item1, picture, "photo.png", "image/png")
+    _save(manager, item2, picture, "copy.png", "image/png")
+    _save(manager, item2, b"%PDF-1.4", "receipt.pdf", "application/pdf")
+
+    item_thumbs, stats = manager.generate_thumbnails(workers=2)
+
+    assert (stats.generated, stats.cached) == (1, 0)
+    assert item_thumbs[item1] == item_thumbs[item2]
+    image_module = pytest.importorskip("PIL.Image")
+    with image_module.open(item_thumbs[item1]) as thumb:
+        assert max(thumb.size) == 64
+
+    _, second = manager.generate_thumbnails(workers=2)
+    assert (second.generated, second.cached) == (0, 1)
+
+    files = export_data(repository, ["xlsx"], tmp_path / "out", thumbnails=item_thumbs)
+    sheet = openpyxl.load_workbook(files[0])["items"]
+    header = [cell.value for cell in sheet[1]]
+    column = header.index("thumbnail_path") + 1
+    assert sheet.cell(row=2, column=column).hyperlink.target == item_thumbs[item1].as_uri()
+
+
+def test_thumbnails_skip_without_pillow_or_ffmpeg(repository, create_order_and_items, tmp_path: Path, monkeypatch) -> None:  # noqa: ANN001
+    monkeypatch.setattr(thumbs_module, "load_pillow", lambda: None)
+    monkeypatch.setattr(thumbs_module.shutil, "which", lambda _name: None)
+    _, item1, item2 = create_order_and_items()
+    manager = MediaManager(repository=repository, media_root=tmp_path / "media")
+    _save(manager, item1, b"not-really-a-jpeg", "photo.jpg", "image/jpeg")
+    _save(manager, item2, b"not-really-a-video", "clip.mp4", "video/mp4")
+
+    item_thumbs, stats = manager.generate_thumbnails()
+
+    assert item_thumbs == {}
+    assert (stats.generated, stats.skipped, stats.failed) == (0, 2, 0)
+    assert not any((tmp_path / "media" / "_thumbs").rglob("*.jpg"))
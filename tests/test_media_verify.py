@@ -0,0 +1,69 @@
+﻿from __future__ import annotations
+
+import os
+from pathlib import Path
+
+from grab.core.media import MediaManager, hash_file, hash_files
+
+
+def _save(manager: MediaManager, item_id: int, content: bytes, url: str | None) -> Path:
+    return Path(
+        manager.save_bytes(
+            store_code="ozon",
+            order_ref="A1",
+            item_id=item_id,
+            filename="photo.jpg",
+            content=content,
+            mime="image/jpeg",
+            source_url=url,
+            source="test",
+        )
+    )
+
+
+def test_hash_files_hashes_hardlinks_once(tmp_path: Path) -> None:
+    first = tmp_path / "a.bin"
+    first.write_bytes(b"x" * 100_000)
+    second = tmp_path / "b.bin"
+    os.link(first, second)
+
+    digests = hash_files([first, second, tmp_path / "missing.bin"], workers=2)
+
+    assert digests[first] == digests[second] == hash_file(first)
+    assert digests[tmp_path / "missing.bin"] is None
+
+
+def test_verify_repairs_requeues_and_resumes(repository, create_order_and_items, tmp_path: Path) -> None:  # noqa: ANN001
+    _, item1, item2 = create_order_and_items()
+    manager = MediaManager(repository=repository, media_root=tmp_path / "media")
+
+    shared1 = _save(manager, item1, b"shared-content", "https://example.com/a.jpg")
+    _save(manager, item2, b"shared-content", "https://example.com/b.jpg")
+    unique = _save(manager, item2, b"unique-content", "https://example.com/c.jpg")
+    orphan = _save(manager, item1, b"attachment-content", None)
+
+    # Отдельный битый файл вместо ссылки: blob цел, восстановим из него
+    shared1.unlink()
+    shared1.write_bytes(b"shared-contenX")
+    # Порча через hardlink затрагивает и blob: целых копий нет, только повторное скачивание
+    with unique.open("r+b") as fh:
+        fh.write(b"U")
+    orphan.unlink()
+    manager.blob_store.blob_path(manager._sha256(b"attachment-content")).unlink()  # noqa: SLF001
+
+    stats = manager.verify_media(workers=2)
+
+    assert (stats.checked, stats.ok, stats.repaired, stats.requeued, stats.missing) == (4, 1, 1, 1, 1)
+    assert shared1.read_bytes() == b"shared-content"
+    assert not unique.exists()
+    job = repository.connection.execute("SELECT * FROM media_jobs").fetchone()
+    assert (job["url"], job["item_id"], job["status"]) == ("https://example.com/c.jpg", item2, "pending")
+
+    statuses = {
+        row["verify_status"]
+        for row in repository.connection.execute("SELECT verify_status FROM media WHERE verified_at IS NOT NULL")
+    }
+    assert statuses == {"ok", "repaired", "requeued", "missing"}
+
+    assert manager.verify_media(workers=2).checked == 0
+    assert manager.verify_media(workers=2, recheck_after_sec=0, repair=False).checked == 4
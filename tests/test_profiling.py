@@ -0,0 +1,45 @@
+﻿from __future__ import annotations
+
+import time
+from pathlib import Path
+
+from typer.testing import CliRunner
+
+from grab.cli import app
+from grab.core.profiling import profile_run
+
+
+def _busy_loop(duration_sec: float) -> int:
+    deadline = time.perf_counter() + duration_sec
+    counter = 0
+    while time.perf_counter() < deadline:
+        counter += 1
+    return counter
+
+
+def test_profile_run_writes_pstats_and_collapsed_stacks(tmp_path: Path) -> None:
+    with profile_run(tmp_path, command="sync", correlation_id="abc123", interval_sec=0.001) as artifacts:
+        _busy_loop(0.1)
+
+    assert artifacts.pstats_path == (tmp_path / "profile-sync-abc123.prof").resolve()
+    assert artifacts.pstats_path.stat().st_size > 0
+
+    lines = artifacts.collapsed_path.read_text(encoding="utf-8").splitlines()
+    assert lines
+    stack, count = lines[0].rsplit(" ", 1)
+    assert int(count) >= 1
+    assert any("_busy_loop" in line for line in lines)
+    assert all(";" in line.rsplit(" ", 1)[0] for line in lines)
+
+
+def test_profile_option_wraps_cli_command(tmp_path: Path, monkeypatch) -> None:  # noqa: ANN001
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("GRAB_HOME", str(tmp_path))
+
+    result = CliRunner().invoke(app, ["export", "--format", "csv", "--profile"])
+
+    assert result.exit_code == 0, result.output
+    [pstats_path] = (tmp_path / "logs").glob("profile-export-*.prof")
+    assert pstats_path.stat().st_size > 0
+    assert pstats_path.with_suffix(".collapsed").exists()
+    assert pstats_path.name in result.output.replace("\n", "")
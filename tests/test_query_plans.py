@@ -0,0 +1,150 @@
+﻿from __future__ import annotations
+
+import re
+from collections.abc import Iterator
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any
+
+from grab.core.db import ExportFilter
+
+
+def _plan(repository, sql: str, params: tuple[Any, ...] = ()) -> list[str]:  # noqa: ANN001
+    rows = repository.connection.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    return [row["detail"] for row in rows]
+
+
+# Таблицы, которые растут с историей покупок: полный проход по ним на горячем пути недопустим
+LARGE_TABLES = {
+    "orders",
+    "order_items",
+    "products",
+    "product_attributes",
+    "media",
+    "media_jobs",
+    "media_url_cache",
+    "reviews",
+    "raw_messages",
+}
+
+
+@contextmanager
+def _captured_statements(repository) -> Iterator[list[str]]:  # noqa: ANN001
+    # trace callback отдает SQL с подставленными значениями — его и прогоняем через EXPLAIN
+    statements: list[str] = []
+    repository.connection.set_trace_callback(statements.append)
+    try:
+        yield statements
+    finally:
+        repository.connection.set_trace_callback(None)
+
+
+def _full_scans(repository, sql: str) -> list[str]:  # noqa: ANN001
+    aliases = {
+        alias or table: table
+        for table, alias in re.findall(r"(?:FROM|JOIN|UPDATE)\s+(\w+)(?:\s+(?!WHERE|SET|JOIN|ON)(\w+))?", sql, re.I)
+    }
+    scans = []
+    for detail in _plan(repository, sql):
+        match = re.match(r"SCAN (\w+)", detail)
+        if match and aliases.get(match.group(1), match.group(1)) in LARGE_TABLES:
+            scans.append(detail)
+    return scans
+
+
+def test_hot_repository_lookups_do_not_scan_large_tables(repository, create_order_and_items) -> None:  # noqa: ANN001
+    now = datetime.now(timezone.utc).isoformat()
+    with _captured_statements(repository) as statements:
+        _, item1, _ = create_order_and_items()
+        store_id = repository.upsert_store("ozon", "Ozon")
+        repository.upsert_seller(store_id, "Продавец", inn=None)
+        product_id = repository.upsert_product("brand:model", "Товар", None, "Brand", "Model", None)
+        repository.upsert_product_attribute(product_id, item1, "color", "text", "red", None, None, None, "test")
+        repository.upsert_product_attribute(product_id, item1, "weight", "number", None, 1.5, None, None, "test")
+        repository.upsert_raw_message(
+            "gmail", None, "m1", None, now, "Заказ", "shop@example.com", None, "text", None, None, None
+        )
+        media_id = repository.upsert_media(item1, None, "/tmp/a.jpg", "image/jpeg", "ab" * 32, 3, "test", None)
+        repository.find_media_by_sha256("ab" * 32)
+        repository.list_media_by_sha256("ab" * 32)
+        repository.mark_media_verified([(media_id, "ok")], now)
+        repository.fetch_media_for_verify(0, now, 10)
+        repository.upsert_review(product_id, item1, "public", "ozon", None, 5, None, "Отлично", None, None)
+        repository.count_public_reviews(product_id)
+        repository.upsert_media_url_cache("https://example.com/a.jpg", "ab" * 32, None, None, None, 3, now)
+        repository.get_media_url_cache("https://example.com/a.jpg")
+        repository.touch_media_url_cache("https://example.com/a.jpg", now, None, None)
+        repository.repoint_media_url_cache("ab" * 32, "cd" * 32)
+        repository.enqueue_media_job(item1, "https://example.com/b.jpg", "ozon", "A1", "test", now)
+        jobs = repository.claim_media_jobs(limit=10, now=now)
+        repository.fail_media_job(jobs[0]["id"], error_text="boom", next_retry_at=now)
+        repository.complete_media_job(jobs[0]["id"])
+        repository.release_running_media_jobs(lease_sec=0)
+        repository.delete_media(media_id)
+
+    queries = [sql for sql in statements if re.match(r"\s*(SELECT|UPDATE|DELETE|INSERT)", sql, re.I)]
+    assert len(queries) > 30
+    scans = {sql.strip(): found for sql in queries if (found := _full_scans(repository, sql))}
+    assert not scans, scans
+
+
+def test_lookup_indexes_exist_for_hot_columns(repository) -> None:  # noqa: ANN001
+    for table, column in [
+        ("order_items", "order_id"),
+        ("order_items", "product_id"),
+        ("media", "related_item_id"),
+        ("product_attributes", "item_id"),
+        ("product_attributes", "product_id"),
+        ("orders", "order_datetime"),
+        ("orders", "store_id"),
+        ("raw_messages", "message_datetime"),
+        ("reviews", "product_id"),
+        ("reviews", "item_id"),
+    ]:
+        plan = _plan(repository, f"SELECT * FROM {table} WHERE {column} = 1")
+        assert any(detail.startswith(f"SEARCH {table} USING") for detail in plan), (table, column, plan)
+
+
+def test_export_query_preaggregates_media_and_uses_order_index(repository) -> None:  # noqa: ANN001
+    for media_lists in (False, True):
+        sql, params = repository._export_query(media_lists=media_lists)  # noqa: SLF001
+        plan = _plan(repository, sql, params)
+
+        assert not any("CORRELATED" in detail for detail in plan), plan
+        assert not any("TEMP B-TREE FOR ORDER BY" in detail for detail in plan), plan
+        assert "SCAN m USING COVERING INDEX idx_media_item_export" in plan, plan
+        assert "SCAN o USING INDEX idx_orders_export_order" in plan, plan
+
+
+def test_selective_export_reads_media_only_for_selected_items(repository) -> None:  # noqa: ANN001
+    selective = [
+        {"export_filter": ExportFilter(stores=("ozon",), since="2026-01-01")},
+        {"changed_since": "2026-01-01T00:00:00"},
+        {"changed_since": "2026-01-01T00:00:00", "media_lists": True},
+    ]
+    for kwargs in selective:
+        sql, params = repository._export_query(**kwargs)  # noqa: SLF001
+        plan = _plan(repository, sql, params)
+
+        # Без группировки всей таблицы media: только поиск по индексу для выбранных позиций
+        assert not any(detail.startswith("SCAN m") for detail in plan), (kwargs, plan)
+        assert not any("AUTOMATIC" in detail for detail in plan), (kwargs, plan)
+        assert "SEARCH m USING COVERING INDEX idx_media_item_export (related_item_id=?)" in plan, (kwargs, plan)
+
+
+def test_filtered_export_query_pushes_filters_into_indexes(repository) -> None:  # noqa: ANN001
+    columns = ("title_full", "item_total_amount")
+    sql, params = repository._export_query(  # noqa: SLF001
+        export_filter=ExportFilter(since="2026-01-01", until="2026-04-01", columns=columns)
+    )
+    plan = _plan(repository, sql, params)
+
+    # Медиа не выбраны — таблица media не читается; диапазон дат идет по индексу сортировки
+    assert not any("media" in detail or " m " in f"{detail} " for detail in plan), plan
+    assert not any("TEMP B-TREE FOR ORDER BY" in detail for detail in plan), plan
+    assert any(detail.startswith("SEARCH o USING INDEX idx_orders_export_order") for detail in plan), plan
+
+    sql, params = repository._export_query(export_filter=ExportFilter(stores=("ozon",), columns=columns))  # noqa: SLF001
+    plan = _plan(repository, sql, params)
+    assert any(detail.startswith("SEARCH s ") and "code=?" in detail for detail in plan), plan
+    assert not any(detail.startswith("SCAN o") for detail in plan), plan
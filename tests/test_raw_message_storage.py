@@ -0,0 +1,187 @@
+﻿from __future__ import annotations
+
+import shutil
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from grab.core.db import apply_migrations, connect_db
+from grab.core.db.compression import (
+    CODEC_NONE,
+    CODEC_ZLIB,
+    CODEC_ZSTD,
+    decode_body,
+    encode_body,
+    load_zstandard,
+)
+from grab.core.db.migrations import _load_python_migration
+
+MIGRATIONS_DIR = Path(__file__).resolve().parents[1] / "src" / "grab" / "core" / "db" / "migrations"
+HTML = "<html><body>" + "<p>Ваш заказ №123 оформлен</p>" * 200 + "</body></html>"
+
+
+def test_codec_byte_round_trip() -> None:
+    packed = encode_body(HTML, codec=CODEC_ZLIB)
+    assert packed[0] == CODEC_ZLIB
+    assert len(packed) < len(HTML.encode()) / 5
+    assert decode_body(packed) == HTML
+
+    short = encode_body("ok", codec=CODEC_ZLIB)
+    assert short == bytes([CODEC_NONE]) + b"ok"
+    assert decode_body(short) == "ok"
+    assert encode_body(None) is None and decode_body(None) is None
+
+    with pytest.raises(ValueError):
+        decode_body(b"\x09payload")
+
+
+def test_zstd_codec_round_trip() -> None:
+    if load_zstandard() is None:
+        pytest.skip("zstandard не установлен")
+    packed = encode_body(HTML, codec=CODEC_ZSTD)
+    assert packed[0] == CODEC_ZSTD
+    assert decode_body(packed) == HTML
+
+
+def test_raw_message_bodies_are_compressed_and_read_back(repository) -> None:  # noqa: ANN001
+    message_id = repository.upsert_raw_message(
+        "gmail", None, "m1", None, None, "Заказ", None, None, "текст", HTML, {"id": "m1", "payload": {}}, None
+    )
+    again = repository.upsert_raw_message(
+        "gmail", None, "m1", "t1", None, None, None, None, None, None, None, None
+    )
+
+    assert again == message_id
+    columns = {row["name"] for row in repository.connection.execute("PRAGMA table_info(raw_messages)")}
+    assert not columns & {"raw_text", "raw_html", "raw_json"}
+    stored = repository.connection.execute(
+        "SELECT raw_html FROM raw_message_bodies WHERE message_id = ?", (message_id,)
+    ).fetchone()["raw_html"]
+    assert stored[0] in {CODEC_ZLIB, CODEC_ZSTD}
+
+    message = repository.get_raw_message(message_id)
+    assert message["subject"] == "Заказ"
+    assert message["thread_id"] == "t1"
+    assert message["raw_text"] == "текст"
+    assert message["raw_html"] == HTML
+    assert message["raw_json"] == {"id": "m1", "payload": {}}
+    assert repository.get_raw_message(message_id + 1) is None
+
+
+def test_migration_converts_existing_bodies_in_chunks(tmp_path: Path, monkeypatch) -> None:  # noqa: ANN001
+    old_dir = tmp_path / "migrations"
+    old_dir.mkdir()
+    for migration in MIGRATIONS_DIR.glob("*.sql"):
+        if migration.name < "009":
+            shutil.copy(migration, old_dir / migration.name)
+    connection = connect_db(tmp_path / "grab.sqlite3")
+    apply_migrations(connection, old_dir)
+    with connection:
+        connection.executemany(
+            "INSERT INTO raw_messages (source, external_message_id, raw_text, raw_html, raw_json) VALUES (?, ?, ?, ?, ?)",
+            [
+                ("gmail", f"m{index}", f"text {index}", HTML if index % 2 else None, None)
+                for index in range(7)
+            ]
+            + [("imap", "empty", None, None, None)],
+        )
+    # Прерванный прошлый запуск уже перенес первое письмо — его не трогаем
+    connection.execute("CREATE TABLE raw_message_bodies (message_id INTEGER PRIMARY KEY, raw_text BLOB, raw_html BLOB, raw_json BLOB)")
+    connection.execute("INSERT INTO raw_message_bodies (message_id, raw_text) VALUES (1, ?)", (encode_body("done"),))
+    connection.commit()
+
+    migration = _load_python_migration(MIGRATIONS_DIR / "009_raw_message_bodies.py")
+    monkeypatch.setattr(migration, "CHUNK_ROWS", 3)
+    migration.migrate(connection)
+
+    columns = {row["name"] for row in connection.execute("PRAGMA table_info(raw_messages)")}
+    assert not columns & {"raw_text", "raw_html", "raw_json"}
+    bodies = {
+        row["message_id"]: (decode_body(row["raw_text"]), decode_body(row["raw_html"]))
+        for row in connection.execute("SELECT * FROM raw_message_bodies")
+    }
+    assert len(bodies) == 7
+    assert bodies[1] == ("done", None)
+    assert bodies[2] == ("text 1", HTML)
+    assert bodies[7] == ("text 6", None)
+    connection.close()
+
+
+def test_migration_resumes_after_partial_column_drop(tmp_path: Path) -> None:
+    old_dir = tmp_path / "migrations"
+    old_dir.mkdir()
+    for migration in MIGRATIONS_DIR.glob("*.sql"):
+        if migration.name < "009":
+            shutil.copy(migration, old_dir / migration.name)
+    connection = connect_db(tmp_path / "grab.sqlite3")
+    apply_migrations(connection, old_dir)
+    with connection:
+        connection.executemany(
+            "INSERT INTO raw_messages (source, external_message_id, raw_text, raw_html, raw_json) VALUES (?, ?, ?, ?, ?)",
+            [("gmail", f"m{index}", f"text {index}", HTML, '{"id": 1}') for index in range(3)],
+        )
+    # Прежний запуск упал между DROP COLUMN: raw_text уже удалена, raw_html и raw_json остались
+    connection.execute("ALTER TABLE raw_messages DROP COLUMN raw_text")
+    connection.commit()
+
+    migration = _load_python_migration(MIGRATIONS_DIR / "009_raw_message_bodies.py")
+    migration.migrate(connection)
+
+    columns = {row["name"] for row in connection.execute("PRAGMA table_info(raw_messages)")}
+    assert not columns & {"raw_text", "raw_html", "raw_json"}
+    bodies = [
+        (decode_body(row["raw_html"]), decode_body(row["raw_json"]))
+        for row in connection.execute("SELECT * FROM raw_message_bodies ORDER BY message_id")
+    ]
+    assert bodies == [(HTML, '{"id": 1}')] * 3
+    connection.close()
+
+
+class _FailingDropConnection(sqlite3.Connection):
+    """Соединение, на котором последний DROP COLUMN падает, как при аварии посреди удаления колонок."""
+
+    def execute(self, sql: str, *args) -> sqlite3.Cursor:  # noqa: ANN002
+        if sql.endswith("DROP COLUMN raw_json"):
+            raise sqlite3.OperationalError("disk I/O error")
+        return super().execute(sql, *args)
+
+
+def test_migration_drops_body_columns_all_or_nothing(tmp_path: Path) -> None:
+    old_dir = tmp_path / "migrations"
+    old_dir.mkdir()
+    for migration in MIGRATIONS_DIR.glob("*.sql"):
+        if migration.name < "009":
+            shutil.copy(migration, old_dir / migration.name)
+    connection = connect_db(tmp_path / "grab.sqlite3")
+    apply_migrations(connection, old_dir)
+    connection.close()
+    connection = sqlite3.connect(tmp_path / "grab.sqlite3", factory=_FailingDropConnection)
+    connection.row_factory = sqlite3.Row
+    migration = _load_python_migration(MIGRATIONS_DIR / "009_raw_message_bodies.py")
+
+    with pytest.raises(sqlite3.OperationalError):
+        migration.migrate(connection)
+
+    columns = {row["name"] for row in connection.execute("PRAGMA table_info(raw_messages)")}
+    assert {"raw_text", "raw_html", "raw_json"} <= columns
+    connection.close()
+
+
+def test_python_migrations_run_in_order_after_sql(tmp_path: Path) -> None:
+    migrations_dir = tmp_path / "migrations"
+    migrations_dir.mkdir()
+    (migrations_dir / "001_init.sql").write_text("CREATE TABLE t (value TEXT);", encoding="utf-8")
+    (migrations_dir / "002_fill.py").write_text(
+        "def migrate(connection):\n"
+        "    with connection:\n"
+        "        connection.execute(\"INSERT INTO t (value) VALUES ('py')\")\n",
+        encoding="utf-8",
+    )
+    connection = sqlite3.connect(tmp_path / "x.db")
+    connection.row_factory = sqlite3.Row
+
+    assert apply_migrations(connection, migrations_dir) == ["001_init.sql", "002_fill.py"]
+    assert apply_migrations(connection, migrations_dir) == []
+    assert [row["value"] for row in connection.execute("SELECT value FROM t")] == ["py"]
+    connection.close()
@@ -0,0 +1,142 @@
+﻿from __future__ import annotations
+
+import shutil
+from pathlib import Path
+
+import pytest
+
+from grab.core.db import ExportFilter, apply_migrations, connect_db
+from grab.core.db.compression import encode_body
+from grab.core.db.migrations import _load_python_migration
+from grab.core.db.search import build_match_query, message_search_text
+
+MIGRATIONS_DIR = Path(__file__).resolve().parents[1] / "src" / "grab" / "core" / "db" / "migrations"
+
+
+def _rename_item(repository, item_id: int, title: str, brand: str | None = None) -> None:  # noqa: ANN001
+    with repository.connection:
+        repository.connection.execute(
+            "UPDATE order_items SET title_full = ?, brand = ? WHERE id = ?",
+            (title, brand, item_id),
+        )
+
+
+def _found(rows) -> list[int]:  # noqa: ANN001
+    return [row["item_db_id"] for row in rows]
+
+
+def test_build_match_query_stems_and_escapes() -> None:
+    assert build_match_query("Беспроводные наушники") == '"беспроводн"* "наушник"*'
+    assert build_match_query("Ёлка") == '"елк"*'
+    # Операторы FTS5 из пользовательского ввода не пробрасываются
+    assert build_match_query('iPhone-15 "pro" NOT max:') == '"iphone"* "15"* "pro"* "not"* "max"*'
+    with pytest.raises(ValueError):
+        build_match_query(" -*: ")
+
+
+def test_item_index_follows_writes(repository, create_order_and_items) -> None:  # noqa: ANN001
+    _, item1, item2 = create_order_and_items()
+    _rename_item(repository, item1, "Беспроводные наушники Ёлка", brand="Sony")
+
+    assert _found(repository.search_items("наушников")) == [item1]
+    assert _found(repository.search_items("елки")) == [item1]
+    assert _found(repository.search_items("sony наушник")) == [item1]
+    assert sorted(_found(repository.search_items("товар"))) == [item2]
+    # Магазин тоже в индексе
+    assert sorted(_found(repository.search_items("ozon"))) == sorted([item1, item2])
+
+    repository.upsert_store("ozon", "Озон")
+    assert sorted(_found(repository.search_items("озон"))) == sorted([item1, item2])
+
+    with repository.connection:
+        repository.connection.execute("DELETE FROM order_items WHERE id = ?", (item2,))
+    assert repository.search_items("товар") == []
+    assert repository.connection.execute("SELECT COUNT(*) FROM search_items").fetchone()[0] == 1
+
+
+def test_item_search_ranks_title_above_brand_and_filters(repository, create_order_and_items) -> None:  # noqa: ANN001
+    _, item1, item2 = create_order_and_items()
+    _rename_item(repository, item1, "Чехол", brand="Samsung")
+    _rename_item(repository, item2, "Samsung Galaxy S24", brand="Samsung")
+
+    assert _found(repository.search_items("samsung")) == [item2, item1]
+    assert _found(repository.search_items("samsung", limit=1)) == [item2]
+    assert repository.search_items("samsung", ExportFilter(stores=("wb",))) == []
+    assert len(repository.search_items("samsung", ExportFilter(stores=("ozon",), since="2026-02-01"))) == 2
+    assert repository.search_items("samsung", ExportFilter(until="2026-02-01")) == []
+
+
+def test_message_index_keeps_body_between_upserts(repository) -> None:  # noqa: ANN001
+    html = "<html><style>.x{}</style><body><p>Ваш заказ &laquo;Пылесос&raquo; доставлен</p></body></html>"
+    message_id = repository.upsert_raw_message(
+        "gmail", None, "m1", None, "2026-02-01T10:00:00+00:00", "Заказ доставлен", None, None, None, html, None, None
+    )
+    repository.upsert_raw_message("gmail", None, "m1", "t1", None, "Заказ №5 доставлен", None, None, None, None, None, None)
+
+    rows = repository.search_messages("пылесоса")
+    assert [row["message_db_id"] for row in rows] == [message_id]
+    assert "«Пылесос»" in rows[0]["snippet"]
+    assert len(repository.search_messages("заказ 5")) == 1
+    assert repository.search_messages("пылесос", since="2026-03-01") == []
+    assert repository.search_messages("style") == []
+
+    with repository.connection:
+        repository.connection.execute("DELETE FROM raw_messages WHERE id = ?", (message_id,))
+    assert repository.connection.execute("SELECT COUNT(*) FROM search_messages").fetchone()[0] == 0
+
+
+def test_message_search_text_prefers_plain_text() -> None:
+    assert message_search_text("Ёмкость  2 л", "<p>html</p>") == "Емкость 2 л"
+    assert message_search_text(None, "<p>a&amp;b</p><script>x()</script>") == "a&b"
+    # ">" внутри атрибута и комментарий не должны попадать в индекс
+    assert message_search_text(None, '<a title="1 > 0">Заказ</a><!-- <b>скрыто</b> --><style>p{}</style>') == "Заказ"
+    assert message_search_text(None, None) is None
+
+
+def test_migration_backfills_existing_rows(tmp_path: Path, monkeypatch) -> None:  # noqa: ANN001
+    old_dir = tmp_path / "migrations"
+    old_dir.mkdir()
+    for migration in MIGRATIONS_DIR.iterdir():
+        if migration.suffix in {".sql", ".py"} and migration.name < "010":
+            shutil.copy(migration, old_dir / migration.name)
+    connection = connect_db(tmp_path / "grab.sqlite3")
+    apply_migrations(connection, old_dir)
+    with connection:
+        connection.execute("INSERT INTO stores (id, code, name) VALUES (1, 'wb', 'Wildberries')")
+        connection.execute("INSERT INTO orders (id, store_id, dedupe_key) VALUES (1, 1, 'o1')")
+        connection.executemany(
+            "INSERT INTO order_items (order_id, dedupe_key, title_full) VALUES (1, ?, ?)",
+            [(f"i{index}", f"Кружка {index}") for index in range(5)],
+        )
+        connection.executemany(
+            "INSERT INTO raw_messages (id, source, external_message_id, subject) VALUES (?, 'imap', ?, 'Чек')",
+            [(index, f"m{index}") for index in range(1, 6)],
+        )
+        connection.executemany(
+            "INSERT INTO raw_message_bodies (message_id, raw_text) VALUES (?, ?)",
+            [(index, encode_body(f"Кофемолка номер {index}")) for index in range(1, 6)],
+        )
+
+    migration = _load_python_migration(MIGRATIONS_DIR / "010_search_index.py")
+    monkeypatch.setattr(migration, "CHUNK_ROWS", 2)
+    migration.migrate(connection)
+
+    assert connection.execute("SELECT COUNT(*) FROM search_items WHERE search_items MATCH 'wildberries'").fetchone()[0] == 5
+    assert connection.execute("SELECT COUNT(*) FROM search_messages WHERE search_messages MATCH 'кофемолка'").fetchone()[0] == 5
+    connection.close()
+
+
+def test_item_search_plan_starts_from_fts_index(repository, create_order_and_items) -> None:  # noqa: ANN001
+    create_order_and_items()
+    # Проверяем план того самого запроса, который строит search_items (trace отдает SQL с подставленными значениями)
+    statements: list[str] = []
+    repository.connection.set_trace_callback(statements.append)
+    try:
+        assert repository.search_items("товар", export_filter=ExportFilter(stores=("ozon",), min_amount=1))
+    finally:
+        repository.connection.set_trace_callback(None)
+    [sql] = [statement for statement in statements if "search_items MATCH" in statement]
+
+    plan = [row["detail"] for row in repository.connection.execute(f"EXPLAIN QUERY PLAN {sql}")]
+    assert plan[0].startswith("SCAN search_items VIRTUAL TABLE")
+    assert not [detail for detail in plan[1:] if detail.startswith("SCAN")]
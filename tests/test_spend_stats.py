@@ -0,0 +1,130 @@
+﻿from __future__ import annotations
+
+import random
+
+import pytest
+import typer
+
+from grab.cli import _parse_month
+from grab.core.db.aggregates import SPEND_TABLES
+from grab.core.db.repository import ORDER_ITEM_COLUMNS
+
+
+def _snapshot(repository) -> dict[str, list[tuple]]:  # noqa: ANN001
+    return {
+        table.name: [tuple(row) for row in repository.connection.execute(f"SELECT * FROM {table.name} ORDER BY 1, 2")]
+        for table in SPEND_TABLES
+    }
+
+
+def _stats(repository, by: str, **kwargs) -> list[tuple]:  # noqa: ANN001
+    return [
+        (row["label"], row["currency"], row["items_count"], row["spend"])
+        for row in repository.spend_stats(by, **kwargs)
+    ]
+
+
+def test_spend_stats_follow_upserts(repository, create_order_and_items) -> None:  # noqa: ANN001
+    order_id, item1, _ = create_order_and_items()
+
+    assert _stats(repository, "store") == [("ozon", "RUB", 2, 200.0)]
+    assert _stats(repository, "month") == [("2026-02", "RUB", 2, 200.0)]
+    assert _stats(repository, "account") == [("me@gmail.com", "RUB", 2, 200.0)]
+    assert _stats(repository, "category") == [(None, "RUB", 2, 200.0)]
+    assert _stats(repository, "currency") == [("RUB", "RUB", 2, 200.0)]
+
+    # Повторный sync с теми же значениями сводки не меняет
+    before = _snapshot(repository)
+    repository.upsert_order_items_bulk(
+        [dict.fromkeys(ORDER_ITEM_COLUMNS) | {"order_id": order_id, "dedupe_key": "i1", "quantity": 1, "total_amount": 100}]
+    )
+    assert _snapshot(repository) == before
+
+    with repository.connection:
+        repository.connection.execute("UPDATE order_items SET total_amount = 0.1 WHERE id = ?", (item1,))
+        repository.connection.execute("UPDATE orders SET order_datetime = '2026-03-05T00:00:00' WHERE id = ?", (order_id,))
+    assert _stats(repository, "store-month") == [("2026-03 ozon", "RUB", 2, 100.1)]
+    assert _stats(repository, "month", since_month="2026-02", until_month="2026-02") == []
+
+    with repository.connection:
+        repository.connection.execute("DELETE FROM orders WHERE id = ?", (order_id,))
+    assert all(not rows for rows in _snapshot(repository).values())
+
+
+def test_spend_deltas_match_full_rebuild(repository) -> None:  # noqa: ANN001
+    rng = random.Random(7)
+    store_ids = [repository.upsert_store(code, code.upper()) for code in ("ozon", "wb", "dns")]
+    account_ids = [None, repository.upsert_account("gmail", "a@gmail.com", None)]
+    order_ids: list[int] = []
+    for step in range(300):
+        action = rng.random()
+        if action < 0.25 or not order_ids:
+            order_ids.append(
+                repository.upsert_order(
+                    store_id=rng.choice(store_ids),
+                    account_id=rng.choice(account_ids),
+                    seller_id=None,
+                    external_order_id=f"O{step}",
+                    dedupe_key=f"order-{step}",
+                    order_datetime=rng.choice([None, f"2026-{rng.randint(1, 4):02d}-10T00:00:00"]),
+                    paid_datetime=None,
+                    delivered_datetime=None,
+                    currency=rng.choice([None, "RUB", "USD"]),
+                    subtotal_amount=None,
+                    shipping_amount=None,
+                    discount_amount=None,
+                    total_amount=None,
+                    status=None,
+                    source_url=None,
+                    raw_ref=None,
+                )
+            )
+        elif action < 0.6:
+            repository.upsert_order_items_bulk(
+                [
+                    dict.fromkeys(ORDER_ITEM_COLUMNS)
+                    | {
+                        "order_id": rng.choice(order_ids),
+                        "dedupe_key": f"item-{rng.randint(0, 40)}",
+                        "quantity": rng.randint(1, 3),
+                        "unit_price": rng.choice([None, 9.99, 120.5]),
+                        "total_amount": rng.choice([None, 0.1, 0.2, 1999.99]),
+                        "currency": rng.choice([None, "RUB"]),
+                        "unified_category_path": rng.choice([None, "Электроника", "Дом"]),
+                    }
+                    for _ in range(rng.randint(1, 3))
+                ]
+            )
+        elif action < 0.75:
+            with repository.connection:
+                repository.connection.execute(
+                    "UPDATE orders SET store_id = ?, order_datetime = ? WHERE id = ?",
+                    (rng.choice(store_ids), f"2026-0{rng.randint(1, 9)}-01", rng.choice(order_ids)),
+                )
+        elif action < 0.9:
+            with repository.connection:
+                repository.connection.execute(
+                    "DELETE FROM order_items WHERE id = (SELECT id FROM order_items ORDER BY random() LIMIT 1)"
+                )
+        else:
+            with repository.connection:
+                repository.connection.execute("DELETE FROM orders WHERE id = ?", (order_ids.pop(rng.randrange(len(order_ids))),))
+
+    incremental = _snapshot(repository)
+    assert any(incremental.values())
+    repository.rebuild_spend_aggregates()
+    assert _snapshot(repository) == incremental
+
+
+def test_spend_stats_rejects_unknown_view_and_month_filter(repository) -> None:  # noqa: ANN001
+    with pytest.raises(ValueError):
+        repository.spend_stats("seller")
+    with pytest.raises(ValueError):
+        repository.spend_stats("category", since_month="2026-01")
+
+
+def test_stats_month_option_parsing() -> None:
+    assert _parse_month("2026-03-15") == "2026-03"
+    assert _parse_month(None) is None
+    with pytest.raises(typer.BadParameter):
+        _parse_month("garbage")